@@ -1,18 +1,19 @@
 # coding: utf-8
 from pathlib import Path
-from scipy.stats import percentileofscore
 
 import os
 import pandas_gbq
 import numpy as np
-import seaborn as sns
 import matplotlib.pyplot as plt
 
+from roas_distribution.distribution import (DEFAULT_PERCENTILES, PLOT_PERCENTILES, ROAS_BENCHMARK,
+                                            WINSORISE_VALUE, GroupedDistribution, summarise_distribution)
+
 CURRENT_DIR = Path(os.getcwd())
 QUERIES_DIR = CURRENT_DIR / "queries"
 BQ_PROJECT_ID = "dhh-ncr-stg"
 MY_DATASET = "patrick_doupe"
-MONTH = '2025-07-01'
+MONTH = '2025-07-01'  # for a range of months: python -m roas_distribution.runner --start 2025-01 --end 2025-07
 
 if __name__=="__main__":
 
@@ -39,44 +40,39 @@ if __name__=="__main__":
                       destination_table=f'{MY_DATASET}.zero_revenue_cpc_roas_2025_july',
                       project_id=BQ_PROJECT_ID, if_exists='replace')
 
+    # One sort of the positive-revenue ROAS answers every question below
+    distribution = GroupedDistribution.from_values(df_pos_revenue.roas.values)
+
     # What's the quantile for ROAS of 3?
-    ROAS_BENCHMARK = 3.0
-    roas_data = df_pos_revenue.roas.values
-    three_quantile = percentileofscore(roas_data, 
-                                       ROAS_BENCHMARK,
-                                       kind='rank')
+    three_quantile = distribution.percentile_of_score(ROAS_BENCHMARK, kind='rank')[0]
     print(f"The quantile for a ROAS of 3 is {three_quantile:.2f}")
-    print(df_pos_revenue.roas.describe(
-        percentiles=[0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
-        )
-    )
-    winsorise_value = 100
-    
+    print(distribution.describe(percentiles=DEFAULT_PERCENTILES).drop(columns='group').iloc[0])
+    print(summarise_distribution(df_pos_revenue, group_columns=['management_entity']))
+    winsorise_value = WINSORISE_VALUE
+
     # getting distribution
-    sns.displot([min(x, winsorise_value) for x in roas_data], 
-                bins=100,
-                kind='hist')
-    
+    histogram = distribution.histogram(bins=100, winsorise=winsorise_value)
+    edges = np.append(histogram['bin_left'].to_numpy(), histogram['bin_right'].iloc[-1])
+    plt.figure(figsize=(5, 5))
+    plt.stairs(histogram['count'].to_numpy(), edges, fill=True)
+    plt.ylabel("Count")
+
     # Add title
     plt.title((f'Campaign level CPC ROAS. July 2025, all markets\n'
                f'Values capped at {winsorise_value}'),
-              fontsize=16, 
+              fontsize=16,
               fontweight='bold')
-    
+
     # Calculate quantiles
-    q10 = np.percentile(roas_data, 10)
-    q25 = np.percentile(roas_data, 25)
-    q50 = np.percentile(roas_data, 50)
-    q75 = np.percentile(roas_data, 75)
-    q90 = np.percentile(roas_data, 90)
-    
+    q10, q25, q50, q75, q90 = distribution.quantiles(PLOT_PERCENTILES)[0]
+
     # Add quantile information as text on the plot
     quantile_text = f'Quantiles:\n10%: {q10:.2f}\n25%: {q25:.2f}\n50%: {q50:.2f}\n75%: {q75:.2f}\n90%: {q90:.2f}'
-    plt.text(0.98, 0.5, 
-             quantile_text, 
+    plt.text(0.98, 0.5,
+             quantile_text,
              transform=plt.gca().transAxes,
              horizontalalignment='right',
-             verticalalignment='center_baseline', 
+             verticalalignment='center_baseline',
              bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
     plt.xlabel("Campaign level ROAS") 
     # Save the figure
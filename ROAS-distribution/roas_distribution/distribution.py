@@ -0,0 +1,264 @@
+# quantiles, percentile ranks and histograms of many groups from one sort
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+DEFAULT_PERCENTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+PLOT_PERCENTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+ROAS_BENCHMARK = 3.0
+WINSORISE_VALUE = 100
+
+TOTAL = 'All'
+
+_PERCENTILE_KINDS = ('rank', 'weak', 'strict', 'mean')
+
+
+def percentile_label(q: float) -> str:
+    """
+    Column label of a percentile, as `DataFrame.describe` writes it (0.1 -> '10%').
+    """
+    return f"{q * 100:g}%"
+
+
+@dataclass(frozen=True)
+class GroupedDistribution:
+    """
+    The values of every group, sorted once.
+
+    Values are ordered by (group, value), so each group is a contiguous
+    sorted slice starting at `offsets[g]`. Quantiles are then an index
+    lookup and percentile ranks a count below the score, for all groups at
+    once. NaN values are dropped.
+
+    Build it with `from_frame` (grouped, optionally with 'All' totals) or
+    `from_values` (one group).
+
+    Attributes:
+        values (np.ndarray): Values sorted by group, then value.
+        codes (np.ndarray): Group of each value (non-decreasing).
+        offsets (np.ndarray): (groups + 1,) start of each group's slice.
+        groups (DataFrame): One row per group with the group columns.
+    """
+    values: np.ndarray
+    codes: np.ndarray
+    offsets: np.ndarray
+    groups: DataFrame
+
+    @classmethod
+    def from_values(cls, values: Sequence[float]) -> "GroupedDistribution":
+        values = np.asarray(values, dtype=float)
+        values = np.sort(values[~np.isnan(values)])
+        return cls(values=values, codes=np.zeros(len(values), dtype=np.int64),
+                   offsets=np.array([0, len(values)]), groups=DataFrame({'group': [TOTAL]}))
+
+    @classmethod
+    def from_frame(cls,
+                   df: DataFrame,
+                   value_column: str = 'roas',
+                   group_columns: Sequence[str] = ('management_entity',),
+                   include_total: bool = True) -> "GroupedDistribution":
+        """
+        Groups `df` by `group_columns` and sorts all groups together. Rows
+        with a missing value or group key are dropped.
+
+        Args:
+            df (DataFrame): One row per campaign.
+            value_column (str, optional): Defaults to 'roas'.
+            group_columns (Sequence[str], optional): Defaults to ('management_entity',).
+            include_total (bool, optional): Also add the distribution over all
+                                            values of the last group column
+                                            (labelled 'All') within each
+                                            combination of the other ones, e.g.
+                                            all entities of a month. Defaults to True.
+        """
+        group_columns = list(group_columns)
+        if not group_columns:
+            return cls.from_values(df[value_column])
+
+        values = df[value_column].to_numpy(dtype=float)
+        combined, radices, level_values = _level_codes(df, group_columns)
+        keep = ~np.isnan(values) & (combined >= 0)
+        values, combined = values[keep], combined[keep]
+        value_order = np.argsort(values)
+        if include_total:
+            # the same values again, with the last column's level set to its 'All' slot
+            totals = combined - combined % radices[-1] + (radices[-1] - 1)
+            value_order = np.concatenate([value_order, value_order + len(values)])
+            combined = np.concatenate([combined, totals])
+            values = np.concatenate([values, values])
+
+        codes, uniques = pd.factorize(combined, sort=True)
+        groups = _decode_groups(uniques, radices, level_values, group_columns)
+        # one value sort shared by all groups, then a stable (radix) sort on the group codes
+        code_dtype = np.uint16 if len(uniques) <= np.iinfo(np.uint16).max else np.int64
+        order = value_order[np.argsort(codes[value_order].astype(code_dtype), kind='stable')]
+        values, codes = values[order], codes[order]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(groups)))])
+        return cls(values=values, codes=codes, offsets=offsets, groups=groups)
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def quantiles(self, qs: Sequence[float]) -> np.ndarray:
+        """
+        (groups, len(qs)) quantiles with linear interpolation, as
+        `np.percentile` / `Series.quantile`. Empty groups get NaN.
+        """
+        qs = np.asarray(qs, dtype=float)
+        counts = self.counts
+        result = np.full((len(counts), len(qs)), np.nan)
+        filled = counts > 0
+        if not filled.any():
+            return result
+
+        position = (counts[filled, None] - 1) * qs[None, :]
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, counts[filled, None] - 1)
+        starts = self.offsets[:-1][filled, None]
+        below, above = self.values[starts + lower], self.values[starts + upper]
+        result[filled] = below + (above - below) * (position - lower)
+        return result
+
+    def percentile_of_score(self, score: float, kind: str = 'rank') -> np.ndarray:
+        """
+        Percentile rank of `score` in each group, as `scipy.stats.percentileofscore`.
+
+        Raises:
+            ValueError: If `kind` is not 'rank', 'weak', 'strict' or 'mean'.
+        """
+        if kind not in _PERCENTILE_KINDS:
+            raise ValueError(f"kind must be one of {_PERCENTILE_KINDS}")
+        num_groups = len(self.counts)
+        left = np.bincount(self.codes, weights=self.values < score, minlength=num_groups)
+        right = np.bincount(self.codes, weights=self.values <= score, minlength=num_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            n = self.counts
+            if kind == 'rank':
+                return (left + right + (right > left)) * 50.0 / n
+            if kind == 'weak':
+                return right / n * 100
+            if kind == 'strict':
+                return left / n * 100
+            return (left + right) / n * 50.0
+
+    def describe(self, percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> DataFrame:
+        """
+        `Series.describe(percentiles=...)` of every group: 'count', 'mean',
+        'std', 'min', the percentiles (with the median), 'max'.
+        """
+        percentiles = sorted(set(percentiles) | {0.5})
+        n = self.counts
+        num_groups = len(n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(self.codes, weights=self.values, minlength=num_groups) / n
+            deviations = (self.values - mean[self.codes])**2
+            std = np.sqrt(np.bincount(self.codes, weights=deviations, minlength=num_groups) / (n - 1))
+        quantiles = self.quantiles([0.0] + percentiles + [1.0])
+
+        summary = self.groups.copy()
+        summary['count'] = n
+        summary['mean'] = mean
+        summary['std'] = std
+        summary['min'] = quantiles[:, 0]
+        for position, q in enumerate(percentiles, start=1):
+            summary[percentile_label(q)] = quantiles[:, position]
+        summary['max'] = quantiles[:, -1]
+        return summary
+
+    def histogram(self, bins: int = 100, winsorise: Optional[float] = WINSORISE_VALUE,
+                  value_range: Optional[Tuple[float, float]] = None) -> DataFrame:
+        """
+        Histograms of every group on shared bins, with values above
+        `winsorise` counted in the top bin (the capped values main.py plots).
+
+        Bin edges are those of `np.histogram(np.minimum(values, winsorise),
+        bins)` over all values, unless `value_range` is given.
+
+        Returns:
+            DataFrame: The group columns, 'bin_left', 'bin_right' and 'count',
+                       `bins` rows per group.
+        """
+        capped = self.values if winsorise is None else np.minimum(self.values, winsorise)
+        if value_range is None:
+            value_range = (capped.min(), capped.max()) if len(capped) else (0.0, 1.0)
+        edges = np.histogram_bin_edges(capped, bins=bins, range=value_range)
+
+        in_range = (capped >= edges[0]) & (capped <= edges[-1])
+        bin_index = np.clip(np.searchsorted(edges, capped[in_range], side='right') - 1, 0, bins - 1)
+        num_groups = len(self.counts)
+        counts = np.bincount(self.codes[in_range] * bins + bin_index, minlength=num_groups * bins)
+
+        histogram = self.groups.loc[np.repeat(self.groups.index.to_numpy(), bins)].reset_index(drop=True)
+        histogram['bin_left'] = np.tile(edges[:-1], num_groups)
+        histogram['bin_right'] = np.tile(edges[1:], num_groups)
+        histogram['count'] = counts
+        return histogram
+
+
+def _level_codes(df: DataFrame, group_columns: List[str]) -> Tuple[np.ndarray, List[int], List[list]]:
+    """
+      mixed-radix code per row over the sorted levels of each column, each radix with a spare
+      last slot for 'All'; rows with a missing key get -1
+    """
+    combined = np.zeros(len(df), dtype=np.int64)
+    missing = np.zeros(len(df), dtype=bool)
+    radices, level_values = [], []
+    for col in group_columns:
+        level_codes, uniques = pd.factorize(df[col], sort=True)
+        missing |= level_codes < 0
+        radices.append(len(uniques) + 1)
+        level_values.append(list(uniques) + [TOTAL])
+        combined = combined * radices[-1] + level_codes
+    combined[missing] = -1
+    return combined, radices, level_values
+
+
+def _decode_groups(uniques: np.ndarray, radices: List[int], level_values: List[list],
+                   group_columns: List[str]) -> DataFrame:
+    """
+      group columns of each combined code
+    """
+    groups = {}
+    remaining = np.asarray(uniques, dtype=np.int64)
+    for col, radix, values in reversed(list(zip(group_columns, radices, level_values))):
+        groups[col] = np.asarray(values, dtype=object)[remaining % radix]
+        remaining = remaining // radix
+    return DataFrame({col: groups[col] for col in group_columns})
+
+
+def summarise_distribution(
+    df: DataFrame,
+    value_column: str = 'roas',
+    group_columns: Sequence[str] = ('management_entity',),
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+    benchmark: float = ROAS_BENCHMARK,
+    include_total: bool = True
+) -> DataFrame:
+    """
+    `describe` plus the percentile rank of `benchmark` for every group of
+    `df`, from one grouped sort.
+
+    Args:
+        df (DataFrame): One row per campaign.
+        value_column (str, optional): Defaults to 'roas'.
+        group_columns (Sequence[str], optional): E.g. ['date_month', 'management_entity'].
+                                                 Defaults to ('management_entity',).
+        percentiles (Sequence[float], optional): Defaults to DEFAULT_PERCENTILES.
+        benchmark (float, optional): Score to rank. Defaults to ROAS_BENCHMARK.
+        include_total (bool, optional): Add 'All' rows over the last group column.
+                                        Defaults to True.
+
+    Returns:
+        DataFrame: One row per group, with the group columns, the `describe`
+                   statistics and 'percentile_of_benchmark' (kind='rank').
+    """
+    distribution = GroupedDistribution.from_frame(df, value_column, group_columns, include_total)
+    summary = distribution.describe(percentiles)
+    summary['percentile_of_benchmark'] = distribution.percentile_of_score(benchmark, kind='rank')
+    return summary
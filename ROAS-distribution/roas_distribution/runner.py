@@ -0,0 +1,305 @@
+# incremental multi-month runs of the ROAS distribution job, with a local partitioned store
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import pandas as pd
+from pandas import DataFrame
+
+from .distribution import DEFAULT_PERCENTILES, ROAS_BENCHMARK, WINSORISE_VALUE, GroupedDistribution
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+QUERIES_DIR = PACKAGE_DIR.parent / "queries"
+BQ_PROJECT_ID = "dhh-ncr-stg"
+MY_DATASET = "patrick_doupe"
+
+# Bump when the outputs of `summarise_month` change, so stored months are recomputed
+JOB_VERSION = 1
+
+# Output name -> BigQuery table written by --upload
+OUTPUT_TABLES = {
+    'positive_revenue': 'positive_revenue_cpc_roas',
+    'zero_revenue_campaigns': 'zero_revenue_cpc_roas',
+    'roas_summary': 'cpc_roas_summary',
+    'roas_histogram': 'cpc_roas_histogram',
+}
+
+MonthFetcher = Callable[[str], DataFrame]
+
+
+def month_range(start: str, end: str) -> List[str]:
+    """
+    First days ('YYYY-MM-01') of the months from `start` to `end`, inclusive.
+    Accepts 'YYYY-MM' or any date within the month.
+    """
+    return [str(period.start_time.date()) for period in pd.period_range(start, end, freq='M')]
+
+
+def bigquery_month_fetcher(query_template: str, project_id: str = BQ_PROJECT_ID,
+                           reader: Optional[Callable[..., DataFrame]] = None) -> MonthFetcher:
+    """
+    Fetches a month by formatting `query_template` with ANALYSIS_MONTH and
+    calling `reader(sql_query, project_id=project_id)`, by default
+    `pandas_gbq.read_gbq`.
+    """
+    if reader is None:
+        import pandas_gbq
+        reader = pandas_gbq.read_gbq
+
+    def fetch(month: str) -> DataFrame:
+        return reader(query_template.format(ANALYSIS_MONTH=month), project_id=project_id)
+
+    return fetch
+
+
+def local_month_fetcher(path: Union[str, Path], month_column: str = 'date_month') -> MonthFetcher:
+    """
+    A local stand-in for the query: campaign rows of all months in a Parquet
+    or CSV file (or a directory of Parquet files), filtered to one month.
+    """
+    path = Path(path)
+    if path.suffix == '.csv':
+        raw = pd.read_csv(path)
+    else:
+        raw = pd.read_parquet(path)
+    months = pd.to_datetime(raw[month_column]).dt.to_period('M')
+
+    def fetch(month: str) -> DataFrame:
+        return raw[(months == pd.Period(month, freq='M')).to_numpy()].reset_index(drop=True)
+
+    return fetch
+
+
+def summarise_month(df: DataFrame, month: str) -> Dict[str, DataFrame]:
+    """
+    The outputs of main.py for one month of campaign rows, each with an
+    'analysis_month' column.
+
+    Returns:
+        Dict[str, DataFrame]: 'positive_revenue' (the campaigns with revenue),
+                              'zero_revenue_campaigns' (distinct campaigns
+                              without revenue per management_entity),
+                              'roas_summary' (`summarise_distribution` per
+                              management_entity and 'All') and
+                              'roas_histogram' (capped at WINSORISE_VALUE).
+
+    Raises:
+        ValueError: If ROAS is NaN for a campaign with positive revenue.
+    """
+    # ROAS is NaN for no revenue
+    zero_revenue = df[df['gmv_eur_direct'] == 0.0]
+    positive_revenue = df[df['gmv_eur_direct'] > 0].reset_index(drop=True)
+    if positive_revenue['roas'].isna().any():
+        raise ValueError(f"NaNs in Roas column where gmv is positive ({month})")
+
+    zero_revenue_campaigns = (
+        zero_revenue
+        .groupby('management_entity')['campaign_id']
+        .nunique()
+        .reset_index()
+        .rename(columns={'campaign_id': 'number_zero_cpc_revenue_campaigns'})
+    )
+    distribution = GroupedDistribution.from_frame(positive_revenue, 'roas', ['management_entity'])
+    roas_summary = distribution.describe(DEFAULT_PERCENTILES)
+    roas_summary['percentile_of_benchmark'] = distribution.percentile_of_score(ROAS_BENCHMARK)
+    # shared bins across months, so histograms can be stacked
+    roas_histogram = distribution.histogram(bins=100, winsorise=WINSORISE_VALUE, value_range=(0, WINSORISE_VALUE))
+
+    outputs = {
+        'positive_revenue': positive_revenue,
+        'zero_revenue_campaigns': zero_revenue_campaigns,
+        'roas_summary': roas_summary,
+        'roas_histogram': roas_histogram,
+    }
+    return {name: output.assign(analysis_month=month) for name, output in outputs.items()}
+
+
+def job_fingerprint(query_template: str) -> str:
+    """
+    Identifies what a stored month was computed with: the query, JOB_VERSION
+    and the summary settings. Months stored under another fingerprint are recomputed.
+    """
+    settings = json.dumps({
+        'job_version': JOB_VERSION,
+        'percentiles': DEFAULT_PERCENTILES,
+        'benchmark': ROAS_BENCHMARK,
+        'winsorise': WINSORISE_VALUE,
+    }, sort_keys=True)
+    return hashlib.sha256(f"{settings}\n{query_template}".encode('utf-8')).hexdigest()
+
+
+@dataclass(frozen=True)
+class MonthStore:
+    """
+    Computed months on local disk, one directory per month
+    (`analysis_month=YYYY-MM-01/`) with a Parquet file per output.
+
+    A month counts as stored once its `_SUCCESS` marker is written, last,
+    with the fingerprint of the job that computed it. Outputs are written to
+    temporary files and renamed, so an interrupted run leaves no marker and
+    the month is recomputed on the next run.
+
+    Args:
+        root (Union[str, Path]): Store directory. Created if it does not exist.
+    """
+    root: Union[str, Path]
+
+    def __post_init__(self):
+        root = Path(self.root).expanduser().resolve()
+        root.mkdir(parents=True, exist_ok=True)
+        object.__setattr__(self, 'root', root)
+
+    def partition(self, month: str) -> Path:
+        return self.root / f"analysis_month={month}"
+
+    def marker(self, month: str) -> Optional[Dict]:
+        """
+        The `_SUCCESS` marker of a month, or None if it is not (fully) stored.
+        """
+        try:
+            return json.loads((self.partition(month) / "_SUCCESS").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def is_current(self, month: str, fingerprint: str) -> bool:
+        """
+        Whether `month` is stored under `fingerprint` and was computed after
+        the month ended (earlier runs only saw part of its campaigns).
+        """
+        marker = self.marker(month)
+        if marker is None or marker.get('fingerprint') != fingerprint:
+            return False
+        month_end = (pd.Period(month, freq='M') + 1).start_time.tz_localize('UTC')
+        return marker.get('written_at', 0) >= month_end.timestamp()
+
+    def months(self) -> List[str]:
+        """
+        Fully stored months, sorted.
+        """
+        months = [path.name.split('=', 1)[1] for path in self.root.glob("analysis_month=*")]
+        return sorted(month for month in months if self.marker(month) is not None)
+
+    def write(self, month: str, outputs: Dict[str, DataFrame], fingerprint: str) -> Path:
+        partition = self.partition(month)
+        partition.mkdir(parents=True, exist_ok=True)
+        (partition / "_SUCCESS").unlink(missing_ok=True)
+        for name, df in outputs.items():
+            path = partition / f"{name}.parquet"
+            tmp_path = path.with_suffix(f".{os.getpid()}.{time.monotonic_ns()}.tmp")
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        marker = {'fingerprint': fingerprint, 'outputs': sorted(outputs), 'written_at': time.time()}
+        (partition / "_SUCCESS").write_text(json.dumps(marker))
+        return partition
+
+    def read(self, name: str, months: Optional[Sequence[str]] = None) -> DataFrame:
+        """
+        One output for the given (default: all stored) months, concatenated in month order.
+        """
+        months = self.months() if months is None else sorted(months)
+        frames = [pd.read_parquet(self.partition(month) / f"{name}.parquet") for month in months]
+        if not frames:
+            return DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+def run_months(
+    months: Sequence[str],
+    fetch_month: MonthFetcher,
+    store: MonthStore,
+    fingerprint: str,
+    refresh: Sequence[str] = (),
+    max_workers: int = 4
+) -> List[str]:
+    """
+    Fetches, summarises and stores the months that are missing from `store`,
+    were stored under another fingerprint or before they ended, or are
+    listed in `refresh`.
+
+    Months are mostly waiting on the query, so up to `max_workers` of them
+    run at once on a thread pool. Progress is reported in month order.
+
+    Returns:
+        List[str]: The months that were (re)computed.
+    """
+    refresh = set(month_range(month, month)[0] for month in refresh)
+    pending = [month for month in months if month in refresh or not store.is_current(month, fingerprint)]
+    for month in months:
+        if month not in pending:
+            print(f"Month {month}: up to date, skipped.")
+
+    def process(month: str) -> Path:
+        return store.write(month, summarise_month(fetch_month(month), month), fingerprint)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(process, month) for month in pending]
+        for month, future in zip(pending, futures):
+            print(f"Processing month: {month}...")
+            future.result()
+            print(f"Month {month}: stored.")
+    return pending
+
+
+def upload_outputs(store: MonthStore, months: Optional[Sequence[str]] = None, dataset: str = MY_DATASET,
+                   project_id: str = BQ_PROJECT_ID, writer: Optional[Callable[..., None]] = None) -> None:
+    """
+    Replaces the BigQuery output tables with the stored `months` (default:
+    every month in the store, so an incremental run keeps the history), via
+    `writer(df, destination_table=..., project_id=..., if_exists='replace')`
+    (default `pandas_gbq.to_gbq`).
+    """
+    if writer is None:
+        import pandas_gbq
+        writer = pandas_gbq.to_gbq
+    for name, table in OUTPUT_TABLES.items():
+        writer(store.read(name, months), destination_table=f'{dataset}.{table}',
+               project_id=project_id, if_exists='replace')
+
+
+def main(argv: Optional[Sequence[str]] = None, fetch_month: Optional[MonthFetcher] = None,
+         writer: Optional[Callable[..., None]] = None) -> List[str]:
+    """
+    Command line entry point; see `--help`. Returns the recomputed months.
+    `writer` is passed to `upload_outputs`.
+    """
+    parser = argparse.ArgumentParser(description="Compute campaign ROAS distributions for a range of months.")
+    parser.add_argument('--start', required=True, help="First analysis month, e.g. 2025-01.")
+    parser.add_argument('--end', help="Last analysis month (default: --start).")
+    parser.add_argument('--store', default=str(Path.cwd() / "data"), help="Local store directory.")
+    parser.add_argument('--source', default='bigquery',
+                        help="'bigquery', or a Parquet/CSV file of campaign rows to use instead.")
+    parser.add_argument('--project-id', default=BQ_PROJECT_ID)
+    parser.add_argument('--jobs', type=int, default=4, help="Months processed at once.")
+    parser.add_argument('--refresh', nargs='*', default=[], help="Months to recompute even if stored.")
+    parser.add_argument('--upload', action='store_true', help="Replace the BigQuery output tables with every stored month.")
+    args = parser.parse_args(argv)
+
+    with open(QUERIES_DIR / "data_collection.sql", 'r') as f:
+        query_template = f.read()
+    if fetch_month is None:
+        if args.source == 'bigquery':
+            fetch_month = bigquery_month_fetcher(query_template, args.project_id)
+        else:
+            fetch_month = local_month_fetcher(args.source)
+
+    months = month_range(args.start, args.end or args.start)
+    store = MonthStore(args.store)
+    computed = run_months(months, fetch_month, store, job_fingerprint(query_template),
+                          refresh=args.refresh, max_workers=args.jobs)
+    print(f"Computed {len(computed)} of {len(months)} months; store at {store.root}")
+
+    if args.upload:
+        # Upload the whole store, not just this run's range, so earlier months are kept
+        upload_outputs(store, project_id=args.project_id, writer=writer)
+    return computed
+
+
+if __name__ == "__main__":
+    main()
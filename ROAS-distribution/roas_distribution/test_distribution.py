@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import percentileofscore
+
+from .distribution import (DEFAULT_PERCENTILES, TOTAL, GroupedDistribution, percentile_label,
+                           summarise_distribution)
+
+
+@pytest.fixture
+def campaigns():
+    rng = np.random.default_rng(0)
+    n = 3000
+    roas = np.round(rng.lognormal(1.0, 1.2, size=n), 2)
+    return pd.DataFrame({
+        'date_month': rng.choice(pd.to_datetime(['2025-06-01', '2025-07-01']), size=n),
+        'management_entity': rng.choice(['FP_TH', 'PY_AR', 'TB_KW', 'HS_SA'], size=n, p=[0.5, 0.3, 0.19, 0.01]),
+        'roas': roas
+    })
+
+
+def test_single_group_matches_main_script(campaigns):
+    roas_data = campaigns['roas'].to_numpy()
+    distribution = GroupedDistribution.from_values(roas_data)
+
+    for kind in ['rank', 'weak', 'strict', 'mean']:
+        for score in [3.0, roas_data[5], -1.0, 1e6]:
+            assert distribution.percentile_of_score(score, kind)[0] == pytest.approx(
+                percentileofscore(roas_data, score, kind=kind))
+
+    qs = [0.1, 0.25, 0.5, 0.75, 0.9]
+    np.testing.assert_allclose(distribution.quantiles(qs)[0], np.percentile(roas_data, [q * 100 for q in qs]))
+
+    expected = campaigns['roas'].describe(percentiles=DEFAULT_PERCENTILES)
+    described = distribution.describe().drop(columns='group').iloc[0]
+    assert list(described.index) == list(expected.index)
+    np.testing.assert_allclose(described.to_numpy(dtype=float), expected.to_numpy())
+
+    counts, edges = np.histogram([min(x, 100) for x in roas_data], bins=100)
+    histogram = distribution.histogram(bins=100, winsorise=100)
+    np.testing.assert_array_equal(histogram['count'], counts)
+    np.testing.assert_allclose(histogram['bin_left'], edges[:-1])
+
+
+def test_grouped_summary_matches_groupby(campaigns):
+    group_columns = ['date_month', 'management_entity']
+    summary = summarise_distribution(campaigns, group_columns=group_columns)
+
+    totals = summary[summary['management_entity'] == TOTAL]
+    assert len(totals) == 2
+    assert len(summary) == 2 * 4 + 2
+
+    for (month, entity), group in campaigns.groupby(group_columns):
+        row = summary[(summary['date_month'] == month) & (summary['management_entity'] == entity)].iloc[0]
+        expected = group['roas'].describe(percentiles=DEFAULT_PERCENTILES)
+        for label in expected.index:
+            assert row[label] == pytest.approx(expected[label]), (month, entity, label)
+        assert row['percentile_of_benchmark'] == pytest.approx(percentileofscore(group['roas'], 3.0))
+
+    for month, group in campaigns.groupby('date_month'):
+        row = totals[totals['date_month'] == month].iloc[0]
+        assert row['count'] == len(group)
+        assert row[percentile_label(0.99)] == pytest.approx(group['roas'].quantile(0.99))
+
+
+def test_grouped_histograms_share_bins(campaigns):
+    distribution = GroupedDistribution.from_frame(campaigns, include_total=True)
+    histogram = distribution.histogram(bins=20, winsorise=50)
+
+    assert len(histogram) == 20 * 5
+    edges = np.histogram_bin_edges(np.minimum(campaigns['roas'], 50), bins=20)
+    for entity, group in campaigns.groupby('management_entity'):
+        counts, _ = np.histogram(np.minimum(group['roas'], 50), bins=edges)
+        np.testing.assert_array_equal(histogram.loc[histogram['management_entity'] == entity, 'count'], counts)
+    assert histogram.loc[histogram['management_entity'] == TOTAL, 'count'].sum() == len(campaigns)
+
+
+def test_nan_values_and_keys_are_dropped(campaigns):
+    campaigns.loc[:9, 'roas'] = np.nan
+    campaigns.loc[10:19, 'management_entity'] = None
+    summary = summarise_distribution(campaigns, include_total=False)
+
+    assert set(summary['management_entity']) == {'FP_TH', 'PY_AR', 'TB_KW', 'HS_SA'}
+    assert summary['count'].sum() == campaigns['roas'].notna().sum() - campaigns.loc[10:19, 'roas'].notna().sum()
+
+
+def test_invalid_kind():
+    with pytest.raises(ValueError):
+        GroupedDistribution.from_values([1.0, 2.0]).percentile_of_score(1.0, kind='median')
@@ -0,0 +1,147 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from .runner import (MonthStore, bigquery_month_fetcher, job_fingerprint, local_month_fetcher, main,
+                     month_range, run_months, summarise_month, upload_outputs)
+
+
+def campaign_rows(month, n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    gmv = np.where(rng.random(n) < 0.2, 0.0, np.round(rng.lognormal(3, 1, n), 1))
+    cpc_revenue = rng.lognormal(1.5, 1, n)
+    return pd.DataFrame({
+        'date_month': pd.Timestamp(month),
+        'management_entity': rng.choice(['FP_TH', 'PY_AR', 'TB_KW'], size=n),
+        'campaign_id': rng.integers(0, n // 2, size=n),
+        'gmv_eur_direct': gmv,
+        'roas': np.where(gmv > 0, gmv / cpc_revenue, np.nan),
+    })
+
+
+class CountingFetcher:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, month):
+        self.calls.append(month)
+        return campaign_rows(month, seed=int(month[5:7]))
+
+
+def test_month_range():
+    assert month_range('2024-11', '2025-02-15') == ['2024-11-01', '2024-12-01', '2025-01-01', '2025-02-01']
+
+
+def test_summarise_month_matches_main_script():
+    df = campaign_rows('2025-07-01')
+    outputs = summarise_month(df, '2025-07-01')
+
+    expected_zero = df[df.gmv_eur_direct == 0.0].groupby("management_entity")['campaign_id'].agg(lambda x: len(set(x)))
+    zero = outputs['zero_revenue_campaigns'].set_index('management_entity')['number_zero_cpc_revenue_campaigns']
+    pd.testing.assert_series_equal(zero, expected_zero, check_names=False)
+
+    summary = outputs['roas_summary'].set_index('management_entity')
+    positive = df[df.gmv_eur_direct > 0]
+    assert summary.loc['All', 'count'] == len(positive)
+    assert summary.loc['FP_TH', '50%'] == pytest.approx(positive.loc[positive.management_entity == 'FP_TH', 'roas'].median())
+    assert (outputs['positive_revenue']['analysis_month'] == '2025-07-01').all()
+
+    with pytest.raises(ValueError):
+        summarise_month(df.assign(roas=np.nan), '2025-07-01')
+
+
+def test_runs_only_new_or_invalidated_months(tmp_path):
+    store = MonthStore(tmp_path / "store")
+    fetch = CountingFetcher()
+    months = month_range('2025-01', '2025-03')
+
+    assert run_months(months, fetch, store, 'v1', max_workers=3) == months
+    assert sorted(fetch.calls) == months
+
+    fetch.calls.clear()
+    assert run_months(month_range('2025-01', '2025-04'), fetch, store, 'v1') == ['2025-04-01']
+    assert run_months(months, fetch, store, 'v1', refresh=['2025-02']) == ['2025-02-01']
+    assert fetch.calls == ['2025-04-01', '2025-02-01']
+
+    # another job definition recomputes everything
+    assert run_months(months, fetch, store, 'v2') == months
+
+
+def test_interrupted_and_partial_months_are_recomputed(tmp_path):
+    store = MonthStore(tmp_path)
+    fetch = CountingFetcher()
+    run_months(['2025-01-01', '2025-02-01'], fetch, store, 'v1')
+
+    # interrupted write: outputs without a marker
+    (store.partition('2025-01-01') / "_SUCCESS").unlink()
+    # stored while the month was still running
+    marker_path = store.partition('2025-02-01') / "_SUCCESS"
+    marker = json.loads(marker_path.read_text())
+    marker['written_at'] = pd.Timestamp('2025-02-20', tz='UTC').timestamp()
+    marker_path.write_text(json.dumps(marker))
+
+    assert store.months() == ['2025-02-01']
+    assert run_months(['2025-01-01', '2025-02-01'], fetch, store, 'v1') == ['2025-01-01', '2025-02-01']
+
+
+def test_store_reads_months_in_order(tmp_path):
+    store = MonthStore(tmp_path)
+    run_months(month_range('2025-01', '2025-03'), CountingFetcher(), store, 'v1')
+
+    summary = store.read('roas_summary')
+    assert list(pd.unique(summary['analysis_month'])) == ['2025-01-01', '2025-02-01', '2025-03-01']
+    assert len(store.read('roas_histogram', ['2025-02-01'])) == 100 * 4
+
+
+def test_bigquery_fetcher_uses_injected_reader():
+    queries = []
+
+    def reader(sql_query, project_id):
+        queries.append((sql_query, project_id))
+        return campaign_rows('2025-05-01')
+
+    fetch = bigquery_month_fetcher("SELECT * WHERE date_month = '{ANALYSIS_MONTH}'", 'my-project', reader=reader)
+    assert len(fetch('2025-05-01')) == 400
+    assert queries == [("SELECT * WHERE date_month = '2025-05-01'", 'my-project')]
+
+
+def test_cli_with_local_source(tmp_path, capsys):
+    raw = pd.concat([campaign_rows(month, seed=i) for i, month in enumerate(month_range('2025-01', '2025-03'))])
+    raw.to_parquet(tmp_path / "raw.parquet")
+    fetch = local_month_fetcher(tmp_path / "raw.parquet")
+    assert len(fetch('2025-02-01')) == 400
+
+    args = ['--start', '2025-01', '--end', '2025-03', '--store', str(tmp_path / "store"),
+            '--source', str(tmp_path / "raw.parquet"), '--jobs', '2']
+    assert main(args) == month_range('2025-01', '2025-03')
+    assert main(args) == []
+    assert "up to date" in capsys.readouterr().out
+
+    uploads = {}
+    upload_outputs(MonthStore(tmp_path / "store"), month_range('2025-01', '2025-03'),
+                   writer=lambda df, destination_table, project_id, if_exists: uploads.update({destination_table: df}))
+    assert len(uploads['patrick_doupe.positive_revenue_cpc_roas']) == (raw['gmv_eur_direct'] > 0).sum()
+
+
+def test_incremental_upload_keeps_earlier_months(tmp_path):
+    raw = pd.concat([campaign_rows(month, seed=i) for i, month in enumerate(month_range('2025-01', '2025-03'))])
+    raw.to_parquet(tmp_path / "raw.parquet")
+    common = ['--store', str(tmp_path / "store"), '--source', str(tmp_path / "raw.parquet")]
+    main(['--start', '2025-01', '--end', '2025-02'] + common)
+
+    uploads = {}
+    computed = main(['--start', '2025-03', '--upload'] + common,
+                    writer=lambda df, destination_table, project_id, if_exists: uploads.update({destination_table: df}))
+
+    assert computed == ['2025-03-01']
+    assert sorted(uploads) == ['patrick_doupe.cpc_roas_histogram', 'patrick_doupe.cpc_roas_summary',
+                               'patrick_doupe.positive_revenue_cpc_roas', 'patrick_doupe.zero_revenue_cpc_roas']
+    assert len(uploads['patrick_doupe.positive_revenue_cpc_roas']) == (raw['gmv_eur_direct'] > 0).sum()
+    pd.testing.assert_frame_equal(uploads['patrick_doupe.cpc_roas_summary'],
+                                  MonthStore(tmp_path / "store").read('roas_summary'))
+
+
+def test_fingerprint_depends_on_query():
+    assert job_fingerprint("SELECT 1") != job_fingerprint("SELECT 2")
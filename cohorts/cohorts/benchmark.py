@@ -0,0 +1,340 @@
+# timing and memory benchmarks of the cohort statistics on synthetic vendor bases
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from .cohort_statistics import (compare_outlier_methods, get_f_stat_components,
+                                process_dataframes, process_dataframes_for_outliers)
+from .group_index import CohortGroupIndex
+
+DISTRIBUTIONS = ('right_skewed', 'gaussian', 'zero_inflated')
+
+# Vendor and cohort counts per scale; combinations with more cohorts than vendors are skipped
+SCALES = {
+    'quick': {'vendors': (10**4, 10**5), 'cohorts': (10, 10**3)},
+    'default': {'vendors': (10**4, 10**5, 10**6), 'cohorts': (10, 10**3, 10**5)},
+    'full': {'vendors': (10**4, 10**5, 10**6, 10**7), 'cohorts': (10, 10**2, 10**3, 10**4, 10**5)},
+}
+
+NUM_ENTITIES = 10
+NUM_RULE_TABLES = 3
+UNMATCHED_SHARE = 0.05  # vendors of a rule table missing from the vendor base
+
+# Relative change in time below which a case counts as unchanged
+DEFAULT_THRESHOLD = 0.1
+
+RESULT_KEYS = ['function', 'distribution', 'n_vendors', 'n_cohorts']
+
+
+def generate_kpi(distribution: str, n_samples: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    KPI values with one of the shapes of `perc_gap_investigation.ipynb`:
+
+    - 'right_skewed': exponential (scale 2) plus N(0, 0.1) noise, like most of our KPIs.
+    - 'gaussian': N(5, 2), as a benchmark.
+    - 'zero_inflated': 40% exactly zero, 10% exactly one and the rest
+      0.9 * N(0, 0.15) + 0.05, like retention rate. Shuffled.
+
+    Raises:
+        ValueError: If `distribution` is not one of DISTRIBUTIONS.
+    """
+    if distribution == 'right_skewed':
+        return rng.exponential(scale=2, size=n_samples) + rng.normal(0, 0.1, n_samples)
+    if distribution == 'gaussian':
+        return rng.normal(loc=5, scale=2, size=n_samples)
+    if distribution == 'zero_inflated':
+        n_zeros = int(0.4 * n_samples)
+        n_ones = int(0.1 * n_samples)
+        open_values = rng.normal(0.0, 0.15, n_samples - n_zeros - n_ones) * 0.9 + 0.05
+        return rng.permutation(np.concatenate([np.zeros(n_zeros), np.ones(n_ones), open_values]))
+    raise ValueError(f"Unknown distribution '{distribution}'. Expected one of {DISTRIBUTIONS}.")
+
+
+def _key_column(prefix: str, codes: np.ndarray, num_values: int) -> pd.Categorical:
+    """
+      categorical of '<prefix><code>' labels, as FrameSchema loads key columns
+    """
+    categories = pd.Index([f"{prefix}{i}" for i in range(num_values)])
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def _assign_cohorts(n_vendors: int, n_cohorts: int, rng: np.random.Generator) -> np.ndarray:
+    """
+      cohort code per vendor, with Pareto-distributed cohort sizes (many small cohorts, a few large)
+    """
+    weights = rng.pareto(1.5, n_cohorts) + 1
+    return rng.choice(n_cohorts, size=n_vendors, p=weights / weights.sum())
+
+
+def synthetic_kpi_table(n_vendors: int, n_cohorts: int, distribution: str = 'right_skewed',
+                        value_column: str = 'gmv', seed=None) -> DataFrame:
+    """
+    A processed rule table: one row per vendor with 'entity_id',
+    'vendor_code', 'cohort_id' (categoricals) and `value_column` drawn with
+    `generate_kpi`.
+    """
+    rng = np.random.default_rng(seed)
+    vendors = np.arange(n_vendors)
+    return DataFrame({
+        'entity_id': _key_column('e', vendors % NUM_ENTITIES, NUM_ENTITIES),
+        'vendor_code': _key_column('v', vendors, n_vendors),
+        'cohort_id': _key_column('c', _assign_cohorts(n_vendors, n_cohorts, rng), n_cohorts),
+        value_column: generate_kpi(distribution, n_vendors, rng),
+    })
+
+
+def synthetic_rule_tables(n_vendors: int, n_cohorts: int, distribution: str = 'right_skewed',
+                          n_tables: int = NUM_RULE_TABLES, value_column: str = 'gmv',
+                          seed=None) -> Tuple[DataFrame, Dict[str, DataFrame]]:
+    """
+    Inputs of `process_dataframes`: the vendor base ('global_entity_id',
+    'vendor_id') and `n_tables` rule tables ('global_entity_id',
+    'vendor_id', 'cohort_id', `value_column`). Each table has its own cohort
+    assignment and values, and UNMATCHED_SHARE of its vendors are not in the
+    vendor base.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    num_unmatched = int(UNMATCHED_SHARE * n_vendors)
+    vendors = np.arange(n_vendors + num_unmatched)
+    entity_ids = _key_column('e', vendors % NUM_ENTITIES, NUM_ENTITIES)
+    vendor_ids = _key_column('v', vendors, len(vendors))
+    vendor_base = DataFrame({'global_entity_id': entity_ids[:n_vendors], 'vendor_id': vendor_ids[:n_vendors]})
+
+    tables = {}
+    for i, table_seed in enumerate(seed.spawn(n_tables)):
+        rng = np.random.default_rng(table_seed)
+        # every table drops a different set of known vendors and adds the unknown ones
+        rows = np.sort(np.concatenate([
+            rng.choice(n_vendors, size=n_vendors - num_unmatched, replace=False),
+            np.arange(n_vendors, len(vendors)),
+        ]))
+        tables[f'rule_{i}'] = DataFrame({
+            'global_entity_id': entity_ids[rows],
+            'vendor_id': vendor_ids[rows],
+            'cohort_id': _key_column('c', _assign_cohorts(len(rows), n_cohorts, rng), n_cohorts),
+            value_column: generate_kpi(distribution, len(rows), rng),
+        })
+    return vendor_base, tables
+
+
+# Benchmarked call per case name, given (kpi table, vendor base, rule tables)
+Benchmark = Callable[[DataFrame, DataFrame, Dict[str, DataFrame]], object]
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    'compare_outlier_methods': lambda kpis, vendors, rules: compare_outlier_methods(kpis, 'gmv', 'cohort_id'),
+    'get_f_stat_components': lambda kpis, vendors, rules: get_f_stat_components(kpis, 'gmv', 'cohort_id'),
+    'get_f_stat_components_moments': lambda kpis, vendors, rules: get_f_stat_components(
+        kpis, 'gmv', 'cohort_id', method='moments'),
+    'cohort_group_index': lambda kpis, vendors, rules: CohortGroupIndex.from_frame(kpis, 'cohort_id'),
+    'process_dataframes': lambda kpis, vendors, rules: process_dataframes(vendors, rules),
+    'process_dataframes_for_outliers': lambda kpis, vendors, rules: process_dataframes_for_outliers(
+        {'kpis': kpis}, 'gmv', 'cohort_id'),
+}
+
+
+def measure(func: Callable[[], object], repeat: int = 3, track_memory: bool = True) -> Dict[str, float]:
+    """
+    Wall-clock times of `repeat` calls of `func`, and the peak memory
+    allocated during one more call (traced separately, as tracing slows
+    the call down). Printed output of `func` is discarded.
+
+    Returns:
+        Dict[str, float]: 'min_seconds', 'median_seconds' and
+                          'peak_memory_mb' (NaN without `track_memory`).
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(max(1, repeat)):
+            gc.collect()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+
+        peak = np.nan
+        if track_memory:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                func()
+                peak = tracemalloc.get_traced_memory()[1] / 2**20
+            finally:
+                tracemalloc.stop()
+    return {'min_seconds': min(times), 'median_seconds': float(np.median(times)), 'peak_memory_mb': peak}
+
+
+def scale_grid(scale: str = 'quick', vendors: Optional[Sequence[int]] = None,
+               cohorts: Optional[Sequence[int]] = None) -> List[Tuple[int, int]]:
+    """
+    (n_vendors, n_cohorts) pairs of a scale in SCALES, or of the given
+    counts, skipping pairs with more cohorts than vendors.
+    """
+    vendors = SCALES[scale]['vendors'] if vendors is None else vendors
+    cohorts = SCALES[scale]['cohorts'] if cohorts is None else cohorts
+    return [(n_vendors, n_cohorts) for n_vendors in vendors for n_cohorts in cohorts
+            if n_cohorts <= n_vendors]
+
+
+def run_benchmarks(
+    grid: Iterable[Tuple[int, int]],
+    distributions: Sequence[str] = DISTRIBUTIONS,
+    functions: Optional[Sequence[str]] = None,
+    repeat: int = 3,
+    track_memory: bool = True,
+    seed: int = 0
+) -> List[Dict]:
+    """
+    Times every function in `functions` (default: all of BENCHMARKS) on
+    synthetic data for every (n_vendors, n_cohorts) in `grid` and every
+    distribution. Data generation is not timed, and the same seed gives
+    the same data on every run.
+
+    Returns:
+        List[Dict]: One record per case with RESULT_KEYS and the fields of `measure`.
+
+    Raises:
+        ValueError: If a function is not in BENCHMARKS.
+    """
+    functions = list(BENCHMARKS) if functions is None else list(functions)
+    unknown = [name for name in functions if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {unknown}. Expected some of {list(BENCHMARKS)}.")
+
+    records = []
+    for n_vendors, n_cohorts in grid:
+        for distribution in distributions:
+            kpi_seed, rules_seed = np.random.SeedSequence([seed, n_vendors, n_cohorts]).spawn(2)
+            kpis = synthetic_kpi_table(n_vendors, n_cohorts, distribution, seed=kpi_seed)
+            vendor_base, rules = synthetic_rule_tables(n_vendors, n_cohorts, distribution, seed=rules_seed)
+            for name in functions:
+                print(f"{name}: {distribution}, {n_vendors} vendors, {n_cohorts} cohorts...")
+                timing = measure(lambda: BENCHMARKS[name](kpis, vendor_base, rules), repeat, track_memory)
+                records.append({'function': name, 'distribution': distribution,
+                                'n_vendors': n_vendors, 'n_cohorts': n_cohorts,
+                                'repeat': repeat, **timing})
+            del kpis, vendor_base, rules
+    return records
+
+
+def environment_metadata() -> Dict[str, object]:
+    """
+    What the results were measured on, stored alongside them.
+    """
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_results(records: List[Dict], path: str) -> None:
+    """
+    Writes the records and `environment_metadata` as JSON, with untracked memory as null.
+    """
+    records = [{key: None if isinstance(value, float) and np.isnan(value) else value
+                for key, value in record.items()} for record in records]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'metadata': environment_metadata(), 'results': records}, f, indent=2)
+
+
+def read_results(path: str) -> DataFrame:
+    with open(path, 'r') as f:
+        return DataFrame(json.load(f)['results']).astype({'peak_memory_mb': float})
+
+
+def compare_results(baseline: DataFrame, current: DataFrame,
+                    threshold: float = DEFAULT_THRESHOLD) -> DataFrame:
+    """
+    Matches the cases of two runs and reports the change in median time and
+    peak memory. Cases only in one run are left out.
+
+    Returns:
+        DataFrame: RESULT_KEYS, 'baseline_seconds', 'seconds', 'speedup'
+                   (baseline / current time), 'baseline_memory_mb',
+                   'memory_mb', 'memory_ratio' (current / baseline) and
+                   'status': 'slower' or 'faster' when the time changed by
+                   more than `threshold`, otherwise 'unchanged'.
+    """
+    columns = RESULT_KEYS + ['median_seconds', 'peak_memory_mb']
+    merged = baseline[columns].merge(current[columns], on=RESULT_KEYS, suffixes=('_baseline', ''))
+    comparison = merged[RESULT_KEYS].copy()
+    comparison['baseline_seconds'] = merged['median_seconds_baseline']
+    comparison['seconds'] = merged['median_seconds']
+    comparison['speedup'] = comparison['baseline_seconds'] / comparison['seconds']
+    comparison['baseline_memory_mb'] = merged['peak_memory_mb_baseline']
+    comparison['memory_mb'] = merged['peak_memory_mb']
+    comparison['memory_ratio'] = comparison['memory_mb'] / comparison['baseline_memory_mb']
+
+    relative_change = comparison['seconds'] / comparison['baseline_seconds'] - 1
+    comparison['status'] = np.select([relative_change > threshold, relative_change < -threshold],
+                                     ['slower', 'faster'], 'unchanged')
+    return comparison
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Command line entry point; see `--help`. Returns the exit code: 1 if
+    `--fail-on-slowdown` is set and a case got slower, else 0.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the cohort statistics on synthetic data.")
+    parser.add_argument('--scale', choices=list(SCALES), default='quick')
+    parser.add_argument('--vendors', type=int, nargs='+', help="Vendor counts (overrides --scale).")
+    parser.add_argument('--cohorts', type=int, nargs='+', help="Cohort counts (overrides --scale).")
+    parser.add_argument('--distributions', nargs='+', choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS))
+    parser.add_argument('--functions', nargs='+', choices=list(BENCHMARKS), help="Default: all.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help="Skip the traced memory run.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--compare', metavar='BASELINE', help="Compare against a results JSON file.")
+    parser.add_argument('--current', help="With --compare, compare this results file instead of running.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative time change reported as faster/slower.")
+    parser.add_argument('--fail-on-slowdown', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.current:
+        current = read_results(args.current)
+    else:
+        grid = scale_grid(args.scale, args.vendors, args.cohorts)
+        records = run_benchmarks(grid, args.distributions, args.functions, args.repeat,
+                                 not args.no_memory, args.seed)
+        if args.output:
+            write_results(records, args.output)
+            print(f"Results written to {args.output}")
+        current = DataFrame(records)
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        if not args.compare:
+            print(current[RESULT_KEYS + ['median_seconds', 'peak_memory_mb']].to_string(index=False))
+            return 0
+        comparison = compare_results(read_results(args.compare), current, args.threshold)
+        print(comparison.to_string(index=False))
+    counts = comparison['status'].value_counts()
+    print(f"{counts.get('faster', 0)} faster, {counts.get('slower', 0)} slower, "
+          f"{counts.get('unchanged', 0)} unchanged (threshold {args.threshold:.0%})")
+    return int(args.fail_on_slowdown and counts.get('slower', 0) > 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
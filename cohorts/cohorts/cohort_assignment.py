@@ -0,0 +1,142 @@
+# simulate the hierarchical cohort rule with fallback, without rebuilding tables in SQL
+
+import json
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+# Country -> City -> Area -> Price -> Cuisine -> Grade, as in the production rule
+DEFAULT_HIERARCHY = ('entity', 'city', 'area', 'budget', 'cuisine', 'vendor_grade')
+
+ALL = 'All'
+
+
+def _level_codes(df: DataFrame, hierarchy: Sequence[str]) -> np.ndarray:
+    """
+      (rows, levels) int64 codes of the cohort prefix at each depth; prefix d groups rows equal on hierarchy[:d + 1]
+    """
+    prefix_codes = np.empty((len(df), len(hierarchy)), dtype=np.int64)
+    parent = np.zeros(len(df), dtype=np.int64)
+    for depth, column in enumerate(hierarchy):
+        level, uniques = pd.factorize(df[column], use_na_sentinel=False)
+        parent, _ = pd.factorize(parent * len(uniques) + level)
+        prefix_codes[:, depth] = parent
+    return prefix_codes
+
+
+def _distinct_per_group(group_codes: np.ndarray, item_codes: np.ndarray, num_items: int) -> np.ndarray:
+    """
+      number of distinct items in each row's group
+    """
+    pairs = pd.unique(group_codes * num_items + item_codes)
+    num_groups = group_codes.max() + 1 if len(group_codes) else 0
+    return np.bincount(pairs // num_items, minlength=num_groups)[group_codes]
+
+
+def _features_json(cohorts: DataFrame) -> np.ndarray:
+    """
+      one JSON object string per row; each distinct value of a column is encoded once
+    """
+    features = np.full(len(cohorts), '{', dtype=object)
+    for position, column in enumerate(cohorts.columns):
+        codes, uniques = pd.factorize(cohorts[column], use_na_sentinel=False)
+        encoded = np.array([json.dumps(None if pd.isna(value) else str(value)) for value in uniques],
+                           dtype=object)
+        separator = ', ' if position else ''
+        features = features + f"{separator}{json.dumps(column)}: " + encoded[codes]
+    return features + '}'
+
+
+def assign_cohorts(
+    df: DataFrame,
+    hierarchy: Sequence[str] = DEFAULT_HIERARCHY,
+    min_vendors: int = 5,
+    min_chains: int = 2,
+    fallback: str = 'root',
+    chain_column: str = 'chain_id',
+    vendor_column: str = 'vendor_code'
+) -> DataFrame:
+    """
+    Assigns every vendor to a cohort under a hierarchical rule with fallback.
+
+    A vendor's candidate cohorts are the prefixes of `hierarchy`: the entity,
+    entity + city, and so on down to all levels. A candidate is valid if it
+    holds at least `min_vendors` vendors from at least `min_chains` distinct
+    chains (vendors without a chain id count as a chain of their own). Each
+    vendor starts at the full-depth cohort and, if it is invalid, falls back:
+
+    - 'root': straight to the entity cohort (every other level 'All'), as the
+      current production rule does.
+    - 'parent': to the deepest valid prefix, one level at a time.
+
+    The first level (the entity) is always kept, whatever its size. Counts are
+    taken level by level with integer group codes, not per vendor, and each
+    cohort's features are serialised once.
+
+    Args:
+        df (DataFrame): One row per vendor with the hierarchy columns, `chain_column`
+                        and `vendor_column`. Missing feature values form their own group.
+        hierarchy (Sequence[str], optional): Feature columns from broadest to finest.
+                                             Defaults to DEFAULT_HIERARCHY.
+        min_vendors (int, optional): Minimum vendors in a cohort. Defaults to 5.
+        min_chains (int, optional): Minimum distinct chains in a cohort. Use 1 to
+                                    drop the chain requirement. Defaults to 2.
+        fallback (str, optional): 'root' or 'parent'. Defaults to 'root'.
+        chain_column (str, optional): Defaults to 'chain_id'.
+        vendor_column (str, optional): Defaults to 'vendor_code'.
+
+    Returns:
+        DataFrame: A copy of `df` with 'cohort_id' (int, numbered in sorted order
+                   of the features), 'cohort_features' (a JSON object keyed by
+                   the hierarchy columns, 'All' for fallen-back levels) and
+                   'cohort_depth' (the number of hierarchy levels kept).
+
+    Raises:
+        ValueError: If `hierarchy` is empty or `fallback` is not recognised.
+    """
+    if not hierarchy:
+        raise ValueError("The hierarchy needs at least one level.")
+    if fallback not in ('root', 'parent'):
+        raise ValueError(f"Unknown fallback '{fallback}'. Use 'root' or 'parent'.")
+    hierarchy = list(hierarchy)
+
+    chains = df[chain_column].astype(object).where(df[chain_column].notna(),
+                                                   'vendor:' + df[vendor_column].astype(str))
+    chain_codes, chain_uniques = pd.factorize(chains)
+    prefix_codes = _level_codes(df, hierarchy)
+
+    valid = np.empty(prefix_codes.shape, dtype=bool)
+    for depth in range(len(hierarchy)):
+        codes = prefix_codes[:, depth]
+        vendors = np.bincount(codes)[codes]
+        distinct_chains = _distinct_per_group(codes, chain_codes, len(chain_uniques))
+        valid[:, depth] = (vendors >= min_vendors) & (distinct_chains >= min_chains)
+    valid[:, 0] = True
+
+    if fallback == 'root':
+        depth = np.where(valid[:, -1], len(hierarchy), 1)
+    else:
+        # Deepest valid prefix: last True along each row
+        depth = len(hierarchy) - np.argmax(valid[:, ::-1], axis=1)
+
+    # One row per distinct cohort: the prefix code at the assigned depth identifies it
+    cohort_key = prefix_codes[np.arange(len(df)), depth - 1] * (len(hierarchy) + 1) + depth
+    key_codes, _ = pd.factorize(cohort_key)
+    _, first_rows = np.unique(key_codes, return_index=True)
+
+    cohorts = df.iloc[first_rows][hierarchy].astype(object).reset_index(drop=True)
+    cohort_depth = depth[first_rows]
+    for level, column in enumerate(hierarchy):
+        cohorts.loc[cohort_depth <= level, column] = ALL
+    cohort_features = _features_json(cohorts)
+    # Number cohorts in sorted order of their features, so ids don't depend on row order
+    cohort_ids = np.empty(len(cohort_features), dtype=np.int64)
+    cohort_ids[np.argsort(cohort_features, kind='stable')] = np.arange(len(cohort_features))
+
+    return df.assign(
+        cohort_id=cohort_ids[key_codes],
+        cohort_features=cohort_features[key_codes],
+        cohort_depth=depth
+    )
@@ -0,0 +1,152 @@
+import json
+import warnings
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+
+# Distinct features strings kept parsed per process; rule tables have far fewer cohorts
+PARSE_CACHE_SIZE = 2**16
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_cohort_features(cohort_features: str) -> Tuple[Tuple[str, Any], ...]:
+    """
+      json.loads, memoised per distinct string (up to PARSE_CACHE_SIZE); raises
+      json.JSONDecodeError on invalid input
+    """
+    return tuple(json.loads(cohort_features).items())
+
+
+def decode_cohort_features(cohort_features: str) -> Dict[str, Any]:
+    """
+    Decodes a 'cohort_features' JSON string into a dict.
+
+    Each distinct string is parsed once per process (for the most recent
+    PARSE_CACHE_SIZE strings), however many rule tables or vendor rows it appears in.
+
+    Raises:
+        json.JSONDecodeError: If the string is not valid JSON.
+    """
+    return dict(_parse_cohort_features(cohort_features))
+
+
+def _codes(values: pd.Series) -> Tuple[np.ndarray, Sequence]:
+    """
+      integer codes (-1 for missing) and the value of each code; categoricals reuse their codes
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy().astype(np.int64), values.cat.categories
+    codes, uniques = pd.factorize(values)
+    return codes.astype(np.int64), uniques
+
+
+@dataclass(frozen=True)
+class CohortFeatureStore:
+    """
+    The decoded features of every cohort in a table, one row per cohort.
+
+    Replaces per-row `json.loads` (and per-table `JSON_VALUE` extraction): the
+    'cohort_features' strings are de-duplicated first, so parsing scales with
+    the number of cohorts, not vendor rows. Each feature key becomes a
+    categorical column, with NaN where a cohort lacks the key or its JSON is
+    invalid.
+
+    Build it with `from_frame`, then use `features` directly or `attach` the
+    feature columns to vendor rows.
+
+    Attributes:
+        features (DataFrame): Indexed by cohort id, with the raw
+                              'cohort_features' string and one categorical
+                              column per feature key (e.g. 'entity', 'city').
+    """
+    features: DataFrame
+
+    @classmethod
+    def from_frame(cls,
+                   df: DataFrame,
+                   cohort_col: str = 'cohort_id',
+                   features_col: str = 'cohort_features') -> "CohortFeatureStore":
+        """
+        Decodes the features of every cohort id of `df`, in order of first
+        appearance. Rows with a missing cohort id are ignored.
+
+        Both columns are reduced to integer codes (the codes of categoricals
+        are used as they are), so only the distinct (cohort, features) pairs
+        are compared. A cohort id with more than one features string, e.g.
+        from a rule table re-run with a changed feature set, gets its most
+        frequent one (on ties, a non-missing one seen first) and a warning.
+        """
+        cohort_codes, cohort_values = _codes(df[cohort_col])
+        feature_codes, feature_values = _codes(df[features_col])
+        # missing features strings get their own code and decode to no features
+        feature_codes = np.where(feature_codes >= 0, feature_codes, len(feature_values))
+        feature_values = np.append(np.asarray(feature_values, dtype=object), None)
+
+        present = cohort_codes >= 0
+        pair_codes, pairs = pd.factorize(cohort_codes[present] * len(feature_values) + feature_codes[present])
+        pair_counts = np.bincount(pair_codes, minlength=len(pairs))
+        pair_cohort, pair_feature = pairs // len(feature_values), pairs % len(feature_values)
+
+        # pairs are in order of first appearance: per cohort, the most frequent pair, then
+        # one with a features string, then the earliest
+        missing_features = pair_feature == len(feature_values) - 1
+        by_preference = np.lexsort((np.arange(len(pairs)), missing_features, -pair_counts, pair_cohort))
+        preferred_cohort = pair_cohort[by_preference]
+        first_of_cohort = np.r_[True, preferred_cohort[1:] != preferred_cohort[:-1]][:len(pairs)]
+        chosen = by_preference[first_of_cohort]
+        num_conflicts = len(pairs) - len(chosen)
+        if num_conflicts:
+            warnings.warn(f"{num_conflicts} extra '{features_col}' values for some '{cohort_col}' values; "
+                          f"using the most frequent per cohort.")
+        # cohorts in order of their first row
+        first_pair = np.full(len(cohort_values), len(pairs))
+        np.minimum.at(first_pair, pair_cohort, np.arange(len(pairs)))
+        chosen = chosen[np.argsort(first_pair[pair_cohort[chosen]])]
+        cohort_ids = pd.Index(np.asarray(cohort_values)[pair_cohort[chosen]], name=cohort_col)
+        cohort_features = feature_values[pair_feature[chosen]]
+
+        decoded = []
+        for cohort_features_string in cohort_features:
+            try:
+                decoded.append(decode_cohort_features(cohort_features_string))
+            except (json.JSONDecodeError, TypeError):
+                decoded.append({})
+
+        features = DataFrame(decoded, index=cohort_ids)
+        features = features.astype('category')
+        features.insert(0, features_col, cohort_features)
+        return cls(features=features)
+
+    @property
+    def feature_columns(self) -> Sequence[str]:
+        return list(self.features.columns[1:])
+
+    def attach(self,
+               df: DataFrame,
+               cohort_col: str = 'cohort_id',
+               columns: Optional[Sequence[str]] = None) -> DataFrame:
+        """
+        Returns a copy of `df` with feature columns aligned on `cohort_col`.
+        Rows whose cohort is not in the store get NaN.
+
+        Args:
+            df (DataFrame): Vendor rows with a cohort id column.
+            cohort_col (str, optional): Defaults to 'cohort_id'.
+            columns (Optional[Sequence[str]], optional): The features to attach.
+                                                         Defaults to all of them.
+        """
+        columns = self.feature_columns if columns is None else list(columns)
+        positions = self.features.index.get_indexer(df[cohort_col])
+        attached = {}
+        for col in columns:
+            feature = self.features[col]
+            codes = np.full(len(df), -1, dtype=np.int64)
+            found = positions >= 0
+            codes[found] = feature.cat.codes.to_numpy()[positions[found]]
+            attached[col] = pd.Categorical.from_codes(codes, dtype=feature.dtype)
+        return df.assign(**attached)
@@ -1,10 +1,18 @@
 # a collection of helper functions for cohort statistics
 
 import json
+import os
+import time
 import warnings
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from collections.abc import ItemsView
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from .cohort_features import CohortFeatureStore, decode_cohort_features
 from .config_manager import TableConfig
+from .group_index import CohortGroupIndex
+from .query_cache import QueryCache
+from .schema import FrameSchema
+from .vendor_keys import VendorKeyIndex
 import pandas_gbq
 
 import numpy as np
@@ -12,19 +20,30 @@ import pandas as pd
 import seaborn as sns
 from matplotlib import pyplot as plt
 from pandas import DataFrame, Series
-from scipy.stats import f_oneway, kruskal
+from scipy.stats import chi2, f_oneway
+
+
+def _as_group_index(df: DataFrame,
+                    cohort_col: Union[str, CohortGroupIndex]) -> CohortGroupIndex:
+    """
+      build a CohortGroupIndex for a cohort column, or check a prebuilt one fits df
+    """
+    if isinstance(cohort_col, CohortGroupIndex):
+        cohort_col.check_length(df)
+        return cohort_col
+    return CohortGroupIndex.from_frame(df, cohort_col)
 
 
 def get_groups(df: DataFrame, 
                performance_col: str, 
-               cohort_col: str) -> List[np.ndarray]:
+               cohort_col: Union[str, CohortGroupIndex]) -> List[np.ndarray]:
     """
       group data by cohorts for use in downstream functions
+
+      cohort_col can be a column name or a prebuilt CohortGroupIndex
     """
-    cohort_groups = [group[performance_col].values 
-                    for name, group in df.groupby(cohort_col) 
-                    if len(group) >= 5] 
-    return cohort_groups
+    group_index = _as_group_index(df, cohort_col)
+    return group_index.split(df[performance_col].values)
 
 ## IQR method
 def find_outliers_iqr(data: np.ndarray, multiplier: int =3) -> Series:
@@ -56,39 +75,101 @@ def find_outliers_mean_multiple(data: np.ndarray, multiplier: int=5) -> Series:
 
 
 
-def compare_outlier_methods(df: DataFrame, performance_col: str, cohort_col: str) -> DataFrame:
+def _grouped_quantile(sorted_values: np.ndarray,
+                      starts: np.ndarray,
+                      counts: np.ndarray,
+                      q: float) -> np.ndarray:
+    """
+    Linear-interpolated quantile for every group of a group-contiguous,
+    within-group sorted array. Matches pandas' default `Series.quantile`.
+
+    Groups with no valid observations get NaN.
+    """
+    result = np.full(len(counts), np.nan)
+    has_data = counts > 0
+    position = (counts[has_data] - 1) * q
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    fraction = position - lower
+    lower_values = sorted_values[starts[has_data] + lower]
+    upper_values = sorted_values[starts[has_data] + upper]
+    result[has_data] = lower_values + (upper_values - lower_values) * fraction
+    return result
+
+
+def compare_outlier_methods(df: DataFrame, performance_col: str,
+                            cohort_col: Union[str, CohortGroupIndex]) -> DataFrame:
     """
     Compare different outlier detection methods
+
+    All cohorts are handled in a single vectorised pass: cohorts are factorised
+    once, values are sorted within cohort once, and the size, mean, median,
+    quartiles, IQR (3x) flags, 5x mean flags and their overlap are computed
+    for every cohort at the same time. Results match running
+    `find_outliers_iqr(multiplier=3)` and `find_outliers_mean_multiple(multiplier=5)`
+    on each cohort separately. Cohorts appear in order of first appearance.
+
+    cohort_col can be a column name or a prebuilt CohortGroupIndex.
     """
-    results = []
-    
-    for cohort in df[cohort_col].unique():
-        cohort_data = df[df[cohort_col] == cohort][performance_col]
-        
-        if len(cohort_data) >= 5:  # Minimum size for meaningful comparison
-            # Method 1: IQR (1.5x)
-            iqr_outliers = find_outliers_iqr(cohort_data, multiplier=3)
-            
-            # Method 2: 5x Mean
-            mean_outliers = find_outliers_mean_multiple(cohort_data, multiplier=5)
-            
-            # Method 3: MAD  
-            # mad_outliers = find_outliers_mad(cohort_data, threshold=3.5)
-            
-            results.append({
-                'cohort': cohort,
-                'cohort_size': len(cohort_data),
-                'mean': cohort_data.mean(),
-                'median': cohort_data.median(),
-                'iqr_outliers': iqr_outliers.sum(),
-                'mean_5x_outliers': mean_outliers.sum(),
-                # 'mad_outliers': mad_outliers.sum(),
-                'iqr_pct': (iqr_outliers.sum() / len(cohort_data)) * 100,
-                'mean_5x_pct': (mean_outliers.sum() / len(cohort_data)) * 100,
-                'overlap_iqr_mean': (iqr_outliers & mean_outliers).sum()
-            })
-    
-    return DataFrame(results)
+    result_columns = ['cohort', 'cohort_size', 'mean', 'median', 'iqr_outliers',
+                      'mean_5x_outliers', 'iqr_pct', 'mean_5x_pct', 'overlap_iqr_mean']
+
+    # Labels are in first-appearance order, like Series.unique()
+    group_index = _as_group_index(df, cohort_col)
+    cohorts = group_index.labels
+    cohort_size = group_index.sizes
+    eligible = group_index.eligible  # Minimum size for meaningful comparison
+    if not eligible.any():
+        return DataFrame(columns=result_columns)
+
+    # NaN cohorts never match themselves in a boolean mask, so they are dropped
+    codes = group_index.codes[group_index.order]
+    values = df[performance_col].to_numpy(dtype=float)[group_index.order]
+    num_cohorts = group_index.num_cohorts
+
+    # Rows are already contiguous by cohort; a stable sort by value followed by
+    # a stable regroup sorts values within each cohort. NaNs sort to the end of
+    # each cohort, so the first `valid_count` entries of a cohort are valid.
+    by_value = np.argsort(values, kind='stable')
+    regroup = by_value[np.argsort(codes[by_value], kind='stable')]
+    sorted_values = values[regroup]
+    starts = group_index.offsets
+    is_valid = ~np.isnan(values)
+    valid_count = np.bincount(codes, weights=is_valid, minlength=num_cohorts).astype(np.int64)
+    valid_sum = np.bincount(codes[is_valid], weights=values[is_valid], minlength=num_cohorts)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = valid_sum / valid_count
+    median = _grouped_quantile(sorted_values, starts, valid_count, 0.5)
+    q1 = _grouped_quantile(sorted_values, starts, valid_count, 0.25)
+    q3 = _grouped_quantile(sorted_values, starts, valid_count, 0.75)
+
+    # Method 1: IQR (3x)
+    iqr = q3 - q1
+    lower_bound = q1 - 3 * iqr
+    upper_bound = q3 + 3 * iqr
+    iqr_flags = (values < lower_bound[codes]) | (values > upper_bound[codes])
+
+    # Method 2: 5x Mean
+    mean_flags = values > (5 * mean)[codes]
+
+    iqr_outliers = np.bincount(codes, weights=iqr_flags, minlength=num_cohorts).astype(np.int64)
+    mean_5x_outliers = np.bincount(codes, weights=mean_flags, minlength=num_cohorts).astype(np.int64)
+    overlap = np.bincount(codes, weights=iqr_flags & mean_flags, minlength=num_cohorts).astype(np.int64)
+
+    results = DataFrame({
+        'cohort': cohorts[eligible],
+        'cohort_size': cohort_size[eligible],
+        'mean': mean[eligible],
+        'median': median[eligible],
+        'iqr_outliers': iqr_outliers[eligible],
+        'mean_5x_outliers': mean_5x_outliers[eligible],
+        'iqr_pct': iqr_outliers[eligible] / cohort_size[eligible] * 100,
+        'mean_5x_pct': mean_5x_outliers[eligible] / cohort_size[eligible] * 100,
+        'overlap_iqr_mean': overlap[eligible]
+    }, columns=result_columns)
+
+    return results
 
 
 
@@ -148,11 +229,252 @@ def calculate_anova_components(*samples: np.ndarray) -> Tuple[float, float, floa
     return f_statistic, ms_between, ms_within
 
 
+def get_cohort_moments(df: DataFrame, performance_col: str,
+                       cohort_col: Union[str, CohortGroupIndex]) -> DataFrame:
+    """
+    Reduces performance data to per-cohort sufficient statistics for ANOVA.
+
+    A single factorisation of the cohort column is followed by a two-pass
+    (mean first, then centred squares) bincount reduction, which stays accurate
+    for large cohorts where the textbook `sum(x**2) - sum(x)**2 / n` form
+    loses precision. NaN performance values are ignored.
+
+    Args:
+        df (DataFrame): The input DataFrame containing performance and cohort data.
+        performance_col (str): The name of the numeric performance column.
+        cohort_col (Union[str, CohortGroupIndex]): The name of the column
+                                                   identifying cohorts, or a
+                                                   prebuilt CohortGroupIndex.
+
+    Returns:
+        DataFrame: Indexed by cohort, with columns 'count', 'sum' and 'm2'
+                   (the sum of squared deviations from the cohort mean).
+                   Frames from different chunks of the same data can be
+                   merged with `combine_cohort_moments`.
+    """
+    group_index = _as_group_index(df, cohort_col)
+    codes = group_index.codes
+    values = df[performance_col].to_numpy(dtype=float)
+
+    keep = (codes >= 0) & ~np.isnan(values)
+    codes = codes[keep]
+    values = values[keep]
+
+    num_cohorts = group_index.num_cohorts
+    count = np.bincount(codes, minlength=num_cohorts).astype(np.int64)
+    total = np.bincount(codes, weights=values, minlength=num_cohorts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, 0.0)
+    m2 = np.bincount(codes, weights=(values - mean[codes])**2, minlength=num_cohorts)
+
+    return DataFrame(
+        {'count': count, 'sum': total, 'm2': m2},
+        index=group_index.labels.rename(cohort_col if isinstance(cohort_col, str) else None)
+    )
+
+
+def combine_cohort_moments(*moments: DataFrame) -> DataFrame:
+    """
+    Merges per-cohort moments computed on separate chunks of data.
+
+    Uses the pairwise update of Chan, Golub and LeVeque, so the combined 'm2'
+    equals what `get_cohort_moments` would return on the concatenated data,
+    without revisiting any rows. Cohorts missing from a chunk are treated as
+    empty in that chunk.
+
+    Args:
+        *moments: DataFrames as returned by `get_cohort_moments`.
+
+    Returns:
+        DataFrame: The combined 'count', 'sum' and 'm2' per cohort.
+
+    Raises:
+        ValueError: If no moments are given.
+    """
+    if not moments:
+        raise ValueError("Requires at least one moments DataFrame to combine.")
+
+    combined = moments[0][['count', 'sum', 'm2']]
+    for chunk in moments[1:]:
+        left, right = combined.align(chunk[['count', 'sum', 'm2']], join='outer', fill_value=0)
+        count = left['count'] + right['count']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = (
+                np.where(right['count'] > 0, right['sum'] / right['count'], 0.0)
+                - np.where(left['count'] > 0, left['sum'] / left['count'], 0.0)
+            )
+            correction = np.where(
+                count > 0, delta**2 * left['count'] * right['count'] / count, 0.0
+            )
+        combined = DataFrame({
+            'count': count.astype(np.int64),
+            'sum': left['sum'] + right['sum'],
+            'm2': left['m2'] + right['m2'] + correction
+        })
+
+    return combined
+
+
+def anova_from_moments(moments: DataFrame, min_cohort_size: int = 5) -> Tuple[float, float, float]:
+    """
+    Calculates the F-statistic, Mean Square Between and Mean Square Within
+    from per-cohort sufficient statistics instead of raw samples.
+
+    Gives the same result as `calculate_anova_components` on the cohorts'
+    samples, but never materialises per-cohort arrays.
+
+    Args:
+        moments (DataFrame): Per-cohort 'count', 'sum' and 'm2', as returned by
+                             `get_cohort_moments` or `combine_cohort_moments`.
+        min_cohort_size (int, optional): Cohorts with fewer observations are
+                                         excluded. Defaults to 5, as in `get_groups`.
+
+    Returns:
+        tuple: (f_statistic, ms_between, ms_within).
+
+    Raises:
+        ValueError: If there's only one eligible cohort or insufficient data.
+    """
+    eligible = moments.loc[moments['count'] >= min_cohort_size]
+    count = eligible['count'].to_numpy(dtype=float)
+    cohort_means = eligible['sum'].to_numpy() / count
+
+    k = len(eligible)
+    N = count.sum()
+    grand_mean = eligible['sum'].sum() / N if N > 0 else np.nan
+
+    ss_between = np.sum(count * (cohort_means - grand_mean)**2)
+    ss_within = eligible['m2'].sum()
+
+    df_between = k - 1
+    df_within = N - k
+
+    if df_between <= 0:
+        raise ValueError("Cannot calculate MS_between: Requires at least two groups.")
+    if df_within <= 0:
+        raise ValueError("Cannot calculate MS_within: Insufficient data (total observations must exceed number of groups).")
+
+    ms_between = ss_between / df_between
+    ms_within = ss_within / df_within
+    f_statistic = ms_between / ms_within
+
+    return f_statistic, ms_between, ms_within
+
+
+def _eligible_samples(values: Union[np.ndarray, Series],
+                      codes: Union[np.ndarray, Series, CohortGroupIndex],
+                      min_cohort_size: int = 5,
+                      codes_are_dense: bool = False) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+      keep the rows of eligible cohorts, with cohorts re-labelled 0..k-1.
+      cohort labels (including integer ids) are factorised unless codes_are_dense says they
+      already are 0..k-1 codes with negatives for missing.
+      returns (values, group codes, group sizes), or None if fewer than two cohorts are eligible
+    """
+    values = np.asarray(values, dtype=float)
+    if isinstance(codes, CohortGroupIndex):
+        if len(values) != codes.num_rows:
+            raise ValueError(
+                f"CohortGroupIndex was built for {codes.num_rows} rows, "
+                f"but {len(values)} values were given."
+            )
+        cohort_size, eligible = codes.sizes, codes.eligible
+        codes = codes.codes
+    else:
+        if codes_are_dense:
+            codes = np.asarray(codes)
+        else:
+            codes, _ = pd.factorize(np.asarray(codes))
+        num_cohorts = codes.max() + 1 if len(codes) else 0
+        cohort_size = np.bincount(codes[codes >= 0], minlength=num_cohorts)
+        eligible = cohort_size >= min_cohort_size
+
+    if eligible.sum() < 2:
+        return None
+
+    in_cohort = codes >= 0
+    keep = in_cohort.copy()
+    keep[in_cohort] = eligible[codes[in_cohort]]
+    group_codes = np.cumsum(eligible)[codes[keep]] - 1
+    return values[keep], group_codes, cohort_size[eligible].astype(float)
+
+
+def _average_ranks(x: np.ndarray) -> Tuple[np.ndarray, float]:
+    """
+      rank once: sort, find tie blocks, give each block its average rank.
+      returns the ranks and the Kruskal-Wallis tie correction factor
+    """
+    n = len(x)
+    order = np.argsort(x, kind='mergesort')
+    sorted_x = x[order]
+    block_start = np.flatnonzero(np.concatenate(([True], sorted_x[1:] != sorted_x[:-1])))
+    block_size = np.diff(np.append(block_start, n))
+    block_rank = block_start + (block_size + 1) / 2.0
+    ranks = np.empty(n)
+    ranks[order] = np.repeat(block_rank, block_size)
+
+    tie_correction = 1.0 - np.sum(block_size.astype(float)**3 - block_size) / (float(n)**3 - n)
+    return ranks, tie_correction
+
+
+def kruskal_wallis(values: Union[np.ndarray, Series],
+                   codes: Union[np.ndarray, Series, CohortGroupIndex],
+                   min_cohort_size: int = 5,
+                   codes_are_dense: bool = False) -> Tuple[float, float, float]:
+    """
+    Kruskal-Wallis H-test computed directly from a value column and cohort codes.
+
+    Equivalent to `scipy.stats.kruskal(*get_groups(...))`, but the data is ranked
+    once with a single sort (average ranks for ties), rank sums per cohort come
+    from one bincount, and no per-cohort arrays are built.
+
+    Args:
+        values (array-like): The performance values, one per row.
+        codes (array-like): The cohort of each row. Labels, including integer
+                            cohort ids, are factorised first (missing labels
+                            are excluded). A prebuilt CohortGroupIndex is used
+                            with its own eligibility mask.
+        min_cohort_size (int, optional): Cohorts with fewer rows are excluded
+                                         from the test. Defaults to 5. Ignored
+                                         when `codes` is a CohortGroupIndex.
+        codes_are_dense (bool, optional): `codes` are already 0..k-1 codes,
+                                          negative for missing (as from
+                                          `pd.factorize`), and are used
+                                          as-is. Defaults to False.
+
+    Returns:
+        tuple: (H statistic, p-value, epsilon-squared). Epsilon-squared is
+               H / (n + 1) with n the number of rows passed in, as used in
+               `process_dataframes_for_outliers`. All three are np.nan when fewer
+               than two cohorts are eligible, when eligible values contain NaN
+               (scipy's 'propagate' behaviour), or when all values are identical.
+    """
+    n_total = len(values)
+    eligible_samples = _eligible_samples(values, codes, min_cohort_size, codes_are_dense)
+    if eligible_samples is None:
+        return np.nan, np.nan, np.nan
+    x, group_codes, group_size = eligible_samples
+    if np.isnan(x).any():
+        return np.nan, np.nan, np.nan
+    n = len(x)
+
+    ranks, tie_correction = _average_ranks(x)
+    if tie_correction == 0:
+        return np.nan, np.nan, np.nan
+
+    rank_sums = np.bincount(group_codes, weights=ranks, minlength=len(group_size))
+    h_stat = 12.0 / (n * (n + 1)) * np.sum(rank_sums**2 / group_size) - 3 * (n + 1)
+    h_stat /= tie_correction
+    p_value = chi2.sf(h_stat, len(group_size) - 1)
+
+    return h_stat, p_value, h_stat / (n_total + 1)
 
 
 # Assuming calculate_anova_components is defined in the same file or imported
 
-def get_f_stat_components(df: DataFrame, performance_col: str, cohort_col: str) -> Dict[str, float]:
+def get_f_stat_components(df: DataFrame, performance_col: str,
+                          cohort_col: Union[str, CohortGroupIndex],
+                          method: str = 'samples') -> Dict[str, float]:
     """
     Calculates various F-statistic components for cohort-based performance data.
 
@@ -164,14 +486,42 @@ def get_f_stat_components(df: DataFrame, performance_col: str, cohort_col: str)
         df (DataFrame): The input DataFrame containing performance and cohort data.
         performance_col (str): The name of the column containing performance metrics
                                 (expected to be numeric).
-        cohort_col (str): The name of the column identifying different cohorts.
+        cohort_col (Union[str, CohortGroupIndex]): The name of the column identifying
+                                                   different cohorts, or a prebuilt
+                                                   CohortGroupIndex.
+        method (str, optional): 'samples' (default) builds per-cohort arrays and
+                                also runs scipy's f_oneway. 'moments' computes the
+                                manual components from per-cohort sufficient
+                                statistics (`get_cohort_moments`) in one groupby;
+                                'f_scipy' is then np.nan.
 
     Returns:
         dict: A dictionary containing the F-statistic from scipy, manual F-statistic,
               and manual Mean Square Between (MS_B) and Mean Square Within (MS_W)
               components. Returns a dictionary with all values as np.nan if
               fewer than two valid cohorts are found.
+
+    Raises:
+        ValueError: If `method` is not 'samples' or 'moments'.
     """
+    if method not in ('samples', 'moments'):
+        raise ValueError(f"Unknown method '{method}'. Expected 'samples' or 'moments'.")
+
+    if method == 'moments':
+        moments = get_cohort_moments(df, performance_col, cohort_col)
+        min_cohort_size = (cohort_col.min_cohort_size
+                           if isinstance(cohort_col, CohortGroupIndex) else 5)
+        try:
+            f_manual, ms_b_manual, ms_w_manual = anova_from_moments(moments, min_cohort_size)
+        except ValueError:
+            f_manual, ms_b_manual, ms_w_manual = np.nan, np.nan, np.nan
+        return {
+            'f_scipy': np.nan,
+            'f_manual': f_manual,
+            'ms_b_manual': ms_b_manual,
+            'ms_w_manual': ms_w_manual
+        }
+
     # Extract performance data for each cohort, skipping cohorts with fewer than 5 observations.
     cohort_groups = get_groups(df, performance_col, cohort_col)
 
@@ -209,10 +559,85 @@ def get_f_stat_components(df: DataFrame, performance_col: str, cohort_col: str)
 
 
 
+def summarise_outliers(
+    df_name: str,
+    df_tmp: DataFrame,
+    value_column: str,
+    group_column: str,
+    anova_method: str = 'samples'
+    ) -> Dict[str, Union[str, float]]:
+    """
+    Performs the outlier analysis for a single DataFrame.
+
+    This is the per-table step of `process_dataframes_for_outliers`. It is a
+    module-level function so it can be sent to worker processes.
+
+    Args:
+        df_name (str): Name of the DataFrame, reported in the 'df_name' field.
+        df_tmp (DataFrame): The DataFrame to analyse.
+        value_column (str): The name of the column containing values.
+        group_column (str): The name of the column used for grouping.
+        anova_method (str, optional): Passed to `get_f_stat_components` as `method`.
+
+    Returns:
+        Dict[str, Union[str, float]]: One row of the summary produced by
+                                      `process_dataframes_for_outliers`.
+    """
+    print(f"Processing DataFrame: {df_name}...")
+
+    # Group once and share the index across all statistics
+    group_index = CohortGroupIndex.from_frame(df_tmp, group_column)
+
+    # Perform outlier comparison
+    outlier_comparison = compare_outlier_methods(df_tmp, value_column, group_index)
+    # Get F-statistic components
+    f_stat_components = get_f_stat_components(df_tmp, value_column, group_index,
+                                               method=anova_method)
+
+    kw_h_stat, kw_p_value, kw_eps_sq = kruskal_wallis(df_tmp[value_column], group_index)
+
+    # Calculate summary statistics based on outlier comparison results
+    if not outlier_comparison.empty:
+        share_cohorts_with_outlier_IQR = (outlier_comparison['iqr_outliers'] > 0).mean()
+        share_cohorts_with_outlier_5x = (outlier_comparison['mean_5x_outliers'] > 0).mean()
+        iqr_total_outliers = outlier_comparison['iqr_outliers'].sum()
+        mean_5x_total_outliers = outlier_comparison['mean_5x_outliers'].sum()
+        overlap_total_vendors = outlier_comparison['overlap_iqr_mean'].sum()
+    else:
+        share_cohorts_with_outlier_IQR = 0.0
+        share_cohorts_with_outlier_5x = 0.0
+        iqr_total_outliers = 0
+        mean_5x_total_outliers = 0
+        overlap_total_vendors = 0
+
+    # Compile results for the current DataFrame
+    return {
+        'df_name': df_name,
+        'share_cohorts_with_outlier_IQR': share_cohorts_with_outlier_IQR,
+        'share_cohorts_with_outlier_5x': share_cohorts_with_outlier_5x,
+        'iqr_total_outliers': iqr_total_outliers,
+        'mean_5x_total_outliers': mean_5x_total_outliers,
+        'overlap_total_vendors': overlap_total_vendors,
+        'KW_H': kw_h_stat,
+        'epsilon_squared': kw_eps_sq,
+        'p_value': kw_p_value,
+        'f_stat_scipy': f_stat_components['f_scipy'],
+        'f_stat_manual': f_stat_components['f_manual'], # Removed /1e6 if the actual values are not this large
+        'ms_b_manual': f_stat_components['ms_b_manual'], # Removed /1e6
+        'ms_w_manual': f_stat_components['ms_w_manual']  # Removed /1e6
+    }
+
+
 def process_dataframes_for_outliers(
     dataframes_dict: Dict[str, DataFrame],
     value_column: str,
-    group_column: str
+    group_column: str,
+    anova_method: str = 'samples',
+    n_jobs: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    streaming: bool = False,
+    sketch_k: int = 200,
+    delta: float = 0.01
     ) -> DataFrame:
     """
     Loops through multiple DataFrames, performs outlier analysis, and compiles
@@ -223,6 +648,14 @@ def process_dataframes_for_outliers(
     - Calculates Kruskal-Wallis H-statistic and epsilon-squared for cohort separation.
     - Determines F-statistic components (scipy and manual calculation).
 
+    The DataFrames are independent, so they can be processed in parallel by
+    passing `n_jobs` or an `executor`. Rows are always returned in the order
+    of `dataframes_dict`.
+
+    With `streaming=True` each value may also be an iterable of DataFrame
+    batches (e.g. from `streaming.iter_parquet_batches`), and the tables are
+    summarised with `streaming.process_batches_for_outliers` in bounded memory.
+
     Args:
         dataframes_dict (Dict[str, pd.DataFrame]): A dictionary where keys are
                                                     DataFrame names (strings)
@@ -230,14 +663,42 @@ def process_dataframes_for_outliers(
         value_column (str): The name of the column containing values for outlier detection
                             and performance analysis.
         group_column (str): The name of the column used for grouping (e.g., 'cohort_id').
+        anova_method (str, optional): Passed to `get_f_stat_components` as `method`.
+                                      'moments' skips the per-cohort arrays (and
+                                      leaves 'f_stat_scipy' as NaN). Defaults to 'samples'.
+        n_jobs (Optional[int], optional): Number of worker processes. None or 1 runs
+                                          serially; -1 uses all CPUs. Ignored if
+                                          `executor` is given.
+        executor (Optional[Executor], optional): An existing executor to submit the
+                                                 per-DataFrame work to. It is not
+                                                 shut down by this function.
+        streaming (bool, optional): Fold each table in batch by batch with
+                                    quantile sketches. Quartiles and outlier counts
+                                    are then estimates, the Kruskal-Wallis and scipy F
+                                    columns are NaN, and the error-bound columns of
+                                    `process_batches_for_outliers` are added.
+                                    Runs serially. Defaults to False.
+        sketch_k (int, optional): Sketch size when streaming. Defaults to 200.
+        delta (float, optional): Failure probability of each error bound when
+                                 streaming. Defaults to 0.01.
 
     Returns:
         pd.DataFrame: A DataFrame containing summary statistics for each input DataFrame,
                       including outlier counts, shares, ANOVA components, and Kruskal-Wallis
                       results. Each row represents one input DataFrame.
+
+    Raises:
+        RuntimeError: When running in parallel and a DataFrame fails; the message
+                      names the DataFrame and the original error is chained.
+        ValueError: If `streaming` is combined with `n_jobs` or `executor`.
     """
-    # Initialize an empty list to store results for each DataFrame
-    all_results: List[Dict[str, Union[str, float]]] = []
+    if streaming:
+        if executor is not None or (n_jobs is not None and n_jobs != 1):
+            raise ValueError("streaming runs serially; drop n_jobs and executor.")
+        # Imported here because streaming builds on this module
+        from .streaming import process_batches_for_outliers
+        return process_batches_for_outliers(dataframes_dict, value_column, group_column,
+                                            k=sketch_k, delta=delta)
 
     # Define the columns for the results DataFrame explicitly for clarity and type consistency
     result_columns = [
@@ -256,52 +717,34 @@ def process_dataframes_for_outliers(
         'ms_w_manual'
     ]
 
-    for df_name, df_tmp in dataframes_dict.items():
-        print(f"Processing DataFrame: {df_name}...")
-
-        # Perform outlier comparison
-        outlier_comparison = compare_outlier_methods(df_tmp, value_column, group_column)
-        # Get F-statistic components
-        f_stat_components = get_f_stat_components(df_tmp, value_column, group_column)
-
-        cohort_groups = get_groups(df_tmp, value_column, group_column)
-        if len(cohort_groups) < 2:
-            kw_h_stat, kw_p_value, kw_eps_sq = np.nan, np.nan, np.nan
-        else:
-            kw_h_stat, kw_p_value = kruskal(*cohort_groups)
-            kw_eps_sq = kw_h_stat / (df_tmp.shape[0] + 1)
-
-        # Calculate summary statistics based on outlier comparison results
-        if not outlier_comparison.empty:
-            share_cohorts_with_outlier_IQR = (outlier_comparison['iqr_outliers'] > 0).mean()
-            share_cohorts_with_outlier_5x = (outlier_comparison['mean_5x_outliers'] > 0).mean()
-            iqr_total_outliers = outlier_comparison['iqr_outliers'].sum()
-            mean_5x_total_outliers = outlier_comparison['mean_5x_outliers'].sum()
-            overlap_total_vendors = outlier_comparison['overlap_iqr_mean'].sum()
-        else:
-            share_cohorts_with_outlier_IQR = 0.0
-            share_cohorts_with_outlier_5x = 0.0
-            iqr_total_outliers = 0
-            mean_5x_total_outliers = 0
-            overlap_total_vendors = 0
-
-        # Compile results for the current DataFrame
-        current_df_results = {
-            'df_name': df_name,
-            'share_cohorts_with_outlier_IQR': share_cohorts_with_outlier_IQR,
-            'share_cohorts_with_outlier_5x': share_cohorts_with_outlier_5x,
-            'iqr_total_outliers': iqr_total_outliers,
-            'mean_5x_total_outliers': mean_5x_total_outliers,
-            'overlap_total_vendors': overlap_total_vendors,
-            'KW_H': kw_h_stat,
-            'epsilon_squared': kw_eps_sq,
-            'p_value': kw_p_value,
-            'f_stat_scipy': f_stat_components['f_scipy'],
-            'f_stat_manual': f_stat_components['f_manual'], # Removed /1e6 if the actual values are not this large
-            'ms_b_manual': f_stat_components['ms_b_manual'], # Removed /1e6
-            'ms_w_manual': f_stat_components['ms_w_manual']  # Removed /1e6
-        }
-        all_results.append(current_df_results)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    if executor is None and (n_jobs is None or n_jobs <= 1):
+        all_results: List[Dict[str, Union[str, float]]] = [
+            summarise_outliers(df_name, df_tmp, value_column, group_column, anova_method)
+            for df_name, df_tmp in dataframes_dict.items()
+        ]
+    else:
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=min(n_jobs, max(len(dataframes_dict), 1)))
+        try:
+            futures = {
+                df_name: executor.submit(summarise_outliers, df_name, df_tmp,
+                                         value_column, group_column, anova_method)
+                for df_name, df_tmp in dataframes_dict.items()
+            }
+            # Collect in input order so the output is deterministic
+            all_results = []
+            for df_name, future in futures.items():
+                try:
+                    all_results.append(future.result())
+                except Exception as e:
+                    raise RuntimeError(f"Failed to process DataFrame '{df_name}': {e}") from e
+        finally:
+            if own_executor:
+                executor.shutdown(cancel_futures=True)
 
     # Convert the list of results dictionaries into a single DataFrame
     results_df = DataFrame(all_results, columns=result_columns)
@@ -323,6 +766,10 @@ def process_dataframes(
     'vendor_code', converts the 'gmv' column to numeric, and fills NaN values
     with 0. It then compiles all processed DataFrames into a new dictionary.
 
+    The (entity_id, vendor_code) pairs are interned once with a VendorKeyIndex,
+    so each merge is an integer lookup. 'global_entity_id' / 'vendor_id' are
+    renamed on copies; the input DataFrames are not modified.
+
     Args:
         original_df (DataFrame): The initial 'current' DataFrame to be included
                                  in the output dictionary without further processing.
@@ -340,53 +787,37 @@ def process_dataframes(
                               the 'current' DataFrame and all merged DataFrames
                               with cleaned 'gmv' data.
     """
-    try:
-        original_df.rename(columns={'global_entity_id': 'entity_id'}, inplace=True)
-    except KeyError:
-        pass
+    key_renames = {'global_entity_id': 'entity_id', 'vendor_id': 'vendor_code'}
+    # Rename on new frames so the caller's DataFrames are left untouched
+    original_df = original_df.rename(columns=key_renames)
 
-    try:
-        original_df.rename(columns={'vendor_id': 'vendor_code'}, inplace=True)
-    except KeyError:
-        pass
-    
-    # Prepare the GMV lookup DataFrame once
-    v_lookup = original_df[['entity_id', 'vendor_code']].copy()
+    # Intern the (entity_id, vendor_code) pairs of the lookup once; every
+    # left join below then runs on int64 keys
+    vendor_keys = VendorKeyIndex.from_frame(original_df, 'entity_id', 'vendor_code')
     
     processed_dataframes = {'original': original_df} 
     print(f"Starting processing for {len(dataframes_to_process)} dataframes...")
 
     for name, df_to_merge in dataframes_to_process.items():
-        # Perform a left merge to bring 'gmv' data into df_to_merge
-        # 'how='left'' ensures all rows from df_to_merge are kept.
-        try:
-            df_to_merge.rename(columns={'global_entity_id': 'entity_id'}, inplace=True)
-        except KeyError:
-            pass
-
-        try:
-            df_to_merge.rename(columns={'vendor_id': 'vendor_code'}, inplace=True)
-        except KeyError:
-            pass
-
-        merged_df = pd.merge(
-            df_to_merge,
-            v_lookup,
-            on=['entity_id', 'vendor_code'],
-            how='left',
-            indicator=True
-        )
+        # Left join against the lookup: all rows from df_to_merge are kept
+        # (repeated if the lookup has duplicate keys), with a '_merge' indicator
+        # as produced by pd.merge(..., how='left', indicator=True).
+        df_to_merge = df_to_merge.rename(columns=key_renames)
+        rows, indicator = vendor_keys.left_join_indicator(df_to_merge, 'entity_id', 'vendor_code')
+        merged_df = df_to_merge.take(rows).reset_index(drop=True)
+        merged_df['_merge'] = indicator
 
         if coerce_nan == True:
-            # Convert value column to numeric, coercing errors to NaN
-            merged_df[value_column] = pd.to_numeric(merged_df[value_column], errors='coerce')
+            # Convert value column to numeric, coercing errors to NaN. Tables
+            # loaded with a FrameSchema are already numeric and skip this pass.
+            if not pd.api.types.is_numeric_dtype(merged_df[value_column]):
+                merged_df[value_column] = pd.to_numeric(merged_df[value_column], errors='coerce')
             # Fill any resulting NaN values in value with 0.
             merged_df.fillna({value_column: 0}, inplace=True) 
         processed_dataframes[name] = merged_df
 
-        # "lost vendors" due to not being in gmv_lookup:
-        # Create a temporary column to mark if gmv was filled by the merge
-        num_unmatched_in_gmv_lookup = (merged_df['_merge'] == 'left_only').sum()
+        # "lost vendors" due to not being in gmv_lookup
+        num_unmatched_in_gmv_lookup = np.count_nonzero(indicator.codes == 0)
         print(f"  {num_unmatched_in_gmv_lookup} vendors from '{name}' were not found in value source.")
 
     print("\nValue processing complete.")
@@ -442,11 +873,14 @@ def plot_figure_wrapper(
 
 
 def get_top_cohort_items(df: DataFrame, n: int=5) -> ItemsView:
+    """
+      the n (cohort_id, cohort_features) pairs with the most unique vendors, as (pair, count) items
+    """
     return (
-        df    
-        .groupby(['cohort_id', 'cohort_features'])['vendor_code']
+        df
+        .groupby(['cohort_id', 'cohort_features'], observed=True)['vendor_code']
         .nunique()
-        .sort_values(ascending=False)
+        .sort_values(ascending=False, kind='stable')
         .head(n)
         .to_dict()
     ).items()
@@ -455,8 +889,8 @@ def get_top_cohort_items(df: DataFrame, n: int=5) -> ItemsView:
 def pretty_print_output(items: ItemsView) -> None:
     for (cohort_id, cohort_features_json_str), count in items:
         try:
-            # Parse the JSON string into a Python dict
-            features_dict = json.loads(cohort_features_json_str)
+            # Parse the JSON string into a Python dict (memoised per distinct string)
+            features_dict = decode_cohort_features(cohort_features_json_str)
 
             # Pretty-print the Python dict back to a JSON string with indentation
             pretty_features_json = json.dumps(features_dict, indent=4)
@@ -475,11 +909,38 @@ def pretty_print_output(items: ItemsView) -> None:
     return
 
 
+def _read_with_retries(
+    reader: Callable[..., DataFrame],
+    sql_query: str,
+    project_id: str,
+    retries: int,
+    retry_wait: float
+) -> DataFrame:
+    """
+    Calls `reader(sql_query, project_id=project_id)`, retrying failed attempts
+    up to `retries` times with a linearly increasing wait between attempts.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return reader(sql_query, project_id=project_id)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(retry_wait * (attempt + 1))
+
+
 def load_dataframes_by_type(
     specific_data_type: str,
     base_sql_query_template: str,
     config: TableConfig,
-    project_id: str
+    project_id: str,
+    max_workers: int = 1,
+    retries: int = 0,
+    retry_wait: float = 1.0,
+    reader: Optional[Callable[..., DataFrame]] = None,
+    cache: Optional[QueryCache] = None,
+    force_refresh: bool = False,
+    schema: Optional[FrameSchema] = None
 ) -> Dict[str, pd.DataFrame]:
     """
     Loads DataFrames from BigQuery for a specified data type based on TableConfig.
@@ -488,6 +949,10 @@ def load_dataframes_by_type(
     constructs the appropriate SQL query, and loads the data into pandas DataFrames.
     The DataFrames are returned in a flattened dictionary for easy access.
 
+    Queries are mostly waiting on BigQuery, so with `max_workers > 1` up to that
+    many tables are read at once on a thread pool. Progress is still reported,
+    and the output ordered, as in the configuration.
+
     Args:
         specific_data_type (str): The exact data type string to filter by
                                   (e.g., "cohort data", "recommendation (KPIs)").
@@ -497,6 +962,24 @@ def load_dataframes_by_type(
                               BigQuery path configuration
         project_id (str): Your Google Cloud Project ID. This is required by
                           `pandas_gbq.read_gbq`..
+        max_workers (int, optional): Maximum number of tables read concurrently.
+                                     Defaults to 1 (serial).
+        retries (int, optional): Extra attempts per table after a failed read.
+                                 Defaults to 0.
+        retry_wait (float, optional): Seconds to wait before the first retry; the
+                                      wait grows linearly with each attempt. Defaults to 1.0.
+        reader (Optional[Callable[..., DataFrame]], optional): Called as
+                    `reader(sql_query, project_id=project_id)`. Defaults to
+                    `pandas_gbq.read_gbq`; pass a local stand-in to run without BigQuery.
+        cache (Optional[QueryCache], optional): Serve results from, and store them
+                                                in, a local Parquet cache keyed by the
+                                                rendered SQL and `project_id`.
+        force_refresh (bool, optional): With a cache, re-read every table and
+                                        overwrite its entry. Defaults to False.
+        schema (Optional[FrameSchema], optional): Dtypes to apply to each loaded
+                                                  table, e.g. `KPI_SCHEMA`, giving
+                                                  categorical keys and parsed,
+                                                  downcast value columns.
 
     Returns:
         Dict[str, pd.DataFrame]: A flattened dictionary where keys are descriptive strings
@@ -504,52 +987,76 @@ def load_dataframes_by_type(
                                  the loaded pandas DataFrames.
                                  Includes only DataFrames for the `specific_data_type`.
     """
+    if reader is None:
+        reader = pandas_gbq.read_gbq
+    if cache is not None:
+        reader = cache.cached_reader(reader, force_refresh=force_refresh)
+    if schema is not None:
+        raw_reader = reader
+
+        def reader(sql_query: str, project_id: str) -> DataFrame:
+            return schema.apply(raw_reader(sql_query, project_id=project_id))
+
     loaded_dataframes: Dict[str, pd.DataFrame] = {}
     skipped_info: List[str] = [] # To keep track of any DataFrames that failed to load
 
     print(f"Starting to load '{specific_data_type}' DataFrames...")
     print("-" * 60)
 
+    # Collect (key, table path, query) for every configured table first
+    jobs: List[Tuple[str, str, str]] = []
     for category in config.get_categories():
         for parity in config.get_parities(category):
             # Check if the desired specific_data_type exists for this category/parity
             if specific_data_type in config.get_data_types(category, parity):
                 # Iterate through versions (e.g., 'current', 'original') for the specific_data_type
                 for version in config.get_versions(category, parity, specific_data_type):
+                    # Construct the flattened key for the output dictionary
+                    df_key = f"{category}-{parity}-{specific_data_type}-{version}"
                     try:
                         # Get the full BigQuery table path from TableConfig
                         table_path = config.get_path(category, parity, specific_data_type, version)
-
-                        # Format the base SQL query with the specific table path
-                        full_sql_query = base_sql_query_template.format(table_path=table_path)
-
-                        # Construct the flattened key for the output dictionary
-                        df_key = f"{category}-{parity}-{specific_data_type}-{version}"
-
-                        print(f"Reading: Key='{df_key}'")
-                        print(f"  Table Path: {table_path}")
-
-                        # --- The actual pandas_gbq call ---
-                        # Pass the project_id explicitly to read_gbq
-                        df = pandas_gbq.read_gbq(full_sql_query, project_id=project_id)
-                        # -----------------------------------
-
-                        # Store the loaded DataFrame in the dictionary
-                        loaded_dataframes[df_key] = df
-                        print(f"  Successfully loaded {len(df)} rows.")
-
                     except KeyError as e:
                         # Catch configuration errors (e.g., path not found in TableConfig)
-                        error_msg = f"Configuration error for {df_key if 'df_key' in locals() else 'N/A'}: {e}"
-                        skipped_info.append(error_msg)
-                        print(f"  [ERROR] {error_msg}")
-                    except Exception as e:
-                        # Catch any other loading errors (e.g., BigQuery connection, table not found in BQ)
-                        error_msg = f"Failed to read from {table_path} (Key: {df_key if 'df_key' in locals() else 'N/A'}): {e}"
+                        error_msg = f"Configuration error for {df_key}: {e}"
                         skipped_info.append(error_msg)
                         print(f"  [ERROR] {error_msg}")
-                    finally:
-                        print("-" * 60) # Print separator line for readability
+                        print("-" * 60)
+                        continue
+
+                    # Format the base SQL query with the specific table path
+                    full_sql_query = base_sql_query_template.format(table_path=table_path)
+                    jobs.append((df_key, table_path, full_sql_query))
+
+    def report(df_key: str, table_path: str, load: Callable[[], DataFrame]) -> None:
+        print(f"Reading: Key='{df_key}'")
+        print(f"  Table Path: {table_path}")
+        try:
+            df = load()
+            # Store the loaded DataFrame in the dictionary
+            loaded_dataframes[df_key] = df
+            print(f"  Successfully loaded {len(df)} rows.")
+        except Exception as e:
+            # Catch any loading errors (e.g., BigQuery connection, table not found in BQ)
+            error_msg = f"Failed to read from {table_path} (Key: {df_key}): {e}"
+            skipped_info.append(error_msg)
+            print(f"  [ERROR] {error_msg}")
+        finally:
+            print("-" * 60) # Print separator line for readability
+
+    if max_workers <= 1:
+        for df_key, table_path, full_sql_query in jobs:
+            report(df_key, table_path,
+                   lambda: _read_with_retries(reader, full_sql_query, project_id, retries, retry_wait))
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(_read_with_retries, reader, full_sql_query, project_id, retries, retry_wait)
+                for _, _, full_sql_query in jobs
+            ]
+            # Report in configuration order as results become available
+            for (df_key, table_path, _), future in zip(jobs, futures):
+                report(df_key, table_path, future.result)
 
     print(f"Finished loading '{specific_data_type}' DataFrames.")
     print(f"Total '{specific_data_type}' DataFrames loaded: {len(loaded_dataframes)}")
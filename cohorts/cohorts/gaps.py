@@ -0,0 +1,167 @@
+# performance gaps to the cohort median, for every metric and rule table at once
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from .cohort_statistics import _as_group_index
+from .group_index import CohortGroupIndex
+
+# product -> [recommendation flag, KPI value, KPI percentile]
+GROWTH_METRIC_MAPPING: Dict[str, List[str]] = {
+    "VFD": ["recommend_vfd", "cvr", "cvr_percentile"],
+    "CPC": ["recommend_cpc", "impressions", "impressions_percentile"],
+    "Joker": ["recommend_joker", "new_customer_orders", "new_customer_orders_percentile"],
+    "Targeted VFD": ["recommend_targeted_vfd", "retention_rate", "retention_rate_percentile"],
+}
+
+KEY_COLUMNS = ('global_entity_id', 'cohort_id', 'vendor_id')
+
+
+def _check_metric_columns(metric_columns: Sequence[str]) -> None:
+    if len(metric_columns) != 3:
+        raise ValueError(
+            "`metric_columns` must contain exactly 3 column names: "
+            "[reco_column_name, value_column_name, percentile_column_name]"
+        )
+
+
+def compute_gaps(
+    df: DataFrame,
+    metric_mapping: Dict[str, Sequence[str]] = GROWTH_METRIC_MAPPING,
+    fill_na: bool = False,
+    key_columns: Sequence[str] = KEY_COLUMNS,
+    group_index: Optional[CohortGroupIndex] = None
+) -> DataFrame:
+    """
+    Calculates performance and percentile gaps for every metric of one rule table.
+
+    For each metric [reco, value, percentile], rows with reco == 1 get
+    'performance_gap' = cohort median of value - value and 'pc_perf_gap' =
+    0.5 - percentile; other rows get NaN. All metrics' cohort medians come from
+    one groupby transform over the matrix of value columns, aligned to the rows
+    without a merge.
+
+    Args:
+        df (DataFrame): A rule table with `key_columns` and the metric columns.
+        metric_mapping (Dict[str, Sequence[str]], optional): Metric name to
+                        [reco_column, value_column, percentile_column]. Metrics
+                        with missing columns are skipped with a message.
+                        Defaults to GROWTH_METRIC_MAPPING.
+        fill_na (bool, optional): Fill NaN values with 0 before taking medians
+                                  and gaps. Defaults to False.
+        key_columns (Sequence[str], optional): Identifying columns copied to the
+                        output; must include 'cohort_id'. Defaults to KEY_COLUMNS.
+        group_index (Optional[CohortGroupIndex], optional): A prebuilt grouping
+                        of `df` by 'cohort_id', e.g. shared with the outlier analysis.
+
+    Returns:
+        DataFrame: Long format, one row per (metric, vendor row): 'metric_name',
+                   the key columns, 'performance_gap' and 'pc_perf_gap'.
+
+    Raises:
+        ValueError: If a metric does not have exactly 3 columns.
+        KeyError: If a key column is missing.
+    """
+    missing_keys = [col for col in key_columns if col not in df.columns]
+    if missing_keys:
+        raise KeyError(f"Input DataFrame is missing required columns: {missing_keys}")
+
+    metrics = {}
+    for metric_name, metric_columns in metric_mapping.items():
+        _check_metric_columns(metric_columns)
+        missing = [col for col in metric_columns if col not in df.columns]
+        if missing:
+            print(f"  [SKIP] '{metric_name}': missing columns {missing}")
+            continue
+        metrics[metric_name] = list(metric_columns)
+
+    output_columns = ['metric_name'] + list(key_columns) + ['performance_gap', 'pc_perf_gap']
+    if not metrics:
+        return DataFrame(columns=output_columns)
+
+    group_index = _as_group_index(df, group_index if group_index is not None else 'cohort_id')
+    value_cols = list(dict.fromkeys(columns[1] for columns in metrics.values()))
+    values = df[value_cols].to_numpy(dtype=float)
+    if fill_na:
+        values = np.nan_to_num(values, nan=0.0)
+
+    # Cohort medians of every value column in one pass; rows without a cohort get NaN
+    medians = DataFrame(values, columns=value_cols).groupby(group_index.codes).transform('median').to_numpy()
+    medians[group_index.codes < 0] = np.nan
+    value_position = {col: i for i, col in enumerate(value_cols)}
+
+    performance_gaps, pc_perf_gaps = [], []
+    for reco_col, value_col, percentile_col in metrics.values():
+        recommended = pd.to_numeric(df[reco_col], errors='coerce').fillna(0).astype(int).to_numpy() == 1
+        position = value_position[value_col]
+        performance_gaps.append(np.where(recommended, medians[:, position] - values[:, position], np.nan))
+        pc_perf_gaps.append(np.where(recommended, 0.5 - df[percentile_col].to_numpy(dtype=float), np.nan))
+
+    rows = np.tile(np.arange(len(df)), len(metrics))
+    gaps = df[list(key_columns)].iloc[rows].reset_index(drop=True)
+    gaps.insert(0, 'metric_name', pd.Categorical(np.repeat(list(metrics), len(df)), categories=list(metrics)))
+    gaps['performance_gap'] = np.concatenate(performance_gaps)
+    gaps['pc_perf_gap'] = np.concatenate(pc_perf_gaps)
+    return gaps[output_columns]
+
+
+def get_gaps(df: DataFrame, metric_columns: List[str], fill_na: bool = False,
+             group_index: Optional[CohortGroupIndex] = None) -> DataFrame:
+    """
+    Calculates performance and percentile gaps for one metric within cohorts.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame, with 'global_entity_id',
+                           'cohort_id', 'vendor_id' and the `metric_columns`.
+        metric_columns (List[str]): [reco_column, value_column, percentile_column].
+        fill_na (bool): If True, fills NaN values in the value column with 0
+                        before calculating medians and gaps.
+        group_index (Optional[CohortGroupIndex]): A prebuilt grouping of `df` by 'cohort_id'.
+
+    Returns:
+        pd.DataFrame: 'global_entity_id', 'cohort_id', 'vendor_id',
+                      'performance_gap' and 'pc_perf_gap', one row per input row.
+
+    Raises:
+        ValueError: If `metric_columns` does not contain exactly 3 elements.
+        KeyError: If any required column is missing from the input DataFrame.
+    """
+    _check_metric_columns(metric_columns)
+    missing_cols = [col for col in list(KEY_COLUMNS) + list(metric_columns) if col not in df.columns]
+    if missing_cols:
+        raise KeyError(f"Input DataFrame is missing required columns: {missing_cols}")
+
+    gaps = compute_gaps(df, {'metric': metric_columns}, fill_na=fill_na, group_index=group_index)
+    return gaps.drop(columns='metric_name')
+
+
+def gaps_for_rules(
+    dataframes_dict: Dict[str, DataFrame],
+    metric_mapping: Dict[str, Sequence[str]] = GROWTH_METRIC_MAPPING,
+    fill_na: bool = False,
+    key_columns: Sequence[str] = KEY_COLUMNS,
+    group_indexes: Optional[Dict[str, CohortGroupIndex]] = None
+) -> DataFrame:
+    """
+    Gaps for every rule table and metric, in the long format used to compare
+    rules ('df_key', 'metric_name', key columns, 'performance_gap', 'pc_perf_gap').
+
+    Each table is grouped by cohort once and the grouping is shared by all
+    metrics. Pass `group_indexes` (by table name) to reuse groupings built for
+    other analyses of the same tables.
+    """
+    group_indexes = group_indexes or {}
+    all_gaps = []
+    for df_key, df_tmp in dataframes_dict.items():
+        print(f"Calculating gaps for DataFrame: {df_key}...")
+        gaps = compute_gaps(df_tmp, metric_mapping, fill_na=fill_na, key_columns=key_columns,
+                            group_index=group_indexes.get(df_key))
+        gaps.insert(0, 'df_key', df_key)
+        all_gaps.append(gaps)
+
+    if not all_gaps:
+        return DataFrame(columns=['df_key', 'metric_name'] + list(key_columns) + ['performance_gap', 'pc_perf_gap'])
+    return pd.concat(all_gaps, ignore_index=True)
@@ -0,0 +1,104 @@
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+
+
+@dataclass(frozen=True)
+class CohortGroupIndex:
+    """
+    A precomputed grouping of rows into cohorts, shared by the functions in
+    `cohort_statistics` so a rule table is only grouped once.
+
+    Build it with `from_frame` (or `from_series`) and pass it in place of the
+    cohort column name, e.g. `compare_outlier_methods(df, 'gmv', index)`.
+
+    Attributes:
+        codes (np.ndarray): Cohort code per row (int64), -1 for missing cohorts.
+        labels (pd.Index): Cohort label per code, in order of first appearance.
+        order (np.ndarray): Stable permutation of the non-missing rows that
+                            makes each cohort contiguous, cohorts in code order.
+        offsets (np.ndarray): Start of each cohort within `order`.
+        sizes (np.ndarray): Number of rows per cohort.
+        min_cohort_size (int): The size below which a cohort is ineligible.
+        eligible (np.ndarray): Boolean mask of cohorts with at least
+                               `min_cohort_size` rows.
+    """
+    codes: np.ndarray
+    labels: pd.Index
+    order: np.ndarray
+    offsets: np.ndarray
+    sizes: np.ndarray
+    min_cohort_size: int
+    eligible: np.ndarray
+
+    @classmethod
+    def from_series(cls, cohorts: Series, min_cohort_size: int = 5) -> "CohortGroupIndex":
+        """
+        Factorises a cohort column and builds the index.
+
+        Args:
+            cohorts (Series): The cohort label of each row.
+            min_cohort_size (int, optional): Minimum rows for a cohort to be
+                                             eligible. Defaults to 5.
+
+        Returns:
+            CohortGroupIndex: The group index for `cohorts`.
+        """
+        codes, labels = pd.factorize(cohorts)
+        codes = codes.astype(np.int64, copy=False)
+        sizes = np.bincount(codes[codes >= 0], minlength=len(labels))
+
+        # Missing cohorts (-1) sort first, so drop them from the front
+        order = np.argsort(codes, kind='stable')[np.count_nonzero(codes < 0):]
+        offsets = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+
+        return cls(
+            codes=codes,
+            labels=pd.Index(labels),
+            order=order,
+            offsets=offsets,
+            sizes=sizes,
+            min_cohort_size=min_cohort_size,
+            eligible=sizes >= min_cohort_size
+        )
+
+    @classmethod
+    def from_frame(cls, df: DataFrame, cohort_col: str, min_cohort_size: int = 5) -> "CohortGroupIndex":
+        """
+        Builds the index from the `cohort_col` column of `df`.
+        """
+        return cls.from_series(df[cohort_col], min_cohort_size=min_cohort_size)
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.codes)
+
+    @property
+    def num_cohorts(self) -> int:
+        return len(self.labels)
+
+    def check_length(self, df: DataFrame) -> None:
+        """
+        Raises a ValueError if `df` does not have one row per indexed row.
+        """
+        if len(df) != self.num_rows:
+            raise ValueError(
+                f"CohortGroupIndex was built for {self.num_rows} rows, "
+                f"but the DataFrame has {len(df)} rows."
+            )
+
+    def split(self, values: np.ndarray) -> List[np.ndarray]:
+        """
+        Splits `values` into one array per eligible cohort, ordered by cohort
+        label (as `DataFrame.groupby` does), keeping row order within a cohort.
+        """
+        grouped = values[self.order]
+        label_order = np.argsort(self.labels.to_numpy(), kind='stable')
+        return [
+            grouped[self.offsets[code]:self.offsets[code] + self.sizes[code]]
+            for code in label_order
+            if self.eligible[code]
+        ]
@@ -0,0 +1,306 @@
+# permutation tests for cohort separation (F and Kruskal-Wallis H)
+
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from pandas import DataFrame, Series
+
+from .cohort_statistics import _average_ranks, _eligible_samples
+from .group_index import CohortGroupIndex
+
+# Memory a batch of shuffles may use; the batch size is derived from it and n
+DEFAULT_MEMORY_BUDGET = 256 * 2**20
+# Bytes per (shuffle, row) of a batch: the row indices, the gathered values
+# and ranks, and the flat bincount codes (int64 / float64 each)
+_BYTES_PER_CELL = 4 * 8
+
+# (shared memory name, shape, dtype) of an array sent to the workers
+ArraySpec = Tuple[str, Tuple[int, ...], str]
+
+
+def _between_sums_of_squares(centred: np.ndarray, group_codes: np.ndarray,
+                             group_size: np.ndarray) -> np.ndarray:
+    """
+      sum over cohorts of (cohort sum)^2 / n for each row of `centred`, one bincount for the whole batch
+    """
+    num_permutations, _ = centred.shape
+    num_groups = len(group_size)
+    flat_codes = (group_codes[None, :] + num_groups * np.arange(num_permutations)[:, None]).ravel()
+    sums = np.bincount(flat_codes, weights=centred.ravel(),
+                       minlength=num_permutations * num_groups).reshape(num_permutations, num_groups)
+    return np.sum(sums**2 / group_size, axis=1)
+
+
+def _statistics(centred_values: np.ndarray, centred_ranks: np.ndarray,
+                group_codes: np.ndarray, group_size: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+      F and (tie-uncorrected) H for each row of a matrix of centred values / ranks in row order
+    """
+    n = centred_values.shape[1]
+    num_groups = len(group_size)
+
+    ss_between = _between_sums_of_squares(centred_values, group_codes, group_size)
+    ss_within = np.sum(centred_values[0]**2) - ss_between
+    with np.errstate(invalid='ignore', divide='ignore'):
+        f_stats = (ss_between / (num_groups - 1)) / (ss_within / (n - num_groups))
+
+    # With centred ranks, H * tie_correction = 12 / (n (n + 1)) * sum(R_g^2 / n_g)
+    h_stats = 12.0 / (n * (n + 1)) * _between_sums_of_squares(centred_ranks, group_codes, group_size)
+    return f_stats, h_stats
+
+
+def _permutation_batch(
+    centred_values: np.ndarray,
+    centred_ranks: np.ndarray,
+    group_codes: np.ndarray,
+    group_size: np.ndarray,
+    num_permutations: int,
+    seed: np.random.SeedSequence
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    F and H for one batch of random relabellings of the rows.
+
+    Shuffling the values over fixed cohort codes is the same as shuffling the
+    codes, so each batch is a (num_permutations, n) matrix of row indices and
+    the per-cohort sums of every permutation come from a single bincount.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.permuted(np.tile(np.arange(len(centred_values)), (num_permutations, 1)), axis=1)
+    return _statistics(centred_values[rows], centred_ranks[rows], group_codes, group_size)
+
+
+def permutation_batch_size(n: int, memory_budget: int = DEFAULT_MEMORY_BUDGET) -> int:
+    """
+    Shuffles per batch so one batch over `n` rows stays within
+    `memory_budget` bytes (at least one).
+    """
+    return max(1, memory_budget // (_BYTES_PER_CELL * max(n, 1)))
+
+
+def _share_arrays(arrays: Sequence[np.ndarray]) -> Tuple[List[SharedMemory], List[ArraySpec]]:
+    """
+      copy arrays into shared memory blocks once, so batches only send their names
+    """
+    blocks, specs = [], []
+    try:
+        for array in arrays:
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            specs.append((block.name, array.shape, array.dtype.str))
+    except BaseException:
+        _release_arrays(blocks)
+        raise
+    return blocks, specs
+
+
+def _release_arrays(blocks: List[SharedMemory]) -> None:
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def _shared_permutation_batch(specs: List[ArraySpec], num_permutations: int,
+                              seed: np.random.SeedSequence) -> Tuple[np.ndarray, np.ndarray]:
+    """
+      `_permutation_batch` on arrays attached from shared memory
+    """
+    blocks = [SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        arrays = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+                  for block, (_, shape, dtype) in zip(blocks, specs)]
+        result = _permutation_batch(*arrays, num_permutations, seed)
+        del arrays
+        return result
+    finally:
+        for block in blocks:
+            block.close()
+
+
+def permutation_test(
+    values: Union[np.ndarray, Series],
+    codes: Union[np.ndarray, Series, CohortGroupIndex],
+    n_permutations: int = 9999,
+    batch_size: Optional[int] = None,
+    seed: Optional[Union[int, np.random.SeedSequence]] = None,
+    min_cohort_size: int = 5,
+    codes_are_dense: bool = False,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    n_jobs: Optional[int] = None,
+    executor: Optional[Executor] = None
+) -> Dict[str, float]:
+    """
+    Permutation p-values for the one-way ANOVA F statistic and the
+    Kruskal-Wallis H statistic of a value column split by cohort.
+
+    The cohort labels are shuffled `n_permutations` times and both statistics
+    are recomputed for every shuffle. Shuffles are generated in batches of
+    `batch_size` and each batch is reduced with matrix operations (see
+    `_permutation_batch`), so no per-cohort arrays or scipy calls are made.
+    Every batch draws from its own child of `SeedSequence(seed)`, so the
+    result for a given seed does not depend on `n_jobs`.
+
+    In parallel, the values, ranks and cohort codes are copied to shared
+    memory once and every batch only sends their names, so workers do not
+    each receive the n-length arrays per batch.
+
+    p-values are (1 + #permutations with a statistic >= observed) / (1 + n_permutations).
+    The tie correction of H does not change under permutation, so it is
+    applied to the observed H only; the p-value is unaffected.
+
+    Args:
+        values (array-like): The performance values, one per row.
+        codes (array-like): The cohort of each row, as for `kruskal_wallis`.
+        n_permutations (int, optional): Number of shuffles. Defaults to 9999.
+        batch_size (Optional[int], optional): Shuffles per batch. Memory use is
+                                              about 4 * 8 * batch_size * n bytes.
+                                              Defaults to `permutation_batch_size(n,
+                                              memory_budget)`.
+        seed (Optional[Union[int, np.random.SeedSequence]], optional): Seed for
+                                    the shuffles. Defaults to None (fresh entropy).
+        min_cohort_size (int, optional): Cohorts with fewer rows are excluded.
+                                         Defaults to 5. Ignored when `codes`
+                                         is a CohortGroupIndex.
+        codes_are_dense (bool, optional): As for `kruskal_wallis`. Defaults to False.
+        memory_budget (int, optional): Bytes per batch when `batch_size` is
+                                       None. Each worker runs one batch at a
+                                       time. Defaults to DEFAULT_MEMORY_BUDGET (256 MB).
+        n_jobs (Optional[int], optional): Number of worker processes for the
+                                          batches. None or 1 runs serially; -1
+                                          uses all CPUs. Ignored if `executor` is given.
+        executor (Optional[Executor], optional): An existing executor to submit
+                                                 batches to. It is not shut down.
+
+    Returns:
+        Dict[str, float]: 'f_stat', 'f_p_value', 'kw_h', 'kw_p_value' and
+                          'n_permutations'. The statistics and p-values are
+                          np.nan when fewer than two cohorts are eligible,
+                          eligible values contain NaN or all values are identical.
+    """
+    result = {'f_stat': np.nan, 'f_p_value': np.nan, 'kw_h': np.nan,
+              'kw_p_value': np.nan, 'n_permutations': n_permutations}
+
+    eligible_samples = _eligible_samples(values, codes, min_cohort_size, codes_are_dense)
+    if eligible_samples is None:
+        return result
+    x, group_codes, group_size = eligible_samples
+    if np.isnan(x).any():
+        return result
+    n = len(x)
+
+    ranks, tie_correction = _average_ranks(x)
+    if tie_correction == 0:
+        return result
+
+    centred_values = x - x.mean()
+    centred_ranks = ranks - (n + 1) / 2.0
+    f_observed, h_observed = (stat[0] for stat in _statistics(
+        centred_values[None, :], centred_ranks[None, :], group_codes, group_size
+    ))
+
+    if batch_size is None:
+        batch_size = permutation_batch_size(n, memory_budget)
+    batch_sizes = [batch_size] * (n_permutations // batch_size)
+    if n_permutations % batch_size:
+        batch_sizes.append(n_permutations % batch_size)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    batch_seeds = seed.spawn(len(batch_sizes))
+    arrays = (centred_values, centred_ranks, group_codes, group_size)
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    if executor is None and (n_jobs is None or n_jobs <= 1):
+        batches = [_permutation_batch(*arrays, size, batch_seed)
+                   for size, batch_seed in zip(batch_sizes, batch_seeds)]
+    else:
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=min(n_jobs, max(len(batch_sizes), 1)))
+        blocks, specs = _share_arrays(arrays)
+        futures = []
+        try:
+            for size, batch_seed in zip(batch_sizes, batch_seeds):
+                futures.append(executor.submit(_shared_permutation_batch, specs, size, batch_seed))
+            batches = [future.result() for future in futures]
+        finally:
+            if own_executor:
+                executor.shutdown(cancel_futures=True)
+            else:
+                # batches still queued must not attach to released blocks
+                for future in futures:
+                    future.cancel()
+                wait(futures)
+            _release_arrays(blocks)
+
+    # Allow for rounding when a permutation reproduces the observed grouping
+    f_exceed = sum(int(np.sum(f_stats >= f_observed * (1 - 1e-12))) for f_stats, _ in batches)
+    h_exceed = sum(int(np.sum(h_stats >= h_observed * (1 - 1e-12))) for _, h_stats in batches)
+
+    result.update({
+        'f_stat': f_observed,
+        'f_p_value': (1 + f_exceed) / (1 + n_permutations),
+        'kw_h': h_observed / tie_correction,
+        'kw_p_value': (1 + h_exceed) / (1 + n_permutations)
+    })
+    return result
+
+
+def permutation_tests_for_outliers(
+    dataframes_dict: Dict[str, DataFrame],
+    value_column: str,
+    group_column: str,
+    n_permutations: int = 9999,
+    batch_size: Optional[int] = None,
+    seed: Optional[int] = None,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    n_jobs: Optional[int] = None
+) -> DataFrame:
+    """
+    Runs `permutation_test` on every rule table, as a companion to the
+    asymptotic 'p_value' and 'f_stat_scipy' of `process_dataframes_for_outliers`.
+
+    One process pool is shared by all tables, and each table gets its own
+    child of `SeedSequence(seed)`.
+
+    Args:
+        dataframes_dict (Dict[str, DataFrame]): Rule tables by name.
+        value_column (str): The name of the column with the performance values.
+        group_column (str): The name of the cohort column.
+        n_permutations (int, optional): Shuffles per table. Defaults to 9999.
+        batch_size (Optional[int], optional): Shuffles per batch. Defaults to
+                                              one sized by `memory_budget`.
+        seed (Optional[int], optional): Seed for the shuffles. Defaults to None.
+        memory_budget (int, optional): See `permutation_test`.
+        n_jobs (Optional[int], optional): Number of worker processes. None or 1
+                                          runs serially; -1 uses all CPUs.
+
+    Returns:
+        DataFrame: One row per table with 'df_name', 'f_stat', 'f_p_value',
+                   'kw_h', 'kw_p_value' and 'n_permutations'.
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs is not None and n_jobs > 1 else None
+
+    table_seeds = np.random.SeedSequence(seed).spawn(len(dataframes_dict))
+    all_results: List[Dict[str, Union[str, float]]] = []
+    try:
+        for (df_name, df_tmp), table_seed in zip(dataframes_dict.items(), table_seeds):
+            print(f"Permutation testing DataFrame: {df_name}...")
+            group_index = CohortGroupIndex.from_frame(df_tmp, group_column)
+            result = permutation_test(df_tmp[value_column], group_index,
+                                      n_permutations=n_permutations, batch_size=batch_size,
+                                      seed=table_seed, memory_budget=memory_budget,
+                                      executor=executor)
+            all_results.append({'df_name': df_name, **result})
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    return DataFrame(all_results, columns=['df_name', 'f_stat', 'f_p_value', 'kw_h',
+                                           'kw_p_value', 'n_permutations'])
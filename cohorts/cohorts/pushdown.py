@@ -0,0 +1,343 @@
+# push per-cohort aggregation into SQL, so only one row per cohort is transferred
+
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+import pandas_gbq
+from pandas import DataFrame
+
+from .cohort_statistics import _read_with_retries, anova_from_moments
+from .config_manager import TableConfig
+
+# Integer division differs between engines; everything else in the generated
+# SQL is standard (CTEs, window functions, CASE, COALESCE).
+_INTEGER_DIVISION = {
+    'bigquery': "DIV({numerator}, {denominator})",
+    'sqlite': "(({numerator}) / ({denominator}))",
+}
+
+_QUARTILES = {'q1': 1, 'median': 2, 'q3': 3}
+
+
+def build_cohort_aggregate_sql(
+    table_path: str,
+    value_column: str,
+    cohort_column: str = 'cohort_id',
+    fill_value: Optional[float] = None,
+    iqr_multiplier: float = 3,
+    mean_multiplier: float = 5,
+    dialect: str = 'bigquery'
+) -> str:
+    """
+    Generates SQL that reduces a vendor-level table to one row per cohort.
+
+    The query returns, per cohort: 'cohort_size' (all rows), 'count', 'sum',
+    'sum_sq' and 'm2' (centred sum of squares) of the non-null values, 'mean',
+    linear-interpolated 'q1', 'median' and 'q3' (the same definition as pandas),
+    and the counts of IQR outliers, mean-multiple outliers and their overlap, as
+    used by `compare_outlier_methods`.
+
+    Args:
+        table_path (str): Table to aggregate, e.g. a path from `TableConfig`.
+        value_column (str): Numeric column to summarise.
+        cohort_column (str, optional): Cohort column. Defaults to 'cohort_id'.
+        fill_value (Optional[float], optional): Replace NULL values with this
+                                                before aggregating. NaN leaves them
+                                                NULL, as `fillna(np.nan)` would.
+                                                Defaults to None.
+        iqr_multiplier (float, optional): IQR multiplier for outliers. Defaults to 3.
+        mean_multiplier (float, optional): Mean multiple for outliers. Defaults to 5.
+        dialect (str, optional): 'bigquery' (default) or 'sqlite'.
+
+    Returns:
+        str: The SQL query.
+
+    Raises:
+        ValueError: If `dialect` is not supported, or `fill_value` is infinite
+                    (neither engine has a float literal for it).
+    """
+    if dialect not in _INTEGER_DIVISION:
+        raise ValueError(f"Unknown dialect '{dialect}'. Expected one of {sorted(_INTEGER_DIVISION)}.")
+    int_div = _INTEGER_DIVISION[dialect]
+
+    value_expr = f"1.0 * t.{value_column}"
+    if fill_value is not None:
+        fill_value = float(fill_value)
+        if np.isinf(fill_value):
+            raise ValueError(f"fill_value must be finite or NaN, got {fill_value}.")
+        # repr(nan) is 'nan', which is not SQL
+        fill_sql = "NULL" if np.isnan(fill_value) else repr(fill_value)
+        value_expr = f"COALESCE({value_expr}, {fill_sql})"
+
+    quartile_columns: List[str] = []
+    quartile_values: List[str] = []
+    for name, k in _QUARTILES.items():
+        lower = int_div.format(numerator=f"(n_valid - 1) * {k}", denominator="4")
+        quartile_columns += [
+            f"MAX(CASE WHEN rn = {lower} THEN value END) AS {name}_lo",
+            f"MAX(CASE WHEN rn = {lower} + 1 THEN value END) AS {name}_hi",
+            f"MAX(((n_valid - 1) * {k} - 4 * {lower}) / 4.0) AS {name}_frac",
+        ]
+        quartile_values.append(
+            f"{name}_lo + (COALESCE({name}_hi, {name}_lo) - {name}_lo) * {name}_frac AS {name}"
+        )
+    quartile_columns_sql = ",\n    ".join(quartile_columns)
+    quartile_values_sql = ",\n    ".join(quartile_values)
+
+    return f"""
+WITH base AS (
+  SELECT
+    t.{cohort_column} AS cohort,
+    {value_expr} AS value
+  FROM `{table_path}` AS t
+  WHERE t.{cohort_column} IS NOT NULL
+),
+ranked AS (
+  SELECT
+    cohort,
+    value,
+    ROW_NUMBER() OVER (PARTITION BY cohort ORDER BY value) - 1 AS rn,
+    COUNT(*) OVER (PARTITION BY cohort) AS n_valid
+  FROM base
+  WHERE value IS NOT NULL
+),
+quartile_parts AS (
+  SELECT
+    cohort,
+    {quartile_columns_sql}
+  FROM ranked
+  GROUP BY cohort
+),
+quartiles AS (
+  SELECT
+    cohort,
+    {quartile_values_sql}
+  FROM quartile_parts
+),
+moments AS (
+  SELECT
+    cohort,
+    COUNT(*) AS cohort_size,
+    COUNT(value) AS count,
+    SUM(value) AS sum,
+    SUM(value * value) AS sum_sq,
+    AVG(value) AS mean
+  FROM base
+  GROUP BY cohort
+),
+bounds AS (
+  SELECT
+    m.*,
+    q.q1,
+    q.median,
+    q.q3,
+    q.q1 - {iqr_multiplier} * (q.q3 - q.q1) AS lower_bound,
+    q.q3 + {iqr_multiplier} * (q.q3 - q.q1) AS upper_bound
+  FROM moments AS m
+  LEFT JOIN quartiles AS q ON q.cohort = m.cohort
+),
+row_flags AS (
+  SELECT
+    x.cohort,
+    SUM((x.value - b.mean) * (x.value - b.mean)) AS m2,
+    SUM(CASE WHEN x.value < b.lower_bound OR x.value > b.upper_bound THEN 1 ELSE 0 END) AS iqr_outliers,
+    SUM(CASE WHEN x.value > {mean_multiplier} * b.mean THEN 1 ELSE 0 END) AS mean_5x_outliers,
+    SUM(CASE WHEN (x.value < b.lower_bound OR x.value > b.upper_bound)
+              AND x.value > {mean_multiplier} * b.mean THEN 1 ELSE 0 END) AS overlap_iqr_mean
+  FROM base AS x
+  JOIN bounds AS b ON b.cohort = x.cohort
+  GROUP BY x.cohort
+)
+SELECT
+  b.cohort,
+  b.cohort_size,
+  b.count,
+  b.sum,
+  b.sum_sq,
+  f.m2,
+  b.mean,
+  b.q1,
+  b.median,
+  b.q3,
+  f.iqr_outliers,
+  f.mean_5x_outliers,
+  f.overlap_iqr_mean
+FROM bounds AS b
+JOIN row_flags AS f ON f.cohort = b.cohort
+"""
+
+
+def aggregates_to_outlier_comparison(aggregates: DataFrame, min_cohort_size: int = 5) -> DataFrame:
+    """
+    Converts per-cohort aggregates into the `compare_outlier_methods` schema.
+
+    Args:
+        aggregates (DataFrame): The result of the `build_cohort_aggregate_sql` query.
+        min_cohort_size (int, optional): Cohorts with fewer rows are dropped. Defaults to 5.
+
+    Returns:
+        DataFrame: One row per eligible cohort with the same columns as
+                   `compare_outlier_methods`.
+    """
+    eligible = aggregates.loc[aggregates['cohort_size'] >= min_cohort_size]
+    return DataFrame({
+        'cohort': eligible['cohort'],
+        'cohort_size': eligible['cohort_size'],
+        'mean': eligible['mean'],
+        'median': eligible['median'],
+        'iqr_outliers': eligible['iqr_outliers'].fillna(0).astype(np.int64),
+        'mean_5x_outliers': eligible['mean_5x_outliers'].fillna(0).astype(np.int64),
+        'iqr_pct': eligible['iqr_outliers'].fillna(0) / eligible['cohort_size'] * 100,
+        'mean_5x_pct': eligible['mean_5x_outliers'].fillna(0) / eligible['cohort_size'] * 100,
+        'overlap_iqr_mean': eligible['overlap_iqr_mean'].fillna(0).astype(np.int64)
+    }).reset_index(drop=True)
+
+
+def summarise_cohort_aggregates(
+    df_name: str,
+    aggregates: DataFrame,
+    min_cohort_size: int = 5
+) -> Dict[str, Union[str, float]]:
+    """
+    Builds one `process_dataframes_for_outliers` summary row from per-cohort aggregates.
+
+    Outlier shares and totals, F, MS_between and MS_within are computed from the
+    aggregates. Kruskal-Wallis and scipy's F need the raw rows, so 'KW_H',
+    'epsilon_squared', 'p_value' and 'f_stat_scipy' are np.nan.
+
+    Args:
+        df_name (str): Name reported in the 'df_name' field.
+        aggregates (DataFrame): The result of the `build_cohort_aggregate_sql` query.
+        min_cohort_size (int, optional): Minimum cohort size. Defaults to 5.
+
+    Returns:
+        Dict[str, Union[str, float]]: The summary row.
+    """
+    outlier_comparison = aggregates_to_outlier_comparison(aggregates, min_cohort_size)
+
+    moments = aggregates.set_index('cohort')[['count', 'sum', 'm2']].fillna(0)
+    # Eligibility is on rows, as in get_groups, so filter before anova_from_moments
+    moments = moments.loc[aggregates.set_index('cohort')['cohort_size'] >= min_cohort_size]
+    try:
+        f_manual, ms_b_manual, ms_w_manual = anova_from_moments(moments, min_cohort_size=1)
+    except ValueError:
+        f_manual, ms_b_manual, ms_w_manual = np.nan, np.nan, np.nan
+
+    if not outlier_comparison.empty:
+        share_cohorts_with_outlier_IQR = (outlier_comparison['iqr_outliers'] > 0).mean()
+        share_cohorts_with_outlier_5x = (outlier_comparison['mean_5x_outliers'] > 0).mean()
+        iqr_total_outliers = outlier_comparison['iqr_outliers'].sum()
+        mean_5x_total_outliers = outlier_comparison['mean_5x_outliers'].sum()
+        overlap_total_vendors = outlier_comparison['overlap_iqr_mean'].sum()
+    else:
+        share_cohorts_with_outlier_IQR = 0.0
+        share_cohorts_with_outlier_5x = 0.0
+        iqr_total_outliers = 0
+        mean_5x_total_outliers = 0
+        overlap_total_vendors = 0
+
+    return {
+        'df_name': df_name,
+        'share_cohorts_with_outlier_IQR': share_cohorts_with_outlier_IQR,
+        'share_cohorts_with_outlier_5x': share_cohorts_with_outlier_5x,
+        'iqr_total_outliers': iqr_total_outliers,
+        'mean_5x_total_outliers': mean_5x_total_outliers,
+        'overlap_total_vendors': overlap_total_vendors,
+        'KW_H': np.nan,
+        'epsilon_squared': np.nan,
+        'p_value': np.nan,
+        'f_stat_scipy': np.nan,
+        'f_stat_manual': f_manual,
+        'ms_b_manual': ms_b_manual,
+        'ms_w_manual': ms_w_manual
+    }
+
+
+def process_tables_for_outliers_pushdown(
+    specific_data_type: str,
+    config: TableConfig,
+    value_column: str,
+    project_id: str,
+    group_column: str = 'cohort_id',
+    fill_value: Optional[float] = None,
+    reader: Optional[Callable[..., DataFrame]] = None,
+    dialect: str = 'bigquery',
+    retries: int = 0,
+    retry_wait: float = 1.0
+) -> DataFrame:
+    """
+    Push-down version of `load_dataframes_by_type` + `process_dataframes_for_outliers`.
+
+    For every configured table of `specific_data_type`, runs the per-cohort
+    aggregate query and summarises the result locally, so only one row per
+    cohort is transferred instead of one row per vendor.
+
+    As in `load_dataframes_by_type`, failed queries are retried, and a table
+    whose path is missing from `config` or whose query keeps failing is
+    skipped and reported, so the other tables are still summarised.
+
+    Args:
+        specific_data_type (str): Data type in `config`, e.g. "recommendation (KPIs)".
+        config (TableConfig): Table path configuration.
+        value_column (str): Numeric column to analyse.
+        project_id (str): Google Cloud Project ID passed to the reader.
+        group_column (str, optional): Cohort column. Defaults to 'cohort_id'.
+        fill_value (Optional[float], optional): Replace NULL values before
+                                                aggregating, as the notebooks do
+                                                with `fillna`. Defaults to None.
+        reader (Optional[Callable[..., DataFrame]], optional): Called as
+                    `reader(sql_query, project_id=project_id)`. Defaults to
+                    `pandas_gbq.read_gbq`.
+        dialect (str, optional): SQL dialect of the reader. Defaults to 'bigquery'.
+        retries (int, optional): Extra attempts per query after a failure. Defaults to 0.
+        retry_wait (float, optional): Seconds before the first retry, growing
+                                      linearly. Defaults to 1.0.
+
+    Returns:
+        DataFrame: The `process_dataframes_for_outliers` summary, one row per
+                   summarised table, keyed "Category-Parity-DataType-Version"
+                   in 'df_name'.
+    """
+    if reader is None:
+        reader = pandas_gbq.read_gbq
+
+    all_results = []
+    skipped_info: List[str] = []
+    for category in config.get_categories():
+        for parity in config.get_parities(category):
+            if specific_data_type not in config.get_data_types(category, parity):
+                continue
+            for version in config.get_versions(category, parity, specific_data_type):
+                df_key = f"{category}-{parity}-{specific_data_type}-{version}"
+                print(f"Aggregating: Key='{df_key}'")
+                try:
+                    table_path = config.get_path(category, parity, specific_data_type, version)
+                except KeyError as e:
+                    error_msg = f"Configuration error for {df_key}: {e}"
+                    skipped_info.append(error_msg)
+                    print(f"  [ERROR] {error_msg}")
+                    continue
+
+                sql_query = build_cohort_aggregate_sql(
+                    table_path, value_column, group_column, fill_value=fill_value, dialect=dialect
+                )
+                try:
+                    aggregates = _read_with_retries(reader, sql_query, project_id, retries, retry_wait)
+                    summary = summarise_cohort_aggregates(df_key, aggregates)
+                except Exception as e:
+                    error_msg = f"Failed to aggregate {table_path} (Key: {df_key}): {e}"
+                    skipped_info.append(error_msg)
+                    print(f"  [ERROR] {error_msg}")
+                    continue
+                print(f"  Received {len(aggregates)} cohort rows.")
+                all_results.append(summary)
+
+    if skipped_info:
+        print(f"Skipped {len(skipped_info)} tables due to errors:\n- " + "\n- ".join(skipped_info))
+
+    return DataFrame(all_results, columns=[
+        'df_name', 'share_cohorts_with_outlier_IQR', 'share_cohorts_with_outlier_5x',
+        'iqr_total_outliers', 'mean_5x_total_outliers', 'overlap_total_vendors',
+        'KW_H', 'epsilon_squared', 'p_value', 'f_stat_scipy', 'f_stat_manual',
+        'ms_b_manual', 'ms_w_manual'
+    ])
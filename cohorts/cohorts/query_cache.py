@@ -0,0 +1,205 @@
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+import pandas as pd
+from pandas import DataFrame
+
+# One lock per cache directory, shared by every QueryCache on it in this process
+_DIR_LOCKS: Dict[Path, threading.Lock] = {}
+
+
+@dataclass(frozen=True)
+class QueryCache:
+    """
+    A content-addressed, on-disk Parquet cache for query results.
+
+    Entries are keyed by the SHA-256 of the project id and the rendered SQL, so
+    the same query against the same (frozen) table path is only run once.
+    Reading an entry marks it as recently used; when the cache grows beyond
+    `max_bytes`, the least recently used entries are deleted first.
+
+    Entries are only ever written to a temporary file and renamed into place.
+    Readers open an entry under a per-directory lock that eviction also takes,
+    so an entry cannot be deleted between being found and being opened; once
+    open, deleting it does not affect the read.
+
+    Args:
+        cache_dir (Union[str, Path]): Directory holding the Parquet files. Created
+                                      if it does not exist.
+        ttl_seconds (Optional[float]): Entries older than this are treated as
+                                       missing and refreshed. None (default) never expires.
+        max_bytes (Optional[int]): Size limit for the cache directory. None
+                                   (default) means unlimited.
+
+    Example:
+        cache = QueryCache("~/.cache/cohorts", ttl_seconds=7 * 24 * 3600, max_bytes=5 * 1024**3)
+        dfs = load_dataframes_by_type("cohort data", BASE_SQL_QUERY, TableConfig(),
+                                      BQ_PROJECT_ID, cache=cache)
+    """
+    cache_dir: Union[str, Path]
+    ttl_seconds: Optional[float] = None
+    max_bytes: Optional[int] = None
+
+    def __post_init__(self):
+        """
+        Normalises `cache_dir` to an absolute Path and creates it.
+        """
+        cache_dir = Path(self.cache_dir).expanduser().resolve()
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        object.__setattr__(self, 'cache_dir', cache_dir)
+
+    @staticmethod
+    def key(sql_query: str, project_id: str) -> str:
+        """
+        Returns the cache key (a hex digest) for a query run in a project.
+        """
+        return hashlib.sha256(f"{project_id}\n{sql_query}".encode('utf-8')).hexdigest()
+
+    def path(self, sql_query: str, project_id: str) -> Path:
+        """
+        Returns the Parquet file path for a query run in a project.
+        """
+        return self.cache_dir / f"{self.key(sql_query, project_id)}.parquet"
+
+    @property
+    def _lock(self) -> threading.Lock:
+        return _DIR_LOCKS.setdefault(self.cache_dir, threading.Lock())
+
+    def _entries(self) -> List[Path]:
+        return list(self.cache_dir.glob("*.parquet"))
+
+    def get(self, sql_query: str, project_id: str) -> Optional[DataFrame]:
+        """
+        Returns the cached result, or None if it is missing or expired.
+        """
+        path = self.path(sql_query, project_id)
+        with self._lock:
+            try:
+                modified = path.stat().st_mtime
+            except FileNotFoundError:
+                return None
+
+            # Entries keep their write time in mtime, while atime records the last read
+            if self.ttl_seconds is not None and time.time() - modified > self.ttl_seconds:
+                return None
+
+            try:
+                handle = open(path, 'rb')
+            except FileNotFoundError:
+                return None
+            os.utime(path, (time.time(), modified))
+
+        with handle:
+            try:
+                return pd.read_parquet(handle)
+            except (OSError, ValueError):
+                # Treat unreadable (e.g. partially written by a crashed run) entries as missing
+                return None
+
+    def put(self, sql_query: str, project_id: str, df: DataFrame) -> Path:
+        """
+        Stores a result, then evicts old entries if the cache is over its size limit.
+        """
+        path = self.path(sql_query, project_id)
+        # Write to a temporary file first so readers never see a partial entry
+        tmp_path = path.with_suffix(f".{os.getpid()}.{time.monotonic_ns()}.tmp")
+        try:
+            df.to_parquet(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self.evict()
+        return path
+
+    def evict(self) -> List[Path]:
+        """
+        Deletes expired entries, then least recently used entries until the
+        cache fits within `max_bytes`.
+
+        Returns:
+            List[Path]: The deleted entries.
+        """
+        removed: List[Path] = []
+        entries = []
+        now = time.time()
+        with self._lock:
+            for path in self._entries():
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if self.ttl_seconds is not None and now - stat.st_mtime > self.ttl_seconds:
+                    if self._unlink(path):
+                        removed.append(path)
+                else:
+                    entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+
+            if self.max_bytes is not None:
+                total = sum(size for _, size, _ in entries)
+                for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+                    if total <= self.max_bytes:
+                        break
+                    if self._unlink(path):
+                        removed.append(path)
+                        total -= size
+
+        return removed
+
+    @staticmethod
+    def _unlink(path: Path) -> bool:
+        """
+          delete an entry; False if it is still open elsewhere (Windows) and must wait
+        """
+        try:
+            path.unlink(missing_ok=True)
+        except PermissionError:
+            return False
+        return True
+
+    def clear(self) -> None:
+        """
+        Deletes every entry.
+        """
+        with self._lock:
+            for path in self._entries():
+                self._unlink(path)
+
+    def cached_reader(
+        self,
+        reader: Callable[..., DataFrame],
+        force_refresh: bool = False
+    ) -> Callable[..., DataFrame]:
+        """
+        Wraps a `reader(sql_query, project_id=...)` callable so results are
+        served from the cache, and cache misses are read and stored.
+
+        Storing happens after the read has returned, and a failed write is
+        reported and otherwise ignored, so it never fails (or retries) a
+        successful query.
+
+        Args:
+            reader (Callable[..., DataFrame]): The underlying reader, e.g. `pandas_gbq.read_gbq`.
+            force_refresh (bool, optional): Always call `reader` and overwrite the
+                                            cached entry. Defaults to False.
+
+        Returns:
+            Callable[..., DataFrame]: A reader with the same call signature.
+        """
+        def read(sql_query: str, project_id: str) -> DataFrame:
+            if not force_refresh:
+                cached = self.get(sql_query, project_id)
+                if cached is not None:
+                    return cached
+            df = reader(sql_query, project_id=project_id)
+            try:
+                self.put(sql_query, project_id, df)
+            except Exception as e:
+                print(f"  [WARNING] Could not cache the result in {self.cache_dir}: {type(e).__name__}: {e}")
+            return df
+
+        return read
@@ -0,0 +1,197 @@
+# score many candidate cohort rules from one pass over the vendor base
+
+from dataclasses import dataclass, field
+from itertools import combinations
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pandas import DataFrame
+
+from .cohort_statistics import anova_from_moments, get_cohort_moments
+
+FEATURE_DIMENSIONS = ('entity', 'city', 'area', 'budget', 'cuisine', 'vendor_grade',
+                      'key_account_sub_category')
+
+
+def _rollup(cells: DataFrame, dimensions: Sequence[str]) -> DataFrame:
+    """
+      merge per-cell moments into the coarser grouping by `dimensions`.
+      m2 gains the spread of the cell means around the new group mean (Chan et al.)
+    """
+    dimensions = list(dimensions)
+    codes = cells.groupby(dimensions, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    keys = cells[dimensions].drop_duplicates(ignore_index=True)
+
+    num_groups = len(keys)
+    count = cells['count'].to_numpy(dtype=float)
+    total = cells['sum'].to_numpy()
+    group_count = np.bincount(codes, weights=count, minlength=num_groups)
+    group_sum = np.bincount(codes, weights=total, minlength=num_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cell_mean = np.where(count > 0, total / np.where(count > 0, count, 1), 0.0)
+        group_mean = np.where(group_count > 0, group_sum / np.where(group_count > 0, group_count, 1), 0.0)
+    spread = count * (cell_mean - group_mean[codes])**2
+
+    return keys.assign(
+        rows=np.bincount(codes, weights=cells['rows'].to_numpy(), minlength=num_groups).astype(np.int64),
+        count=group_count.astype(np.int64),
+        sum=group_sum,
+        m2=np.bincount(codes, weights=cells['m2'].to_numpy() + spread, minlength=num_groups)
+    )
+
+
+@dataclass
+class RuleLattice:
+    """
+    Per-cohort sufficient statistics for every combination of feature
+    dimensions, computed from one pass over the vendor base.
+
+    The rows are reduced once to cells at the finest grain (all dimensions).
+    Any subset of the dimensions is then a CUBE-style rollup of those cells:
+    counts and sums add up, and 'm2' is merged with the same pairwise update as
+    `combine_cohort_moments`. Rollups are cached and each new one starts from
+    the smallest cached grouping that contains it, so a full sweep touches the
+    vendor rows only once.
+
+    Build it with `from_frame`.
+
+    Attributes:
+        dimensions (Tuple[str, ...]): The feature columns making up the finest grain.
+        cells (DataFrame): One row per distinct combination of `dimensions`,
+                           with 'rows' (vendors), 'count' (non-NaN values),
+                           'sum' and 'm2'.
+    """
+    dimensions: Tuple[str, ...]
+    cells: DataFrame
+    _rollups: Dict[FrozenSet[str], DataFrame] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_frame(cls, df: DataFrame, value_column: str,
+                   dimensions: Sequence[str] = FEATURE_DIMENSIONS) -> "RuleLattice":
+        """
+        Reduces a vendor-level frame to finest-grain cells.
+
+        Args:
+            df (DataFrame): One row per vendor, with the feature columns and `value_column`.
+            value_column (str): The performance column to score rules on.
+            dimensions (Sequence[str], optional): Feature columns. Missing
+                                                  values form their own category.
+                                                  Defaults to FEATURE_DIMENSIONS.
+
+        Returns:
+            RuleLattice: The lattice of `df`.
+        """
+        dimensions = tuple(dimensions)
+        cell_codes = df.groupby(list(dimensions), sort=False, observed=True, dropna=False).ngroup()
+        moments = get_cohort_moments(df.assign(_cell=cell_codes.to_numpy()), value_column, '_cell')
+        keys = df[list(dimensions)].drop_duplicates(ignore_index=True)
+        cells = keys.assign(
+            rows=np.bincount(cell_codes.to_numpy(), minlength=len(keys)).astype(np.int64),
+            count=moments['count'].to_numpy(),
+            sum=moments['sum'].to_numpy(),
+            m2=moments['m2'].to_numpy()
+        )
+        return cls(dimensions=dimensions, cells=cells,
+                   _rollups={frozenset(dimensions): cells})
+
+    def rollup(self, dimensions: Iterable[str]) -> DataFrame:
+        """
+        Returns the per-cohort moments when cohorts are defined by `dimensions`.
+
+        Args:
+            dimensions (Iterable[str]): A non-empty subset of the lattice's dimensions.
+
+        Returns:
+            DataFrame: One row per cohort with the dimension columns, 'rows',
+                       'count', 'sum' and 'm2'.
+
+        Raises:
+            ValueError: If `dimensions` is empty or not a subset of the lattice's dimensions.
+        """
+        key = frozenset(dimensions)
+        if not key:
+            raise ValueError("A cohort rule needs at least one dimension.")
+        unknown = key - set(self.dimensions)
+        if unknown:
+            raise ValueError(f"Unknown dimensions: {sorted(unknown)}")
+        if key not in self._rollups:
+            parent = min((rollup for parent_key, rollup in self._rollups.items() if key < parent_key),
+                         key=len)
+            ordered = [dim for dim in self.dimensions if dim in key]
+            self._rollups[key] = _rollup(parent[ordered + ['rows', 'count', 'sum', 'm2']], ordered)
+        return self._rollups[key]
+
+
+def all_rules(dimensions: Sequence[str], max_dimensions: Optional[int] = None) -> List[Tuple[str, ...]]:
+    """
+    Every non-empty combination of `dimensions` (up to `max_dimensions` long),
+    finest first.
+    """
+    max_dimensions = len(dimensions) if max_dimensions is None else max_dimensions
+    return [rule for size in range(max_dimensions, 0, -1) for rule in combinations(dimensions, size)]
+
+
+def sweep_cohort_rules(
+    df: DataFrame,
+    value_column: str,
+    dimensions: Sequence[str] = FEATURE_DIMENSIONS,
+    rules: Optional[Sequence[Sequence[str]]] = None,
+    min_cohort_size: int = 5
+) -> DataFrame:
+    """
+    Scores candidate cohort rules on a vendor base without materialising a
+    table per rule.
+
+    Args:
+        df (DataFrame): One row per vendor, with the feature columns and `value_column`.
+        value_column (str): The performance column, e.g. 'gmv'.
+        dimensions (Sequence[str], optional): Feature columns available to the
+                                              rules. Defaults to FEATURE_DIMENSIONS.
+        rules (Optional[Sequence[Sequence[str]]], optional): The rules to score,
+                                              each a list of dimensions. Defaults
+                                              to every combination (`all_rules`).
+        min_cohort_size (int, optional): Cohorts with fewer non-NaN values are
+                                         left out of the ANOVA. Defaults to 5.
+
+    Returns:
+        DataFrame: One row per rule, in the order given, with 'rule', 'n_dimensions',
+                   'n_cohorts', 'n_eligible_cohorts', 'share_vendors_eligible',
+                   'f_stat', 'ms_b', 'ms_w' and the cohort size distribution
+                   ('size_min', 'size_p25', 'size_median', 'size_p75', 'size_max').
+                   F statistics are np.nan when fewer than two cohorts are eligible.
+    """
+    lattice = RuleLattice.from_frame(df, value_column, dimensions)
+    if rules is None:
+        rules = all_rules(lattice.dimensions)
+
+    all_results = []
+    for rule in rules:
+        moments = lattice.rollup(rule)
+        sizes = moments['rows'].to_numpy()
+        eligible = moments['count'].to_numpy() >= min_cohort_size
+        try:
+            f_stat, ms_b, ms_w = anova_from_moments(moments, min_cohort_size=min_cohort_size)
+        except ValueError:
+            f_stat, ms_b, ms_w = np.nan, np.nan, np.nan
+        size_quantiles = np.quantile(sizes, [0, 0.25, 0.5, 0.75, 1])
+
+        all_results.append({
+            'rule': ' + '.join(rule),
+            'n_dimensions': len(rule),
+            'n_cohorts': len(moments),
+            'n_eligible_cohorts': int(eligible.sum()),
+            'share_vendors_eligible': sizes[eligible].sum() / sizes.sum() if sizes.sum() else np.nan,
+            'f_stat': f_stat,
+            'ms_b': ms_b,
+            'ms_w': ms_w,
+            'size_min': size_quantiles[0],
+            'size_p25': size_quantiles[1],
+            'size_median': size_quantiles[2],
+            'size_p75': size_quantiles[3],
+            'size_max': size_quantiles[4]
+        })
+
+    return DataFrame(all_results, columns=[
+        'rule', 'n_dimensions', 'n_cohorts', 'n_eligible_cohorts', 'share_vendors_eligible',
+        'f_stat', 'ms_b', 'ms_w', 'size_min', 'size_p25', 'size_median', 'size_p75', 'size_max'
+    ])
@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from typing import Tuple
+
+import pandas as pd
+from pandas import DataFrame, Series
+from pandas.api.types import is_integer_dtype, is_object_dtype, is_string_dtype
+
+ARROW_STRING = "string[pyarrow]"
+
+
+@dataclass(frozen=True)
+class FrameSchema:
+    """
+    A declared, compact set of dtypes for a loaded cohort or KPI table.
+
+    - Key columns (entity, vendor and cohort ids) and repeated JSON blobs are
+      dictionary encoded as pandas categoricals.
+    - Free-text columns are stored as Arrow-backed strings.
+    - Value columns are parsed to numbers once, at load time, with invalid
+      entries coerced to NaN, and optionally downcast (float32 / smallest int).
+
+    Columns a schema names but a frame lacks are ignored, so one schema can be
+    shared by all versions of a table.
+
+    Args:
+        key_columns (Tuple[str, ...]): Columns to store as categoricals.
+        category_columns (Tuple[str, ...]): Other low-cardinality columns (e.g.
+                                            'cohort_features') to store as categoricals.
+        numeric_columns (Tuple[str, ...]): Columns to parse as numbers.
+        downcast (bool): Downcast numeric columns. Defaults to True.
+        strings_to_arrow (bool): Convert any remaining object columns holding
+                                 strings to Arrow strings. Defaults to True.
+    """
+    key_columns: Tuple[str, ...] = ()
+    category_columns: Tuple[str, ...] = ()
+    numeric_columns: Tuple[str, ...] = ()
+    downcast: bool = True
+    strings_to_arrow: bool = True
+
+    def _to_numeric(self, column: Series) -> Series:
+        parsed = pd.to_numeric(column, errors='coerce')
+        if not self.downcast:
+            return parsed
+        if is_integer_dtype(parsed):
+            return pd.to_numeric(parsed, downcast='integer')
+        return pd.to_numeric(parsed, downcast='float')
+
+    def apply(self, df: DataFrame) -> DataFrame:
+        """
+        Returns a copy of `df` with the schema's dtypes applied. `df` is not modified.
+        """
+        converted = {}
+        for col in self.key_columns + self.category_columns:
+            if col in df.columns:
+                converted[col] = df[col].astype('category')
+        for col in self.numeric_columns:
+            if col in df.columns:
+                converted[col] = self._to_numeric(df[col])
+        if self.strings_to_arrow:
+            for col in df.columns:
+                if col in converted:
+                    continue
+                if is_object_dtype(df[col]) and is_string_dtype(df[col].dropna()):
+                    converted[col] = df[col].astype(ARROW_STRING)
+        return df.assign(**converted)
+
+
+_KEY_COLUMNS = ('entity_id', 'vendor_code', 'global_entity_id', 'vendor_id', 'cohort_id')
+
+# Vendor-to-cohort tables ("cohort data")
+COHORT_DATA_SCHEMA = FrameSchema(
+    key_columns=_KEY_COLUMNS,
+    category_columns=('cohort_features', 'entity', 'city', 'area', 'budget', 'cuisine',
+                      'vendor_grade', 'key_account_sub_category'),
+    numeric_columns=('num_vendors',)
+)
+
+# Vendor KPI tables ("recommendation (KPIs)")
+KPI_SCHEMA = FrameSchema(
+    key_columns=_KEY_COLUMNS,
+    category_columns=('cohort_features',),
+    numeric_columns=(
+        'gmv', 'cvr', 'cvr_percentile', 'impressions', 'impressions_percentile',
+        'new_customer_orders', 'new_customer_orders_percentile', 'retention_rate',
+        'retention_rate_percentile', 'recent_avoidable_waiting_time', 'recent_offline_rate'
+    )
+)
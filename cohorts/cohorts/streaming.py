@@ -0,0 +1,420 @@
+# out-of-core outlier analysis: per-cohort mergeable state updated batch by batch
+
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from .cohort_statistics import anova_from_moments, combine_cohort_moments, get_cohort_moments
+from .group_index import CohortGroupIndex
+
+
+# Capacity of each level relative to the one above it (KLL's c)
+CAPACITY_DECAY = 2 / 3
+
+
+class KLLSketch:
+    """
+    A mergeable KLL quantile sketch.
+
+    Values enter level 0 with weight 1. When a level holds more than its
+    capacity it is sorted, and every other item (random offset) is promoted
+    to the next level with double weight. The top level holds up to `k`
+    items, and each level below it holds up to CAPACITY_DECAY times as many
+    as the level above, with a minimum of 2. The whole sketch therefore keeps
+    about k / (1 - CAPACITY_DECAY) = 3k items, whatever n is. While no
+    compaction has happened, the sketch holds every value and all answers
+    are exact.
+
+    Each compaction at level h moves the rank of any query point by 0 or
+    +/-2**h with equal probability. The sketch sums the squared weights of
+    the compactions that actually happened and reports a Hoeffding bound on
+    the rank error, so the bound does not rely on the asymptotic KLL analysis.
+
+    Args:
+        k (int, optional): Capacity of the top level. Larger is more accurate. Defaults to 200.
+        rng (Optional[np.random.Generator], optional): Source of compaction offsets.
+    """
+
+    def __init__(self, k: int = 200, rng: Optional[np.random.Generator] = None):
+        if k < 2:
+            raise ValueError("k must be at least 2.")
+        self.k = k
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self.n = 0
+        self.variance = 0.0
+        self._rng = rng if rng is not None else np.random.default_rng()
+        self._view: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def capacity(self, h: int) -> int:
+        """
+        Items level `h` may hold before it is compacted.
+        """
+        depth = len(self.levels) - 1 - h
+        return max(2, int(np.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def update(self, values: Union[np.ndarray, Sequence[float]]) -> None:
+        """
+        Adds a batch of (non-NaN) values.
+        """
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self.n += len(values)
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        """
+        Adds the contents of another sketch in place.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate((self.levels[h], level))
+        self.n += other.n
+        self.variance += other.variance
+        self._compress()
+
+    def _compress(self) -> None:
+        self._view = None
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self.capacity(h):
+                level = np.sort(level)
+                paired = len(level) - len(level) % 2
+                offset = self._rng.integers(2)
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate((self.levels[h + 1], level[offset:paired:2]))
+                self.levels[h] = level[paired:]
+                self.variance += float(4 ** h)
+            h += 1
+
+    @property
+    def exact(self) -> bool:
+        """
+        True while no compaction has happened.
+        """
+        return self.variance == 0
+
+    def _sorted_items(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+          items sorted, their cumulative weights and their centre ranks; cached until the next change
+        """
+        if self._view is None:
+            items = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+            order = np.argsort(items, kind='stable')
+            items, weights = items[order], weights[order]
+            cumulative = np.cumsum(weights)
+            # Each item covers `weight` consecutive ranks; place it at their centre
+            self._view = (items, cumulative, cumulative - (weights + 1) / 2)
+        return self._view
+
+    def rank(self, x: float, inclusive: bool = False) -> float:
+        """
+        Estimated number of values below `x` (or at most `x` if `inclusive`).
+        """
+        items, cumulative, _ = self._sorted_items()
+        position = np.searchsorted(items, x, side='right' if inclusive else 'left')
+        return float(cumulative[position - 1]) if position else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimated q-quantile. Uses pandas' linear interpolation, so it is exact
+        while `exact` is True.
+        """
+        if self.n == 0:
+            return np.nan
+        items, _, positions = self._sorted_items()
+        return float(np.interp(q * (self.n - 1), positions, items))
+
+    def rank_error_bound(self, delta: float = 0.01) -> float:
+        """
+        Bound on the absolute rank error of one query, holding with
+        probability at least 1 - delta.
+        """
+        return float(np.sqrt(2 * self.variance * np.log(2 / delta)))
+
+
+class StreamingOutlierAnalysis:
+    """
+    Constant-memory-per-cohort version of the analysis in
+    `process_dataframes_for_outliers`, fed one record batch at a time.
+
+    For each cohort it keeps the row count, running moments (count, sum, m2,
+    merged with `combine_cohort_moments`) for the mean and ANOVA, and its
+    values for the quartiles and outlier counts. Values wait in one shared
+    buffer, tagged with their cohort code, so a batch is folded in with array
+    operations. Only a cohort with more than `k` buffered values moves them
+    into its own `KLLSketch`, so small cohorts stay exact and a batch only
+    touches the cohorts that overflow. States built on different batches or
+    workers can be combined with `merge`.
+
+    Args:
+        value_column (str): Column with the values to analyse.
+        group_column (str): Cohort column.
+        k (int, optional): Sketch size (top-level capacity). Defaults to 200.
+        seed (Optional[int], optional): Seed for the sketches' compactions.
+    """
+
+    def __init__(self, value_column: str, group_column: str, k: int = 200, seed: Optional[int] = None):
+        self.value_column = value_column
+        self.group_column = group_column
+        self.k = k
+        self._rng = np.random.default_rng(seed)
+        self.sketches: Dict[object, KLLSketch] = {}
+        self.moments: Optional[DataFrame] = None
+        self._labels = pd.Index([])
+        self._sizes = np.zeros(0, dtype=np.int64)
+        self._pending_codes = np.zeros(0, dtype=np.int64)
+        self._pending_values = np.zeros(0)
+
+    @property
+    def sizes(self) -> pd.Series:
+        """
+        Rows (including missing values) per cohort.
+        """
+        return pd.Series(self._sizes, index=self._labels)
+
+    def _register(self, labels: pd.Index) -> np.ndarray:
+        """
+          codes of `labels` in this analysis, adding the ones not seen before
+        """
+        new_labels = labels[self._labels.get_indexer(labels) < 0]
+        if len(new_labels):
+            self._labels = self._labels.append(new_labels) if len(self._labels) else new_labels
+            self._sizes = np.concatenate((self._sizes, np.zeros(len(new_labels), dtype=np.int64)))
+        return self._labels.get_indexer(labels)
+
+    def _sketch(self, code: int) -> KLLSketch:
+        label = self._labels[code]
+        sketch = self.sketches.get(label)
+        if sketch is None:
+            sketch = self.sketches[label] = KLLSketch(self.k, self._rng)
+        return sketch
+
+    def _add_pending(self, codes: np.ndarray, values: np.ndarray, flush_all: bool = False) -> None:
+        """
+          buffer values, then move the buffers of cohorts holding more than k (or all) into sketches
+        """
+        self._pending_codes = np.concatenate((self._pending_codes, codes))
+        self._pending_values = np.concatenate((self._pending_values, values))
+        counts = np.bincount(self._pending_codes, minlength=len(self._labels))
+        to_flush = counts > (0 if flush_all else self.k)
+        if not to_flush.any():
+            return
+
+        flushed = to_flush[self._pending_codes]
+        flushed_codes = self._pending_codes[flushed]
+        order = np.argsort(flushed_codes, kind='stable')
+        flushed_codes, flushed_values = flushed_codes[order], self._pending_values[flushed][order]
+        cohorts = np.flatnonzero(to_flush)
+        starts = np.searchsorted(flushed_codes, cohorts)
+        for code, start, count in zip(cohorts, starts, counts[cohorts]):
+            self._sketch(code).update(flushed_values[start:start + count])
+        self._pending_codes = self._pending_codes[~flushed]
+        self._pending_values = self._pending_values[~flushed]
+
+    def update(self, batch: DataFrame) -> None:
+        """
+        Folds one batch of rows into the per-cohort state.
+        """
+        group_index = CohortGroupIndex.from_frame(batch, self.group_column, min_cohort_size=1)
+        cohort_codes = self._register(group_index.labels)
+        self._sizes[cohort_codes] += group_index.sizes
+
+        batch_moments = get_cohort_moments(batch, self.value_column, group_index)
+        self.moments = (batch_moments if self.moments is None
+                        else combine_cohort_moments(self.moments, batch_moments))
+
+        values = batch[self.value_column].to_numpy(dtype=float)
+        keep = (group_index.codes >= 0) & ~np.isnan(values)
+        self._add_pending(cohort_codes[group_index.codes[keep]], values[keep])
+
+    def merge(self, other: "StreamingOutlierAnalysis") -> None:
+        """
+        Adds the state of another analysis of the same table in place.
+        """
+        other_codes = self._register(other._labels)
+        self._sizes[other_codes] += other._sizes
+        if other.moments is not None:
+            self.moments = (other.moments.copy() if self.moments is None
+                            else combine_cohort_moments(self.moments, other.moments))
+        for label, sketch in other.sketches.items():
+            self._sketch(self._labels.get_loc(label)).merge(sketch)
+        self._add_pending(other_codes[other._pending_codes], other._pending_values)
+
+    def outlier_comparison(self, min_cohort_size: int = 5, delta: float = 0.01) -> DataFrame:
+        """
+        Per-cohort results in the `compare_outlier_methods` schema, plus
+        'iqr_outliers_error_bound' and 'mean_5x_outliers_error_bound' (absolute
+        count error, each holding with probability at least 1 - delta, given
+        the estimated fences) and 'exact'. Buffered values are moved into
+        the sketches first.
+        """
+        self._add_pending(np.zeros(0, dtype=np.int64), np.zeros(0), flush_all=True)
+        rows = []
+        for label, cohort_size in self.sizes.items():
+            if cohort_size < min_cohort_size:
+                continue
+            sketch = self.sketches.get(label) or KLLSketch(self.k, self._rng)
+            n = sketch.n
+            mean = self.moments.loc[label, 'sum'] / n if n else np.nan
+            q1, median, q3 = sketch.quantile(0.25), sketch.quantile(0.5), sketch.quantile(0.75)
+
+            # Method 1: IQR (3x)
+            lower_bound = q1 - 3 * (q3 - q1)
+            upper_bound = q3 + 3 * (q3 - q1)
+            below = sketch.rank(lower_bound)
+            above = n - sketch.rank(upper_bound, inclusive=True)
+            iqr_outliers = below + above
+
+            # Method 2: 5x Mean
+            threshold = 5 * mean
+            at_most_threshold = sketch.rank(threshold, inclusive=True)
+            mean_5x_outliers = n - at_most_threshold
+
+            overlap = (n - sketch.rank(max(threshold, upper_bound), inclusive=True)
+                       + max(0.0, below - at_most_threshold))
+
+            bound = sketch.rank_error_bound(delta)
+            rows.append({
+                'cohort': label,
+                'cohort_size': cohort_size,
+                'mean': mean,
+                'median': median,
+                'iqr_outliers': int(round(iqr_outliers)),
+                'mean_5x_outliers': int(round(mean_5x_outliers)),
+                'iqr_pct': iqr_outliers / cohort_size * 100,
+                'mean_5x_pct': mean_5x_outliers / cohort_size * 100,
+                'overlap_iqr_mean': int(round(overlap)),
+                'iqr_outliers_error_bound': 2 * bound,
+                'mean_5x_outliers_error_bound': bound,
+                'exact': sketch.exact
+            })
+
+        return DataFrame(rows, columns=[
+            'cohort', 'cohort_size', 'mean', 'median', 'iqr_outliers', 'mean_5x_outliers',
+            'iqr_pct', 'mean_5x_pct', 'overlap_iqr_mean', 'iqr_outliers_error_bound',
+            'mean_5x_outliers_error_bound', 'exact'
+        ])
+
+    def summary(self, df_name: str, min_cohort_size: int = 5, delta: float = 0.01) -> Dict[str, Union[str, float]]:
+        """
+        One `process_dataframes_for_outliers` summary row, plus error bounds on
+        the outlier totals. Kruskal-Wallis and scipy's F need all rows at once,
+        so 'KW_H', 'epsilon_squared', 'p_value' and 'f_stat_scipy' are np.nan.
+        """
+        outlier_comparison = self.outlier_comparison(min_cohort_size, delta)
+
+        f_manual, ms_b_manual, ms_w_manual = np.nan, np.nan, np.nan
+        if self.moments is not None:
+            eligible = self.sizes.index[self.sizes >= min_cohort_size]
+            try:
+                f_manual, ms_b_manual, ms_w_manual = anova_from_moments(
+                    self.moments.loc[eligible], min_cohort_size=1
+                )
+            except ValueError:
+                pass
+
+        if not outlier_comparison.empty:
+            share_cohorts_with_outlier_IQR = (outlier_comparison['iqr_outliers'] > 0).mean()
+            share_cohorts_with_outlier_5x = (outlier_comparison['mean_5x_outliers'] > 0).mean()
+            iqr_total_outliers = outlier_comparison['iqr_outliers'].sum()
+            mean_5x_total_outliers = outlier_comparison['mean_5x_outliers'].sum()
+            overlap_total_vendors = outlier_comparison['overlap_iqr_mean'].sum()
+            iqr_error_bound = outlier_comparison['iqr_outliers_error_bound'].sum()
+            mean_5x_error_bound = outlier_comparison['mean_5x_outliers_error_bound'].sum()
+        else:
+            share_cohorts_with_outlier_IQR = 0.0
+            share_cohorts_with_outlier_5x = 0.0
+            iqr_total_outliers = 0
+            mean_5x_total_outliers = 0
+            overlap_total_vendors = 0
+            iqr_error_bound = 0.0
+            mean_5x_error_bound = 0.0
+
+        return {
+            'df_name': df_name,
+            'share_cohorts_with_outlier_IQR': share_cohorts_with_outlier_IQR,
+            'share_cohorts_with_outlier_5x': share_cohorts_with_outlier_5x,
+            'iqr_total_outliers': iqr_total_outliers,
+            'mean_5x_total_outliers': mean_5x_total_outliers,
+            'overlap_total_vendors': overlap_total_vendors,
+            'KW_H': np.nan,
+            'epsilon_squared': np.nan,
+            'p_value': np.nan,
+            'f_stat_scipy': np.nan,
+            'f_stat_manual': f_manual,
+            'ms_b_manual': ms_b_manual,
+            'ms_w_manual': ms_w_manual,
+            'iqr_total_outliers_error_bound': iqr_error_bound,
+            'mean_5x_total_outliers_error_bound': mean_5x_error_bound
+        }
+
+
+def iter_parquet_batches(path: str, columns: Optional[List[str]] = None,
+                         batch_size: int = 1_000_000) -> Iterator[DataFrame]:
+    """
+    Yields a Parquet file as pandas DataFrames of at most `batch_size` rows,
+    without reading the whole file into memory.
+    """
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    for record_batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield record_batch.to_pandas()
+
+
+def process_batches_for_outliers(
+    batches_dict: Dict[str, Union[DataFrame, Iterable[DataFrame]]],
+    value_column: str,
+    group_column: str,
+    k: int = 200,
+    seed: Optional[int] = 0,
+    delta: float = 0.01
+) -> DataFrame:
+    """
+    Streaming mode of `process_dataframes_for_outliers`.
+
+    Each value of `batches_dict` is an iterable of DataFrames (e.g. from
+    `iter_parquet_batches` or query result pages) that together make up one
+    rule table, or a single DataFrame. Memory use is bounded by one batch
+    plus the per-cohort state. Also reachable as
+    `process_dataframes_for_outliers(..., streaming=True)`.
+
+    Args:
+        batches_dict (Dict[str, Union[DataFrame, Iterable[DataFrame]]]): Batches per table name.
+        value_column (str): Column with the values to analyse.
+        group_column (str): Cohort column.
+        k (int, optional): Sketch size (top-level capacity). Defaults to 200.
+        seed (Optional[int], optional): Seed for the sketches. Defaults to 0.
+        delta (float, optional): Failure probability of each reported error
+                                 bound. Defaults to 0.01.
+
+    Returns:
+        DataFrame: The `process_dataframes_for_outliers` summary, with
+                   'iqr_total_outliers_error_bound' and
+                   'mean_5x_total_outliers_error_bound' columns (0 when exact).
+    """
+    all_results = []
+    for df_name, batches in batches_dict.items():
+        print(f"Streaming DataFrame: {df_name}...")
+        analysis = StreamingOutlierAnalysis(value_column, group_column, k=k, seed=seed)
+        if isinstance(batches, DataFrame):
+            batches = [batches]
+        for batch in batches:
+            analysis.update(batch)
+        all_results.append(analysis.summary(df_name, delta=delta))
+
+    return DataFrame(all_results, columns=[
+        'df_name', 'share_cohorts_with_outlier_IQR', 'share_cohorts_with_outlier_5x',
+        'iqr_total_outliers', 'mean_5x_total_outliers', 'overlap_total_vendors',
+        'KW_H', 'epsilon_squared', 'p_value', 'f_stat_scipy', 'f_stat_manual',
+        'ms_b_manual', 'ms_w_manual', 'iqr_total_outliers_error_bound',
+        'mean_5x_total_outliers_error_bound'
+    ])
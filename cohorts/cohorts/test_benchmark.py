@@ -0,0 +1,70 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from .benchmark import (compare_results, generate_kpi, main, read_results,
+                        run_benchmarks, scale_grid, synthetic_kpi_table, synthetic_rule_tables)
+from .cohort_statistics import process_dataframes
+
+
+def test_generate_kpi_shapes():
+    rng = np.random.default_rng(0)
+    skewed = generate_kpi('right_skewed', 100_000, rng)
+    gaussian = generate_kpi('gaussian', 100_000, rng)
+    zero_inflated = generate_kpi('zero_inflated', 100_000, rng)
+
+    assert np.mean(skewed) > np.median(skewed)
+    assert np.mean(gaussian) == pytest.approx(5, abs=0.05)
+    assert np.mean(zero_inflated == 0) == pytest.approx(0.4)
+    assert np.mean(zero_inflated == 1) == pytest.approx(0.1)
+    with pytest.raises(ValueError, match="Unknown distribution"):
+        generate_kpi('uniform', 10, rng)
+
+
+def test_synthetic_tables_are_reproducible_and_sized():
+    kpis = synthetic_kpi_table(2_000, 50, 'gaussian', seed=1)
+    assert len(kpis) == 2_000
+    assert kpis['cohort_id'].cat.categories.size == 50
+    pd.testing.assert_frame_equal(kpis, synthetic_kpi_table(2_000, 50, 'gaussian', seed=1))
+
+    vendor_base, tables = synthetic_rule_tables(2_000, 50, n_tables=2, seed=1)
+    processed = process_dataframes(vendor_base, tables)
+    for name in tables:
+        assert (processed[name]['_merge'] == 'left_only').sum() == 100
+        assert len(processed[name]) == 2_000
+
+
+def test_scale_grid_skips_more_cohorts_than_vendors():
+    assert scale_grid(vendors=[10**4, 10**5], cohorts=[10, 10**5]) == [(10**4, 10), (10**5, 10), (10**5, 10**5)]
+    full = scale_grid('full')
+    assert (10**7, 10**5) in full and (10**4, 10) in full
+
+
+def test_run_and_compare(tmp_path, capsys):
+    records = run_benchmarks([(500, 10)], distributions=['zero_inflated'],
+                             functions=['compare_outlier_methods', 'process_dataframes'], repeat=1)
+    assert [record['function'] for record in records] == ['compare_outlier_methods', 'process_dataframes']
+    assert all(record['peak_memory_mb'] > 0 and record['min_seconds'] > 0 for record in records)
+
+    baseline = pd.DataFrame(records)
+    current = baseline.assign(median_seconds=baseline['median_seconds'] * [0.5, 2.0])
+    comparison = compare_results(baseline, current, threshold=0.1)
+    assert list(comparison['status']) == ['faster', 'slower']
+    np.testing.assert_allclose(comparison['speedup'], [2.0, 0.5])
+
+    baseline_path = tmp_path / "baseline.json"
+    assert main(['--vendors', '500', '--cohorts', '10', '--distributions', 'gaussian',
+                 '--functions', 'get_f_stat_components', '--repeat', '1', '--no-memory',
+                 '--output', str(baseline_path)]) == 0
+    written = json.loads(baseline_path.read_text())
+    assert written['metadata']['numpy'] == np.__version__
+    assert written['results'][0]['peak_memory_mb'] is None
+    slower = read_results(baseline_path).assign(median_seconds=lambda df: df['median_seconds'] * 10)
+    current_path = tmp_path / "current.json"
+    current_path.write_text(json.dumps({'metadata': {}, 'results': slower.to_dict('records')}))
+
+    assert main(['--compare', str(baseline_path), '--current', str(current_path)]) == 0
+    assert main(['--compare', str(baseline_path), '--current', str(current_path), '--fail-on-slowdown']) == 1
+    assert "0 faster, 1 slower, 0 unchanged" in capsys.readouterr().out
@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from .cohort_assignment import DEFAULT_HIERARCHY, assign_cohorts
+
+
+@pytest.fixture
+def vendor_base():
+    rng = np.random.default_rng(14)
+    n = 3000
+    df = pd.DataFrame({
+        'entity': rng.choice(['tb_ae', 'tb_kw'], n),
+        'city': rng.choice(['c1', 'c2', 'c3'], n, p=[0.7, 0.2, 0.1]),
+        'area': rng.choice([f"a{i}" for i in range(6)], n),
+        'budget': rng.choice(['1', '2', '3'], n),
+        'cuisine': rng.choice(['pizza', 'burger', 'sushi', 'thai'], n),
+        'vendor_grade': rng.choice(['A', 'B', 'C'], n),
+        'vendor_code': [f"v{i}" for i in range(n)],
+        'chain_id': rng.choice([f"ch{i}" for i in range(40)], n).astype(object),
+    })
+    df.loc[rng.random(n) < 0.3, 'chain_id'] = None
+    return df
+
+
+def _reference(df, hierarchy, min_vendors, min_chains, fallback):
+    """Per-vendor assignment, as it would be written with a loop."""
+    chains = df['chain_id'].fillna('vendor:' + df['vendor_code'])
+    valid = {}
+    for depth in range(1, len(hierarchy) + 1):
+        groups = df.assign(_chain=chains).groupby(hierarchy[:depth])
+        stats = groups.agg(vendors=('vendor_code', 'size'), chains=('_chain', 'nunique'))
+        valid[depth] = {key if isinstance(key, tuple) else (key,): (row.vendors >= min_vendors) and (row.chains >= min_chains)
+                        for key, row in stats.iterrows()}
+    features, depths = [], []
+    for _, row in df.iterrows():
+        values = tuple(row[h] for h in hierarchy)
+        if valid[len(hierarchy)][values]:
+            depth = len(hierarchy)
+        elif fallback == 'root':
+            depth = 1
+        else:
+            depth = max([d for d in range(1, len(hierarchy)) if valid[d][values[:d]]] + [1])
+        depths.append(depth)
+        features.append({h: (v if i < depth else 'All') for i, (h, v) in enumerate(zip(hierarchy, values))})
+    return features, depths
+
+
+@pytest.mark.parametrize('fallback', ['root', 'parent'])
+@pytest.mark.parametrize('min_chains', [1, 3])
+def test_matches_per_vendor_reference(vendor_base, fallback, min_chains):
+    hierarchy = list(DEFAULT_HIERARCHY)
+    assigned = assign_cohorts(vendor_base, hierarchy, min_vendors=4, min_chains=min_chains, fallback=fallback)
+    features, depths = _reference(vendor_base, hierarchy, 4, min_chains, fallback)
+
+    assert [json.loads(f) for f in assigned['cohort_features']] == features
+    assert assigned['cohort_depth'].tolist() == depths
+    # One id per distinct feature set
+    assert (assigned.groupby('cohort_features')['cohort_id'].nunique() == 1).all()
+    assert assigned['cohort_id'].nunique() == assigned['cohort_features'].nunique()
+
+
+def test_ids_do_not_depend_on_row_order(vendor_base):
+    assigned = assign_cohorts(vendor_base, fallback='parent')
+    shuffled = assign_cohorts(vendor_base.sample(frac=1, random_state=0), fallback='parent')
+
+    pd.testing.assert_frame_equal(shuffled.sort_index(), assigned)
+
+
+def test_feeds_outlier_analysis_shape(vendor_base):
+    assigned = assign_cohorts(vendor_base, ['entity', 'city'], min_vendors=1, min_chains=1)
+
+    assert assigned['cohort_id'].nunique() == 6
+    assert set(json.loads(assigned['cohort_features'].iloc[0])) == {'entity', 'city'}
+    assert 'cohort_id' not in vendor_base.columns
+
+
+def test_rejects_bad_configuration(vendor_base):
+    with pytest.raises(ValueError):
+        assign_cohorts(vendor_base, fallback='sideways')
+    with pytest.raises(ValueError):
+        assign_cohorts(vendor_base, hierarchy=[])
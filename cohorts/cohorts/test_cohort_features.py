@@ -0,0 +1,99 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from .cohort_features import (PARSE_CACHE_SIZE, CohortFeatureStore, _parse_cohort_features,
+                              decode_cohort_features)
+from .cohort_statistics import get_top_cohort_items, pretty_print_output
+from .schema import COHORT_DATA_SCHEMA
+
+
+@pytest.fixture
+def cohort_data():
+    features = {
+        10: {"entity": "tb_ae", "city": "dubai", "cuisine": "All"},
+        11: {"entity": "tb_ae", "city": "All", "cuisine": "All"},
+        12: {"entity": "tb_kw", "city": "kuwait", "cuisine": "pizza"},
+    }
+    cohort_ids = np.repeat([10, 11, 12, 10], [3, 2, 4, 1])
+    return pd.DataFrame({
+        'entity_id': 'TB_AE',
+        'vendor_code': [f"v{i}" for i in range(len(cohort_ids))],
+        'cohort_id': cohort_ids,
+        'cohort_features': [json.dumps(features[c]) for c in cohort_ids],
+    })
+
+
+def test_store_has_one_row_per_cohort(cohort_data):
+    store = CohortFeatureStore.from_frame(cohort_data)
+
+    assert store.features.index.tolist() == [10, 11, 12]
+    assert store.feature_columns == ['entity', 'city', 'cuisine']
+    assert isinstance(store.features['city'].dtype, pd.CategoricalDtype)
+    assert store.features.loc[12, 'cuisine'] == 'pizza'
+
+
+def test_parses_each_distinct_string_once(cohort_data):
+    _parse_cohort_features.cache_clear()
+    CohortFeatureStore.from_frame(cohort_data)
+    CohortFeatureStore.from_frame(COHORT_DATA_SCHEMA.apply(cohort_data))
+
+    info = _parse_cohort_features.cache_info()
+    assert (info.misses, info.hits) == (3, 3)
+
+
+def test_attach_aligns_with_cohort_id(cohort_data):
+    store = CohortFeatureStore.from_frame(cohort_data)
+    rows = pd.DataFrame({'cohort_id': [12, 10, 99], 'gmv': [1.0, 2.0, 3.0]})
+
+    attached = store.attach(rows, columns=['city'])
+
+    assert attached['city'].tolist()[:2] == ['kuwait', 'dubai']
+    assert pd.isna(attached['city'].iloc[2])
+    assert list(attached.columns) == ['cohort_id', 'gmv', 'city']
+
+
+def test_invalid_json_gives_missing_features():
+    df = pd.DataFrame({'cohort_id': [1, 2], 'cohort_features': ['{"city": "a"}', 'not json']})
+    store = CohortFeatureStore.from_frame(df)
+
+    assert store.features.loc[1, 'city'] == 'a'
+    assert pd.isna(store.features.loc[2, 'city'])
+    with pytest.raises(json.JSONDecodeError):
+        decode_cohort_features('not json')
+
+
+def test_conflicting_features_use_most_frequent_and_warn():
+    df = pd.DataFrame({'cohort_id': [1, 2, 1, 1, 2, 2],
+                       'cohort_features': ['{"city": "a"}', '{"city": "x"}', '{"city": "b"}',
+                                           '{"city": "b"}', '{"city": "y"}', '{"city": "z"}']})
+    for frame in (df, COHORT_DATA_SCHEMA.apply(df)):
+        with pytest.warns(UserWarning, match="most frequent"):
+            store = CohortFeatureStore.from_frame(frame)
+        assert store.features.index.tolist() == [1, 2]
+        # most frequent for cohort 1, first seen on the tie for cohort 2
+        assert store.features['city'].tolist() == ['b', 'x']
+
+
+def test_top_items_keep_conflicting_features_apart():
+    df = pd.DataFrame({'cohort_id': [1, 1, 1, 2],
+                       'cohort_features': ['{"city": "a"}', '{"city": "b"}', '{"city": "b"}', '{"city": "c"}'],
+                       'vendor_code': ['v1', 'v2', 'v3', 'v4']})
+
+    top_items = dict(get_top_cohort_items(df, n=3))
+
+    assert top_items == {(1, '{"city": "b"}'): 2, (1, '{"city": "a"}'): 1, (2, '{"city": "c"}'): 1}
+
+
+def test_parse_cache_is_bounded():
+    assert _parse_cohort_features.cache_info().maxsize == PARSE_CACHE_SIZE
+
+
+def test_top_items_with_categorical_columns(cohort_data, capsys):
+    top_items = list(get_top_cohort_items(COHORT_DATA_SCHEMA.apply(cohort_data), n=2))
+
+    assert [(cohort_id, count) for (cohort_id, _), count in top_items] == [(10, 4), (12, 4)]
+    pretty_print_output(top_items)
+    assert '"city": "dubai"' in capsys.readouterr().out
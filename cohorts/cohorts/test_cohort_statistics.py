@@ -1,5 +1,7 @@
 # test_cohort_statistics.py
 
+import threading
+import time
 from typing import Literal
 from unittest.mock import patch, MagicMock
 import pytest
@@ -18,6 +20,9 @@ from .cohort_statistics import (
     find_outliers_mean_multiple,
     compare_outlier_methods,
     calculate_anova_components,
+    get_cohort_moments,
+    combine_cohort_moments,
+    anova_from_moments,
     get_f_stat_components,
     process_dataframes,
     get_top_cohort_items,
@@ -95,6 +100,49 @@ def test_compare_outlier_methods_small_cohorts_skipped():
     assert len(results_df) == 1 # Only cohort A should be present
     assert results_df['cohort'].iloc[0] == 'A'
 
+def test_compare_outlier_methods_matches_per_cohort_loop():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(mean=1.0, sigma=1.5, size=2000)
+    values[rng.random(2000) < 0.05] = np.nan
+    values[rng.random(2000) < 0.1] = 0.0
+    df = pd.DataFrame({
+        'performance': values,
+        'cohort': rng.integers(0, 150, size=2000).astype(str)
+    })
+
+    # Reference: one boolean mask per cohort
+    expected = []
+    for cohort in df['cohort'].unique():
+        cohort_data = df[df['cohort'] == cohort]['performance']
+        if len(cohort_data) >= 5:
+            iqr_outliers = find_outliers_iqr(cohort_data, multiplier=3)
+            mean_outliers = find_outliers_mean_multiple(cohort_data, multiplier=5)
+            expected.append({
+                'cohort': cohort,
+                'cohort_size': len(cohort_data),
+                'mean': cohort_data.mean(),
+                'median': cohort_data.median(),
+                'iqr_outliers': iqr_outliers.sum(),
+                'mean_5x_outliers': mean_outliers.sum(),
+                'iqr_pct': (iqr_outliers.sum() / len(cohort_data)) * 100,
+                'mean_5x_pct': (mean_outliers.sum() / len(cohort_data)) * 100,
+                'overlap_iqr_mean': (iqr_outliers & mean_outliers).sum()
+            })
+    expected_df = pd.DataFrame(expected)
+
+    results_df = compare_outlier_methods(df, 'performance', 'cohort')
+
+    pd.testing.assert_frame_equal(results_df, expected_df, check_dtype=False)
+
+def test_compare_outlier_methods_no_eligible_cohorts():
+    df = pd.DataFrame({
+        'performance': [1, 2, 3],
+        'cohort': ['A', 'A', 'B']
+    })
+    results_df = compare_outlier_methods(df, 'performance', 'cohort')
+    assert results_df.empty
+    assert 'iqr_outliers' in results_df.columns
+
 
 def test_calculate_anova_components_basic():
     group1 = np.array([10, 12, 11, 13])
@@ -130,6 +178,63 @@ def test_calculate_anova_components_compare_scipy():
     assert f_stat_manual == pytest.approx(f_stat_scipy, rel=1e-6)
 
 
+def test_anova_from_moments_matches_samples():
+    df = pd.DataFrame({
+        'performance': [10, 12, 11, 13, 15, 17, 16, 14, 8, 9, 7, 10],
+        'cohort': ['a'] * 4 + ['b'] * 4 + ['c'] * 4
+    })
+    moments = get_cohort_moments(df, 'performance', 'cohort')
+
+    assert list(moments.index) == ['a', 'b', 'c']
+    assert list(moments['count']) == [4, 4, 4]
+    assert moments.loc['a', 'm2'] == pytest.approx(5.0)
+
+    f_stat, ms_b, ms_w = anova_from_moments(moments, min_cohort_size=1)
+    assert f_stat == pytest.approx(148 / 5)
+    assert ms_b == pytest.approx(148 / 3)
+    assert ms_w == pytest.approx(5 / 3)
+
+def test_anova_from_moments_single_group_raises_error():
+    df = pd.DataFrame({'performance': [1, 2, 3, 4, 5], 'cohort': ['a'] * 5})
+    with pytest.raises(ValueError, match="Requires at least two groups"):
+        anova_from_moments(get_cohort_moments(df, 'performance', 'cohort'))
+
+def test_combine_cohort_moments_matches_full_data():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        # large offset to exercise the centred update
+        'performance': 1e6 + rng.normal(size=3000),
+        'cohort': rng.integers(0, 40, size=3000)
+    })
+    full = get_cohort_moments(df, 'performance', 'cohort')
+    chunks = [get_cohort_moments(chunk, 'performance', 'cohort')
+              for chunk in (df.iloc[start:start + 430] for start in range(0, len(df), 430))]
+    combined = combine_cohort_moments(*chunks).loc[full.index]
+
+    np.testing.assert_array_equal(combined['count'], full['count'])
+    np.testing.assert_allclose(combined['sum'], full['sum'], rtol=1e-12)
+    np.testing.assert_allclose(combined['m2'], full['m2'], rtol=1e-9)
+    assert anova_from_moments(combined) == pytest.approx(anova_from_moments(full), rel=1e-9)
+
+def test_get_f_stat_components_moments_matches_samples():
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame({
+        'performance': rng.gamma(2.0, 3.0, size=500),
+        'cohort_id': rng.integers(0, 30, size=500)
+    })
+    samples = get_f_stat_components(df, 'performance', 'cohort_id')
+    moments = get_f_stat_components(df, 'performance', 'cohort_id', method='moments')
+
+    assert np.isnan(moments['f_scipy'])
+    for key in ['f_manual', 'ms_b_manual', 'ms_w_manual']:
+        assert moments[key] == pytest.approx(samples[key], rel=1e-9)
+
+def test_get_f_stat_components_unknown_method():
+    df = pd.DataFrame({'performance': [1.0], 'cohort_id': ['A']})
+    with pytest.raises(ValueError, match="Unknown method"):
+        get_f_stat_components(df, 'performance', 'cohort_id', method='bogus')
+
+
 def test_get_f_stat_components_less_than_two_cohorts():
     data = {
         'performance': [10, 12, 11, 13],
@@ -410,3 +515,62 @@ def test_load_dataframes_handles_pandas_gbq_exception(mocker, mock_table_config:
     captured = capsys.readouterr()
     assert "Simulated BigQuery connection error" in captured.out
     assert "Test Cat A-even-test_type_X-current" in captured.out
+
+
+def test_load_dataframes_concurrent_with_local_reader(mock_table_config: TableConfig, mock_base_sql_query_template: Literal['SELECT * FROM `{table_path}` LIMIT 1'], mock_project_id: Literal['mock-gcp-project']):
+    """
+    Tests the concurrent loader against a local stand-in reader, checking that
+    the concurrency limit is respected and keys keep configuration order.
+    """
+    lock = threading.Lock()
+    state = {'active': 0, 'max_active': 0}
+
+    def local_reader(sql_query, project_id):
+        assert project_id == mock_project_id
+        with lock:
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+        time.sleep(0.05)
+        with lock:
+            state['active'] -= 1
+        return pd.DataFrame({'query': [sql_query]})
+
+    loaded_dfs = load_dataframes_by_type("test_type_X", mock_base_sql_query_template, mock_table_config,
+                                         mock_project_id, max_workers=2, reader=local_reader)
+
+    assert list(loaded_dfs.keys()) == [
+        "Test Cat A-even-test_type_X-current",
+        "Test Cat A-even-test_type_X-original",
+        "Test Cat A-uneven-test_type_X-current"
+    ]
+    assert loaded_dfs["Test Cat A-even-test_type_X-original"]['query'].iloc[0] == \
+        "SELECT * FROM `bq_path_A_even_X_original` LIMIT 1"
+    assert state['max_active'] == 2
+
+
+def test_load_dataframes_retries_then_reports(mock_table_config: TableConfig, mock_base_sql_query_template: Literal['SELECT * FROM `{table_path}` LIMIT 1'], mock_project_id: Literal['mock-gcp-project'], capsys: CaptureFixture[str]):
+    """
+    Tests that transient failures are retried and persistent ones are skipped and reported.
+    """
+    calls = {}
+
+    def flaky_reader(sql_query, project_id):
+        calls[sql_query] = calls.get(sql_query, 0) + 1
+        if 'original' in sql_query:
+            raise Exception("Permanent failure")
+        if calls[sql_query] == 1:
+            raise Exception("Transient failure")
+        return pd.DataFrame({'ok_col': [1]})
+
+    loaded_dfs = load_dataframes_by_type("test_type_X", mock_base_sql_query_template, mock_table_config,
+                                         mock_project_id, max_workers=3, retries=2, retry_wait=0.0,
+                                         reader=flaky_reader)
+
+    assert set(loaded_dfs.keys()) == {
+        "Test Cat A-even-test_type_X-current",
+        "Test Cat A-uneven-test_type_X-current"
+    }
+    assert calls["SELECT * FROM `bq_path_A_even_X_original` LIMIT 1"] == 3
+    captured = capsys.readouterr()
+    assert "Permanent failure" in captured.out
+    assert "Test Cat A-even-test_type_X-original" in captured.out
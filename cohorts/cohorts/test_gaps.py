@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from .gaps import GROWTH_METRIC_MAPPING, compute_gaps, gaps_for_rules, get_gaps
+from .group_index import CohortGroupIndex
+
+
+def _reference_get_gaps(df, metric_columns, fill_na=False):
+    """The merge-based version from cohort_selection.ipynb."""
+    reco_col, value_col, percentile_col = metric_columns
+    required_base_cols = ['global_entity_id', 'cohort_id', 'vendor_id']
+    tmp = df[required_base_cols + metric_columns].copy()
+    if fill_na:
+        tmp[value_col] = tmp[value_col].fillna(0)
+    cohort_median = tmp.groupby('cohort_id')[value_col].median().rename("median_")
+    tmp = pd.merge(tmp, cohort_median, on='cohort_id', how='left')
+    tmp[reco_col] = pd.to_numeric(tmp[reco_col], errors='coerce').fillna(0).astype(int)
+    tmp = tmp.assign(
+        performance_gap=lambda x: np.where(x[reco_col] == 1, x['median_'] - x[value_col], np.nan),
+        pc_perf_gap=lambda x: np.where(x[reco_col] == 1, 0.5 - x[percentile_col], np.nan)
+    )
+    return tmp[required_base_cols + ['performance_gap', 'pc_perf_gap']]
+
+
+@pytest.fixture
+def kpi_df():
+    rng = np.random.default_rng(16)
+    n = 2000
+    df = pd.DataFrame({
+        'global_entity_id': rng.choice(['TB_AE', 'TB_KW'], n),
+        'vendor_id': [f"v{i}" for i in range(n)],
+        'cohort_id': rng.integers(0, 150, n).astype(float),
+    })
+    df.loc[rng.random(n) < 0.02, 'cohort_id'] = np.nan
+    for reco_col, value_col, percentile_col in GROWTH_METRIC_MAPPING.values():
+        df[value_col] = rng.lognormal(size=n)
+        df.loc[rng.random(n) < 0.1, value_col] = np.nan
+        df[percentile_col] = rng.random(n)
+        df[reco_col] = rng.choice(['0', '1', 'x'], n)
+    return df
+
+
+@pytest.mark.parametrize('fill_na', [False, True])
+def test_get_gaps_matches_merge_version(kpi_df, fill_na):
+    for metric_columns in GROWTH_METRIC_MAPPING.values():
+        expected = _reference_get_gaps(kpi_df, metric_columns, fill_na)
+        pd.testing.assert_frame_equal(get_gaps(kpi_df, metric_columns, fill_na), expected)
+
+
+def test_compute_gaps_covers_every_metric(kpi_df):
+    gaps = compute_gaps(kpi_df, group_index=CohortGroupIndex.from_frame(kpi_df, 'cohort_id'))
+
+    assert list(gaps['metric_name'].cat.categories) == list(GROWTH_METRIC_MAPPING)
+    assert len(gaps) == 4 * len(kpi_df)
+    for metric_name, metric_columns in GROWTH_METRIC_MAPPING.items():
+        metric_gaps = gaps[gaps['metric_name'] == metric_name].drop(columns='metric_name').reset_index(drop=True)
+        pd.testing.assert_frame_equal(metric_gaps, _reference_get_gaps(kpi_df, metric_columns))
+
+
+def test_missing_metric_columns_are_skipped(kpi_df):
+    gaps = compute_gaps(kpi_df.drop(columns='impressions'))
+
+    assert 'CPC' not in set(gaps['metric_name'])
+    with pytest.raises(KeyError):
+        get_gaps(kpi_df.drop(columns='impressions'), GROWTH_METRIC_MAPPING['CPC'])
+    with pytest.raises(ValueError):
+        get_gaps(kpi_df, ['recommend_vfd', 'cvr'])
+
+
+def test_gaps_for_rules(kpi_df):
+    gaps = gaps_for_rules({'rule_a': kpi_df, 'rule_b': kpi_df.iloc[:500]})
+
+    assert gaps.groupby('df_key').size().to_dict() == {'rule_a': 8000, 'rule_b': 2000}
+    assert list(gaps.columns[:2]) == ['df_key', 'metric_name']
+    means = gaps.groupby(['df_key', 'metric_name'], observed=True)['pc_perf_gap'].mean()
+    assert means.notna().all()
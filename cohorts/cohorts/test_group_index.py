@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from .cohort_statistics import (
+    compare_outlier_methods,
+    get_cohort_moments,
+    get_f_stat_components,
+    get_groups,
+    kruskal_wallis
+)
+from .group_index import CohortGroupIndex
+
+
+@pytest.fixture
+def cohort_df():
+    rng = np.random.default_rng(4)
+    cohorts = rng.choice(['c', 'a', 'b', 'd', None], size=200, p=[0.4, 0.3, 0.2, 0.08, 0.02])
+    return pd.DataFrame({
+        'performance': rng.gamma(2.0, 5.0, size=200),
+        'cohort_id': cohorts
+    })
+
+
+def test_group_index_structure():
+    index = CohortGroupIndex.from_series(pd.Series(['b', 'a', 'b', None, 'a', 'b']), min_cohort_size=3)
+
+    assert list(index.labels) == ['b', 'a']
+    np.testing.assert_array_equal(index.codes, [0, 1, 0, -1, 1, 0])
+    np.testing.assert_array_equal(index.sizes, [3, 2])
+    np.testing.assert_array_equal(index.offsets, [0, 3])
+    np.testing.assert_array_equal(index.order, [0, 2, 5, 1, 4])
+    np.testing.assert_array_equal(index.eligible, [True, False])
+
+
+def test_group_index_length_mismatch(cohort_df):
+    index = CohortGroupIndex.from_frame(cohort_df.iloc[:10], 'cohort_id')
+    with pytest.raises(ValueError, match="built for 10 rows"):
+        compare_outlier_methods(cohort_df, 'performance', index)
+
+
+def test_functions_accept_group_index(cohort_df):
+    index = CohortGroupIndex.from_frame(cohort_df, 'cohort_id')
+
+    pd.testing.assert_frame_equal(
+        compare_outlier_methods(cohort_df, 'performance', index),
+        compare_outlier_methods(cohort_df, 'performance', 'cohort_id')
+    )
+    for with_index, with_column in zip(get_groups(cohort_df, 'performance', index),
+                                       [group['performance'].values
+                                        for _, group in cohort_df.groupby('cohort_id')
+                                        if len(group) >= 5]):
+        np.testing.assert_array_equal(with_index, with_column)
+    pd.testing.assert_frame_equal(
+        get_cohort_moments(cohort_df, 'performance', index),
+        get_cohort_moments(cohort_df, 'performance', 'cohort_id'),
+        check_names=False
+    )
+    assert (get_f_stat_components(cohort_df, 'performance', index)
+            == get_f_stat_components(cohort_df, 'performance', 'cohort_id'))
+    assert (kruskal_wallis(cohort_df['performance'], index)
+            == kruskal_wallis(cohort_df['performance'], cohort_df['cohort_id']))
@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import f_oneway, kruskal
+
+from .cohort_statistics import get_groups
+from .permutation import permutation_batch_size, permutation_test, permutation_tests_for_outliers
+
+
+@pytest.fixture
+def vendor_df():
+    rng = np.random.default_rng(12)
+    cohorts = rng.integers(0, 8, size=400)
+    values = np.round(rng.lognormal(0.0, 1.0, size=400), 1) * np.where(cohorts == 0, 1.5, 1.0)
+    values[rng.random(400) < 0.2] = 0.0
+    return pd.DataFrame({'gmv': values, 'cohort_id': cohorts})
+
+
+def test_observed_statistics_match_scipy(vendor_df):
+    result = permutation_test(vendor_df['gmv'], vendor_df['cohort_id'], n_permutations=99, seed=0)
+    groups = get_groups(vendor_df, 'gmv', 'cohort_id')
+
+    assert result['f_stat'] == pytest.approx(f_oneway(*groups).statistic)
+    assert result['kw_h'] == pytest.approx(kruskal(*groups).statistic)
+
+
+def test_p_values_match_reference_loop(vendor_df):
+    seed = np.random.SeedSequence(3)
+    result = permutation_test(vendor_df['gmv'], vendor_df['cohort_id'],
+                              n_permutations=200, batch_size=64, seed=seed)
+
+    # Replay the same shuffles one by one through scipy
+    values = vendor_df['gmv'].to_numpy()
+    codes = vendor_df['cohort_id'].to_numpy()
+    f_observed = f_oneway(*get_groups(vendor_df, 'gmv', 'cohort_id')).statistic
+    h_observed = kruskal(*get_groups(vendor_df, 'gmv', 'cohort_id')).statistic
+    f_exceed = h_exceed = 0
+    for size, batch_seed in zip([64, 64, 64, 8], np.random.SeedSequence(3).spawn(4)):
+        rows = np.random.default_rng(batch_seed).permuted(np.tile(np.arange(len(values)), (size, 1)), axis=1)
+        for permutation in rows:
+            groups = [values[permutation][codes == c] for c in range(8)]
+            f_exceed += f_oneway(*groups).statistic >= f_observed * (1 - 1e-9)
+            h_exceed += kruskal(*groups).statistic >= h_observed * (1 - 1e-9)
+
+    assert result['f_p_value'] == pytest.approx((1 + f_exceed) / 201)
+    assert result['kw_p_value'] == pytest.approx((1 + h_exceed) / 201)
+
+
+def test_results_do_not_depend_on_workers(vendor_df):
+    serial = permutation_test(vendor_df['gmv'], vendor_df['cohort_id'],
+                              n_permutations=999, batch_size=100, seed=7)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        parallel = permutation_test(vendor_df['gmv'], vendor_df['cohort_id'],
+                                    n_permutations=999, batch_size=100, seed=7, executor=executor)
+
+    assert parallel == serial
+    assert 1 / 1000 <= serial['f_p_value'] <= 1
+
+
+def test_separated_cohorts_are_significant():
+    rng = np.random.default_rng(1)
+    codes = np.repeat(np.arange(4), 50)
+    values = rng.normal(size=200) + codes
+
+    result = permutation_test(values, codes, n_permutations=499, seed=0)
+
+    assert result['f_p_value'] == 1 / 500
+    assert result['kw_p_value'] == 1 / 500
+
+
+def test_degenerate_inputs_return_nan():
+    assert np.isnan(permutation_test(np.ones(20), np.repeat([0, 1], 10), n_permutations=9)['f_p_value'])
+    assert np.isnan(permutation_test(np.arange(8.0), np.repeat([0, 1], 4), n_permutations=9)['kw_h'])
+
+
+def test_permutation_tests_for_outliers(vendor_df):
+    results = permutation_tests_for_outliers(
+        {'rule_a': vendor_df, 'rule_b': vendor_df.assign(cohort_id=vendor_df['cohort_id'] % 2)},
+        'gmv', 'cohort_id', n_permutations=99, seed=0
+    )
+
+    assert results['df_name'].tolist() == ['rule_a', 'rule_b']
+    assert results['n_permutations'].tolist() == [99, 99]
+    assert results['f_p_value'].between(0.01, 1).all()
+
+
+def test_batch_size_follows_memory_budget(vendor_df):
+    # one million rows: the old fixed 500 shuffles would need ~16 GB per batch
+    assert permutation_batch_size(10**6) == 8
+    assert permutation_batch_size(10**6, memory_budget=2**20) == 1
+    assert permutation_batch_size(400, memory_budget=32 * 400 * 64) == 64
+
+    explicit = permutation_test(vendor_df['gmv'], vendor_df['cohort_id'], n_permutations=200,
+                                batch_size=64, seed=3)
+    budgeted = permutation_test(vendor_df['gmv'], vendor_df['cohort_id'], n_permutations=200,
+                                memory_budget=32 * 400 * 64, seed=3)
+    assert budgeted == explicit
+
+
+def test_process_workers_match_serial(vendor_df):
+    serial = permutation_test(vendor_df['gmv'], vendor_df['cohort_id'],
+                              n_permutations=299, batch_size=50, seed=5)
+    parallel = permutation_test(vendor_df['gmv'], vendor_df['cohort_id'],
+                                n_permutations=299, batch_size=50, seed=5, n_jobs=2)
+
+    assert parallel == serial
+
+
+def test_raw_integer_cohort_ids(vendor_df):
+    ids = np.array([10**9, 10**9 + 7, -3, 12, 5, 6, 7, 8])[vendor_df['cohort_id']]
+    raw = permutation_test(vendor_df['gmv'], ids, n_permutations=99, seed=2)
+    dense = permutation_test(vendor_df['gmv'], vendor_df['cohort_id'], n_permutations=99, seed=2)
+
+    assert raw == dense
@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 import pandas as pd
 import numpy as np
@@ -7,6 +9,8 @@ from .cohort_statistics import (
     calculate_anova_components,
     find_outliers_iqr,
     find_outliers_mean_multiple,
+    get_groups,
+    kruskal_wallis,
     process_dataframes_for_outliers 
 )
 
@@ -226,4 +230,67 @@ def test_process_dataframes_for_outliers_multiple_dfs(sample_dataframes, value_c
 
     # Basic check for df3_single_cohort_test row
     df3_row = results_df[results_df['df_name'] == 'df3_single_cohort_test'].iloc[0]
-    assert np.isnan(df3_row['f_stat_scipy']) # type: ignore
\ No newline at end of file
+    assert np.isnan(df3_row['f_stat_scipy']) # type: ignore
+
+
+@pytest.mark.parametrize('df_name', ['df1_test', 'df2_test'])
+def test_kruskal_wallis_matches_scipy_on_fixtures(sample_dataframes, value_column, group_column, df_name):
+    df = sample_dataframes[df_name]
+    kw_h_expected, kw_p_expected = kruskal(*get_groups(df, value_column, group_column))
+
+    kw_h, kw_p, kw_eps_sq = kruskal_wallis(df[value_column], df[group_column])
+
+    assert kw_h == pytest.approx(kw_h_expected, rel=1e-9)
+    assert kw_p == pytest.approx(kw_p_expected, rel=1e-9)
+    assert kw_eps_sq == pytest.approx(kw_h_expected / (len(df) + 1), rel=1e-9)
+
+
+def test_kruskal_wallis_ties_and_small_cohorts():
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({
+        # rounded, zero-inflated values give many ties
+        'value': np.where(rng.random(3000) < 0.3, 0.0, np.round(rng.exponential(5.0, 3000))),
+        'cohort_id': rng.integers(0, 400, size=3000)
+    })
+    kw_h_expected, kw_p_expected = kruskal(*get_groups(df, 'value', 'cohort_id'))
+
+    codes, _ = pd.factorize(df['cohort_id'])
+    kw_h, kw_p, _ = kruskal_wallis(df['value'].values, codes, codes_are_dense=True)
+
+    assert kw_h == pytest.approx(kw_h_expected, rel=1e-9)
+    assert kw_p == pytest.approx(kw_p_expected, rel=1e-9)
+
+
+def test_kruskal_wallis_raw_integer_cohort_ids():
+    rng = np.random.default_rng(4)
+    values = rng.exponential(5.0, 40)
+    # BigQuery-style ids: large, and a legitimate negative one
+    cohort_ids = np.repeat([10**9, 10**9 + 7, -3, 12], 10)
+    small_ids = np.repeat([0, 1, 2, 3], 10)
+
+    assert kruskal_wallis(values, cohort_ids) == kruskal_wallis(values, small_ids)
+    kw_h, _, _ = kruskal_wallis(values, cohort_ids)
+    assert kw_h == pytest.approx(kruskal(*np.split(values, 4)).statistic, rel=1e-9)
+
+
+@pytest.mark.parametrize('df_name', ['df3_single_cohort_test', 'df4_small_cohorts_test'])
+def test_kruskal_wallis_too_few_cohorts(sample_dataframes, value_column, group_column, df_name):
+    df = sample_dataframes[df_name]
+    assert all(np.isnan(kruskal_wallis(df[value_column], df[group_column])))
+
+
+def test_process_dataframes_for_outliers_parallel_matches_serial(sample_dataframes, value_column, group_column):
+    serial = process_dataframes_for_outliers(sample_dataframes, value_column, group_column)
+    parallel = process_dataframes_for_outliers(sample_dataframes, value_column, group_column, n_jobs=2)
+
+    assert list(parallel['df_name']) == list(sample_dataframes.keys())
+    pd.testing.assert_frame_equal(parallel, serial)
+
+
+def test_process_dataframes_for_outliers_executor_reports_failing_table(sample_dataframes, value_column, group_column):
+    broken = dict(sample_dataframes)
+    broken['broken_test'] = sample_dataframes['df1_test'].drop(columns=[value_column])
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        with pytest.raises(RuntimeError, match="broken_test"):
+            process_dataframes_for_outliers(broken, value_column, group_column, executor=executor)
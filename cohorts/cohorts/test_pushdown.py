@@ -0,0 +1,119 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from .cohort_statistics import compare_outlier_methods, process_dataframes_for_outliers
+from .config_manager import TableConfig
+from .pushdown import (
+    aggregates_to_outlier_comparison,
+    build_cohort_aggregate_sql,
+    process_tables_for_outliers_pushdown
+)
+
+
+@pytest.fixture
+def vendor_df():
+    rng = np.random.default_rng(5)
+    values = np.round(rng.lognormal(1.0, 1.2, size=1500), 2)
+    values[rng.random(1500) < 0.05] = np.nan
+    return pd.DataFrame({
+        'vendor_code': [f"v{i}" for i in range(1500)],
+        'cvr': values,
+        'cohort_id': rng.integers(0, 120, size=1500)
+    })
+
+
+@pytest.fixture
+def sqlite_reader(vendor_df):
+    """A local SQL engine stand-in for BigQuery."""
+    connection = sqlite3.connect(":memory:")
+    vendor_df.to_sql("kpi_table", connection, index=False)
+
+    def reader(sql_query, project_id):
+        return pd.read_sql_query(sql_query, connection)
+
+    yield reader
+    connection.close()
+
+
+def test_build_cohort_aggregate_sql_unknown_dialect():
+    with pytest.raises(ValueError, match="Unknown dialect"):
+        build_cohort_aggregate_sql("t", "cvr", dialect="postgres")
+
+
+def test_build_cohort_aggregate_sql_bigquery_uses_div():
+    sql_query = build_cohort_aggregate_sql("project.dataset.table", "cvr")
+    assert "FROM `project.dataset.table` AS t" in sql_query
+    assert "DIV((n_valid - 1) * 2, 4)" in sql_query
+
+
+def test_aggregates_match_compare_outlier_methods(vendor_df, sqlite_reader):
+    aggregates = sqlite_reader(build_cohort_aggregate_sql("kpi_table", "cvr", dialect="sqlite"), project_id="p")
+    assert len(aggregates) == vendor_df['cohort_id'].nunique()
+
+    from_sql = aggregates_to_outlier_comparison(aggregates).sort_values('cohort').reset_index(drop=True)
+    expected = compare_outlier_methods(vendor_df, 'cvr', 'cohort_id').sort_values('cohort').reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(from_sql, expected, check_dtype=False)
+
+
+def test_pushdown_summary_matches_local_processing(vendor_df, sqlite_reader):
+    config = TableConfig()
+    object.__setattr__(config, '_config', {
+        "base": {"even": {"recommendation (KPIs)": {"current": "kpi_table"}}}
+    })
+
+    pushed = process_tables_for_outliers_pushdown(
+        "recommendation (KPIs)", config, 'cvr', "p", fill_value=0.0,
+        reader=sqlite_reader, dialect="sqlite"
+    ).iloc[0]
+    local = process_dataframes_for_outliers(
+        {'base-even-recommendation (KPIs)-current': vendor_df.fillna({'cvr': 0})}, 'cvr', 'cohort_id'
+    ).iloc[0]
+
+    assert pushed['df_name'] == local['df_name']
+    for column in ['share_cohorts_with_outlier_IQR', 'share_cohorts_with_outlier_5x', 'iqr_total_outliers',
+                   'mean_5x_total_outliers', 'overlap_total_vendors', 'f_stat_manual', 'ms_b_manual', 'ms_w_manual']:
+        assert pushed[column] == pytest.approx(local[column], rel=1e-9)
+    assert np.isnan(pushed['KW_H'])
+
+
+def test_nan_fill_value_is_rendered_as_null(vendor_df, sqlite_reader):
+    sql_query = build_cohort_aggregate_sql("kpi_table", "cvr", fill_value=np.nan, dialect="sqlite")
+    assert "nan" not in sql_query
+    assert "COALESCE(1.0 * t.cvr, NULL)" in sql_query
+
+    with_nan = sqlite_reader(sql_query, project_id="p")
+    without = sqlite_reader(build_cohort_aggregate_sql("kpi_table", "cvr", dialect="sqlite"), project_id="p")
+    pd.testing.assert_frame_equal(with_nan, without)
+
+    with pytest.raises(ValueError, match="finite"):
+        build_cohort_aggregate_sql("kpi_table", "cvr", fill_value=np.inf)
+
+
+def test_failing_tables_are_skipped_and_reported(sqlite_reader, capsys):
+    config = TableConfig()
+    object.__setattr__(config, '_config', {
+        "base": {"even": {"recommendation (KPIs)": {"current": "kpi_table", "original": "missing_table"}},
+                 "uneven": {"recommendation (KPIs)": {"current": "kpi_table"}}}
+    })
+    calls = []
+
+    def flaky_reader(sql_query, project_id):
+        calls.append(sql_query)
+        if len(calls) == 1:
+            raise ConnectionError("transient")
+        return sqlite_reader(sql_query, project_id)
+
+    pushed = process_tables_for_outliers_pushdown(
+        "recommendation (KPIs)", config, 'cvr', "p", reader=flaky_reader, dialect="sqlite",
+        retries=1, retry_wait=0.0
+    )
+
+    assert pushed['df_name'].tolist() == ['base-even-recommendation (KPIs)-current',
+                                          'base-uneven-recommendation (KPIs)-current']
+    output = capsys.readouterr().out
+    assert "Skipped 1 tables due to errors" in output
+    assert "missing_table" in output
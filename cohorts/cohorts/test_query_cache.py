@@ -0,0 +1,127 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from .cohort_statistics import load_dataframes_by_type
+from .config_manager import TableConfig
+from . import query_cache
+from .query_cache import QueryCache
+
+
+@pytest.fixture
+def counting_reader():
+    calls = []
+
+    def reader(sql_query, project_id):
+        calls.append(sql_query)
+        return pd.DataFrame({'value': range(100), 'query': sql_query})
+
+    reader.calls = calls
+    return reader
+
+
+def test_key_depends_on_sql_and_project():
+    assert QueryCache.key("SELECT 1", "p1") == QueryCache.key("SELECT 1", "p1")
+    assert QueryCache.key("SELECT 1", "p1") != QueryCache.key("SELECT 1", "p2")
+    assert QueryCache.key("SELECT 1", "p1") != QueryCache.key("SELECT 2", "p1")
+
+
+def test_cached_reader_hits_and_force_refresh(tmp_path, counting_reader):
+    cache = QueryCache(tmp_path)
+    reader = cache.cached_reader(counting_reader)
+
+    first = reader("SELECT 1", project_id="p")
+    second = reader("SELECT 1", project_id="p")
+    pd.testing.assert_frame_equal(first, second)
+    assert len(counting_reader.calls) == 1
+
+    cache.cached_reader(counting_reader, force_refresh=True)("SELECT 1", project_id="p")
+    assert len(counting_reader.calls) == 2
+
+
+def test_ttl_expires_entries(tmp_path, counting_reader):
+    cache = QueryCache(tmp_path, ttl_seconds=60)
+    cache.put("SELECT 1", "p", counting_reader("SELECT 1", "p"))
+    assert cache.get("SELECT 1", "p") is not None
+
+    path = cache.path("SELECT 1", "p")
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert cache.get("SELECT 1", "p") is None
+    assert path in cache.evict()
+
+
+def test_size_limit_evicts_least_recently_used(tmp_path, counting_reader):
+    cache = QueryCache(tmp_path)
+    for i, query in enumerate(["SELECT 1", "SELECT 2", "SELECT 3"]):
+        cache.put(query, "p", counting_reader(query, "p"))
+        stamp = time.time() - 100 + i
+        os.utime(cache.path(query, "p"), (stamp, stamp))
+    entry_size = cache.path("SELECT 1", "p").stat().st_size
+
+    # Reading the oldest entry makes it the most recently used
+    cache.get("SELECT 1", "p")
+    limited = QueryCache(tmp_path, max_bytes=2 * entry_size + entry_size // 2)
+    removed = limited.evict()
+
+    assert removed == [limited.path("SELECT 2", "p")]
+    assert limited.get("SELECT 1", "p") is not None
+    assert limited.get("SELECT 3", "p") is not None
+
+
+def test_cache_write_failure_does_not_fail_the_read(tmp_path, counting_reader, monkeypatch, capsys):
+    def failing_to_parquet(self, path, *args, **kwargs):
+        open(path, 'wb').close()
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', failing_to_parquet)
+    config = TableConfig()
+    object.__setattr__(config, '_config', {
+        "cat": {"even": {"cohort data": {"current": "path_current"}}}
+    })
+    cache = QueryCache(tmp_path)
+
+    dfs = load_dataframes_by_type("cohort data", "SELECT * FROM `{table_path}`", config, "p",
+                                  retries=2, retry_wait=0, reader=counting_reader, cache=cache)
+
+    assert len(dfs) == 1
+    # Not retried, and no temporary files left behind
+    assert len(counting_reader.calls) == 1
+    assert list(tmp_path.iterdir()) == []
+    assert "[WARNING] Could not cache" in capsys.readouterr().out
+
+
+def test_eviction_during_read_keeps_the_open_entry(tmp_path, counting_reader, monkeypatch):
+    cache = QueryCache(tmp_path)
+    cache.put("SELECT 1", "p", counting_reader("SELECT 1", "p"))
+    read_parquet = pd.read_parquet
+
+    def evicting_read_parquet(source, *args, **kwargs):
+        # Another thread evicts the entry once it has been opened
+        assert QueryCache(tmp_path, max_bytes=0).evict() == [cache.path("SELECT 1", "p")]
+        return read_parquet(source, *args, **kwargs)
+
+    monkeypatch.setattr(query_cache.pd, 'read_parquet', evicting_read_parquet)
+    df = cache.get("SELECT 1", "p")
+
+    pd.testing.assert_frame_equal(df, counting_reader("SELECT 1", "p"))
+    assert not cache.path("SELECT 1", "p").exists()
+
+
+def test_load_dataframes_by_type_uses_cache(tmp_path, counting_reader):
+    config = TableConfig()
+    object.__setattr__(config, '_config', {
+        "cat": {"even": {"cohort data": {"current": "path_current", "original": "path_original"}}}
+    })
+    cache = QueryCache(tmp_path)
+
+    first = load_dataframes_by_type("cohort data", "SELECT * FROM `{table_path}`", config, "p",
+                                    reader=counting_reader, cache=cache)
+    second = load_dataframes_by_type("cohort data", "SELECT * FROM `{table_path}`", config, "p",
+                                     reader=counting_reader, cache=cache)
+
+    assert len(counting_reader.calls) == 2
+    for key in first:
+        pd.testing.assert_frame_equal(first[key], second[key])
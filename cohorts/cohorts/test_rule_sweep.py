@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from .cohort_statistics import anova_from_moments, get_cohort_moments
+from .rule_sweep import RuleLattice, all_rules, sweep_cohort_rules
+
+
+@pytest.fixture
+def vendor_base():
+    rng = np.random.default_rng(13)
+    n = 4000
+    df = pd.DataFrame({
+        'city': rng.choice(['berlin', 'hamburg', 'munich', 'cologne'], n),
+        'budget': rng.choice(['1', '2', '3'], n),
+        'cuisine': rng.choice(['pizza', 'burger', 'sushi', 'thai', 'indian'], n),
+        'vendor_grade': rng.choice(['A', 'B', 'C', None], n),
+    })
+    df['gmv'] = rng.lognormal(3.0, 1.0, n) * df['budget'].astype(int)
+    df.loc[rng.random(n) < 0.05, 'gmv'] = np.nan
+    return df
+
+
+DIMENSIONS = ['city', 'budget', 'cuisine', 'vendor_grade']
+
+
+def _cohort_key(df, rule):
+    return df[list(rule)].fillna('missing').agg('|'.join, axis=1).to_numpy()
+
+
+@pytest.mark.parametrize('rule', [('city',), ('budget', 'vendor_grade'), ('city', 'cuisine', 'vendor_grade'),
+                                  ('city', 'budget', 'cuisine', 'vendor_grade')])
+def test_rollup_matches_direct_grouping(vendor_base, rule):
+    lattice = RuleLattice.from_frame(vendor_base, 'gmv', DIMENSIONS)
+    rolled = lattice.rollup(rule)
+    rolled.index = _cohort_key(rolled, rule)
+
+    cohort_id = _cohort_key(vendor_base, rule)
+    direct = get_cohort_moments(vendor_base.assign(cohort_id=cohort_id), 'gmv', 'cohort_id')
+    direct = direct.loc[rolled.index]
+
+    np.testing.assert_array_equal(rolled['count'].to_numpy(), direct['count'].to_numpy())
+    np.testing.assert_allclose(rolled['sum'].to_numpy(), direct['sum'].to_numpy())
+    np.testing.assert_allclose(rolled['m2'].to_numpy(), direct['m2'].to_numpy(), rtol=1e-9)
+    assert rolled['rows'].sum() == len(vendor_base)
+
+
+def test_rollups_reuse_cached_parents(vendor_base):
+    lattice = RuleLattice.from_frame(vendor_base, 'gmv', DIMENSIONS)
+    coarse_first = lattice.rollup(['city', 'budget'])
+    lattice.rollup(['city', 'budget', 'cuisine'])
+
+    pd.testing.assert_frame_equal(lattice.rollup(['city', 'budget']), coarse_first)
+    assert len(lattice.rollup(['city'])) == 4
+    with pytest.raises(ValueError):
+        lattice.rollup(['country'])
+    with pytest.raises(ValueError):
+        lattice.rollup([])
+
+
+def test_sweep_scores_every_rule(vendor_base):
+    results = sweep_cohort_rules(vendor_base, 'gmv', DIMENSIONS)
+
+    assert len(results) == 15
+    assert results['rule'].iloc[0] == 'city + budget + cuisine + vendor_grade'
+    budget = results.set_index('rule').loc['budget']
+    cohort_id = vendor_base['budget']
+    expected = anova_from_moments(get_cohort_moments(vendor_base.assign(cohort_id=cohort_id), 'gmv', 'cohort_id'))
+    assert (budget['f_stat'], budget['ms_b'], budget['ms_w']) == pytest.approx(expected)
+    assert budget['n_cohorts'] == 3
+    assert budget['share_vendors_eligible'] == 1.0
+    # Budget drives the values, so rules without it separate cohorts less
+    assert budget['f_stat'] > results.set_index('rule').loc['city', 'f_stat']
+
+
+def test_all_rules_limits_size():
+    rules = all_rules(['a', 'b', 'c'], max_dimensions=2)
+    assert rules == [('a', 'b'), ('a', 'c'), ('b', 'c'), ('a',), ('b',), ('c',)]
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from .cohort_statistics import load_dataframes_by_type, process_dataframes, process_dataframes_for_outliers
+from .config_manager import TableConfig
+from .schema import ARROW_STRING, KPI_SCHEMA, FrameSchema
+
+
+@pytest.fixture
+def raw_kpi_df():
+    rng = np.random.default_rng(6)
+    n = 2000
+    return pd.DataFrame({
+        'entity_id': rng.choice(['TB_AE', 'YS_TR', 'PY_AR'], size=n),
+        'vendor_code': [f"vendor_{i}" for i in range(n)],
+        'cohort_id': rng.integers(0, 50, size=n).astype(str),
+        'cohort_features': rng.choice(['{"entity": "tb_ae"}', '{"entity": "ys_tr"}'], size=n),
+        'vendor_name': [f"Vendor number {i}" for i in range(n)],
+        'cvr': rng.random(n).astype(str),
+        'new_customer_orders': rng.integers(0, 100, size=n)
+    })
+
+
+def test_apply_schema_dtypes(raw_kpi_df):
+    typed = KPI_SCHEMA.apply(raw_kpi_df)
+
+    for col in ['entity_id', 'vendor_code', 'cohort_id', 'cohort_features']:
+        assert isinstance(typed[col].dtype, pd.CategoricalDtype)
+    assert typed['vendor_name'].dtype == ARROW_STRING
+    assert typed['cvr'].dtype == np.float32
+    assert typed['new_customer_orders'].dtype == np.int8
+    # The input is left untouched
+    assert raw_kpi_df['cvr'].dtype == object
+    assert typed.memory_usage(deep=True).sum() < raw_kpi_df.memory_usage(deep=True).sum() / 3
+
+
+def test_apply_schema_coerces_invalid_values():
+    schema = FrameSchema(numeric_columns=('gmv',), downcast=False)
+    typed = schema.apply(pd.DataFrame({'gmv': ['1.5', 'invalid_gmv', None]}))
+    assert typed['gmv'].dtype == np.float64
+    assert typed['gmv'].iloc[0] == pytest.approx(1.5)
+    assert typed['gmv'].isna().sum() == 2
+
+
+def test_typed_frames_flow_through_processing(raw_kpi_df):
+    config = TableConfig()
+    object.__setattr__(config, '_config', {
+        "base": {"even": {"recommendation (KPIs)": {"current": "kpi_current", "original": "kpi_original"}}}
+    })
+    loaded = load_dataframes_by_type("recommendation (KPIs)", "SELECT * FROM `{table_path}`", config, "p",
+                                     reader=lambda sql_query, project_id: raw_kpi_df, schema=KPI_SCHEMA)
+    original_key = "base-even-recommendation (KPIs)-original"
+    processed = process_dataframes(loaded[original_key],
+                                   {k: v for k, v in loaded.items() if k != original_key},
+                                   value_column='cvr')
+    current = processed["base-even-recommendation (KPIs)-current"]
+    assert (current['_merge'] == 'both').all()
+    assert current['cvr'].dtype == np.float32
+
+    typed_summary = process_dataframes_for_outliers({'typed': current}, 'cvr', 'cohort_id')
+    raw_summary = process_dataframes_for_outliers(
+        {'typed': raw_kpi_df.assign(cvr=raw_kpi_df['cvr'].astype(np.float32))}, 'cvr', 'cohort_id'
+    )
+    pd.testing.assert_frame_equal(typed_summary, raw_summary)
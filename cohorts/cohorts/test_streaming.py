@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from .cohort_statistics import compare_outlier_methods, process_dataframes_for_outliers
+from .streaming import (
+    KLLSketch,
+    StreamingOutlierAnalysis,
+    iter_parquet_batches,
+    process_batches_for_outliers
+)
+
+
+@pytest.fixture
+def vendor_df():
+    rng = np.random.default_rng(11)
+    values = np.round(rng.lognormal(1.0, 1.2, size=3000), 2)
+    values[rng.random(3000) < 0.05] = np.nan
+    return pd.DataFrame({
+        'cvr': values,
+        'cohort_id': rng.integers(0, 200, size=3000)
+    })
+
+
+def _batches(df, batch_size):
+    return (df.iloc[start:start + batch_size] for start in range(0, len(df), batch_size))
+
+
+def test_sketch_is_exact_below_capacity():
+    values = np.random.default_rng(0).normal(size=150)
+    sketch = KLLSketch(k=200)
+    sketch.update(values[:70])
+    sketch.update(values[70:])
+
+    assert sketch.exact
+    assert sketch.rank_error_bound() == 0
+    for q in (0.1, 0.25, 0.5, 0.75):
+        assert sketch.quantile(q) == pytest.approx(np.quantile(values, q))
+    assert sketch.rank(0.0) == (values < 0).sum()
+
+
+def test_sketch_error_within_reported_bound():
+    values = np.random.default_rng(1).lognormal(size=50_000)
+    sketch = KLLSketch(k=64, rng=np.random.default_rng(2))
+    for chunk in np.array_split(values, 25):
+        sketch.update(chunk)
+
+    assert not sketch.exact
+    assert sum(len(level) for level in sketch.levels) <= 3 * 64 + 2 * len(sketch.levels)
+    bound = sketch.rank_error_bound(delta=0.001)
+    for x in np.quantile(values, [0.05, 0.25, 0.5, 0.75, 0.95]):
+        assert abs(sketch.rank(x) - (values < x).sum()) <= bound
+
+
+def test_sketch_capacities_decay_below_top_level():
+    sketch = KLLSketch(k=90, rng=np.random.default_rng(5))
+    sketch.update(np.arange(100_000, dtype=float))
+
+    top = len(sketch.levels) - 1
+    assert sketch.capacity(top) == 90
+    assert sketch.capacity(top - 1) == 60
+    assert sketch.capacity(0) == 2
+    assert all(len(level) <= sketch.capacity(h) for h, level in enumerate(sketch.levels))
+
+
+def test_sketch_sorted_view_refreshes_after_update():
+    sketch = KLLSketch(k=200)
+    sketch.update([1.0, 2.0, 3.0])
+    assert sketch.rank(2.5) == 2
+    assert sketch.quantile(1.0) == 3.0
+
+    sketch.update([0.0, 10.0])
+
+    assert sketch.rank(2.5) == 3
+    assert sketch.quantile(1.0) == 10.0
+
+
+def test_sketch_merge_keeps_count_and_error():
+    rng = np.random.default_rng(3)
+    left, right = KLLSketch(k=32, rng=rng), KLLSketch(k=32, rng=rng)
+    left.update(rng.normal(size=5_000))
+    right.update(rng.normal(size=3_000))
+    variance = left.variance + right.variance
+
+    left.merge(right)
+
+    assert left.n == 8_000
+    assert left.variance >= variance
+    assert sum(len(level) * 2**h for h, level in enumerate(left.levels)) == 8_000
+
+
+def test_streaming_matches_in_memory_when_exact(vendor_df):
+    analysis = StreamingOutlierAnalysis('cvr', 'cohort_id', k=200, seed=0)
+    for batch in _batches(vendor_df, 400):
+        analysis.update(batch)
+
+    streamed = analysis.outlier_comparison().sort_values('cohort').reset_index(drop=True)
+    expected = compare_outlier_methods(vendor_df, 'cvr', 'cohort_id').sort_values('cohort').reset_index(drop=True)
+
+    assert streamed['exact'].all()
+    assert (streamed['iqr_outliers_error_bound'] == 0).all()
+    pd.testing.assert_frame_equal(streamed[expected.columns], expected, check_dtype=False)
+
+
+def test_process_batches_matches_in_memory_summary(vendor_df):
+    # The in-memory F statistic is NaN when any value is missing
+    vendor_df = vendor_df.fillna({'cvr': 0.0})
+    streamed = process_batches_for_outliers(
+        {'rule_a': _batches(vendor_df, 500)}, 'cvr', 'cohort_id'
+    )
+    expected = process_dataframes_for_outliers({'rule_a': vendor_df}, 'cvr', 'cohort_id')
+
+    for col in ['share_cohorts_with_outlier_IQR', 'share_cohorts_with_outlier_5x',
+                'iqr_total_outliers', 'mean_5x_total_outliers', 'overlap_total_vendors',
+                'f_stat_manual', 'ms_b_manual', 'ms_w_manual']:
+        assert streamed.loc[0, col] == pytest.approx(expected.loc[0, col]), col
+    assert np.isnan(streamed.loc[0, 'KW_H'])
+    assert streamed.loc[0, 'iqr_total_outliers_error_bound'] == 0
+
+
+def test_streaming_mode_of_process_dataframes(vendor_df):
+    vendor_df = vendor_df.fillna({'cvr': 0.0})
+    streamed = process_dataframes_for_outliers(
+        {'rule_a': _batches(vendor_df, 500), 'rule_b': vendor_df}, 'cvr', 'cohort_id', streaming=True
+    )
+    expected = process_batches_for_outliers(
+        {'rule_a': _batches(vendor_df, 500), 'rule_b': vendor_df}, 'cvr', 'cohort_id'
+    )
+
+    pd.testing.assert_frame_equal(streamed, expected)
+    assert streamed.loc[0, 'iqr_total_outliers'] == streamed.loc[1, 'iqr_total_outliers']
+    with pytest.raises(ValueError, match="serially"):
+        process_dataframes_for_outliers({'rule_a': vendor_df}, 'cvr', 'cohort_id',
+                                        streaming=True, n_jobs=2)
+
+
+def test_small_cohorts_stay_buffered(vendor_df):
+    analysis = StreamingOutlierAnalysis('cvr', 'cohort_id', k=20)
+    analysis.update(vendor_df)
+
+    # ~15 values per cohort: only cohorts past k were moved into sketches
+    counts = vendor_df.dropna().groupby('cohort_id').size()
+    assert set(analysis.sketches) == set(counts.index[counts > 20])
+    assert analysis.sizes.sum() == len(vendor_df)
+    assert len(analysis.outlier_comparison(min_cohort_size=1)) == vendor_df['cohort_id'].nunique()
+
+
+def test_split_analyses_merge(vendor_df):
+    whole = StreamingOutlierAnalysis('cvr', 'cohort_id', k=200)
+    whole.update(vendor_df)
+
+    first = StreamingOutlierAnalysis('cvr', 'cohort_id', k=200)
+    second = StreamingOutlierAnalysis('cvr', 'cohort_id', k=200)
+    first.update(vendor_df.iloc[:1000])
+    second.update(vendor_df.iloc[1000:])
+    first.merge(second)
+
+    pd.testing.assert_frame_equal(
+        first.outlier_comparison().sort_values('cohort').reset_index(drop=True),
+        whole.outlier_comparison().sort_values('cohort').reset_index(drop=True)
+    )
+
+
+def test_approximate_counts_within_bound():
+    rng = np.random.default_rng(4)
+    df = pd.DataFrame({
+        'gmv': rng.lognormal(2.0, 1.5, size=40_000),
+        'cohort_id': rng.integers(0, 2, size=40_000)
+    })
+    analysis = StreamingOutlierAnalysis('gmv', 'cohort_id', k=64, seed=1)
+    for batch in _batches(df, 4_000):
+        analysis.update(batch)
+
+    streamed = analysis.outlier_comparison(delta=0.001).sort_values('cohort').reset_index(drop=True)
+    expected = compare_outlier_methods(df, 'gmv', 'cohort_id').sort_values('cohort').reset_index(drop=True)
+
+    assert not streamed['exact'].any()
+    assert (streamed['mean'] - expected['mean']).abs().max() < 1e-9
+    assert ((streamed['mean_5x_outliers'] - expected['mean_5x_outliers']).abs()
+            <= streamed['mean_5x_outliers_error_bound']).all()
+
+
+def test_iter_parquet_batches(tmp_path, vendor_df):
+    path = tmp_path / "kpis.parquet"
+    vendor_df.to_parquet(path)
+
+    batches = list(iter_parquet_batches(str(path), columns=['cvr', 'cohort_id'], batch_size=1000))
+
+    assert [len(batch) for batch in batches] == [1000, 1000, 1000]
+    pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), vendor_df)
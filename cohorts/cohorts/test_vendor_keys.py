@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from .cohort_statistics import process_dataframes
+from .vendor_keys import VendorKeyIndex
+
+
+@pytest.fixture
+def lookup_df():
+    return pd.DataFrame({
+        'entity_id': ['TB_AE', 'TB_AE', 'YS_TR', 'YS_TR', np.nan],
+        'vendor_code': ['v1', 'v2', 'v1', 'v1', 'v9']  # (YS_TR, v1) is duplicated
+    })
+
+
+@pytest.fixture
+def probe_df():
+    return pd.DataFrame({
+        'entity_id': ['TB_AE', 'YS_TR', 'TB_AE', 'PY_AR', np.nan, 'YS_TR'],
+        'vendor_code': ['v2', 'v1', 'v1', 'v1', 'v9', 'v2'],
+        'gmv': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+    })
+
+
+def test_match_counts_and_contains(lookup_df, probe_df):
+    index = VendorKeyIndex.from_frame(lookup_df)
+
+    np.testing.assert_array_equal(index.match_counts(probe_df), [1, 2, 1, 0, 1, 0])
+    np.testing.assert_array_equal(index.contains(probe_df), [True, True, True, False, True, False])
+    assert index.encode(probe_df).dtype == np.int64
+
+
+def test_categorical_keys_match_object_keys(lookup_df, probe_df):
+    index = VendorKeyIndex.from_frame(lookup_df.astype('category'))
+    categorical_probe = probe_df.astype({'entity_id': 'category', 'vendor_code': 'category'})
+
+    np.testing.assert_array_equal(index.match_counts(categorical_probe), index.match_counts(probe_df))
+
+
+def test_left_join_indicator_matches_pd_merge(lookup_df, probe_df):
+    index = VendorKeyIndex.from_frame(lookup_df)
+    rows, indicator = index.left_join_indicator(probe_df)
+    merged = probe_df.take(rows).reset_index(drop=True)
+    merged['_merge'] = indicator
+
+    expected = pd.merge(probe_df, lookup_df, on=['entity_id', 'vendor_code'], how='left', indicator=True)
+
+    pd.testing.assert_frame_equal(merged, expected)
+
+
+def test_none_keys_match_as_in_pd_merge():
+    # pandas_gbq returns NULL strings as None
+    lookup_df = pd.DataFrame({'entity_id': ['A', None, None, None], 'vendor_code': ['1', '1', None, None]})
+    probe_df = pd.DataFrame({'entity_id': [None, None, 'A', np.nan], 'vendor_code': ['1', None, '1', None],
+                             'gmv': [1.0, 2.0, 3.0, 4.0]})
+    index = VendorKeyIndex.from_frame(lookup_df)
+
+    assert (index.keys >= 0).all()
+    np.testing.assert_array_equal(index.match_counts(probe_df), [1, 2, 1, 2])
+    rows, indicator = index.left_join_indicator(probe_df)
+    expected = pd.merge(probe_df, lookup_df, on=['entity_id', 'vendor_code'], how='left', indicator=True)
+    np.testing.assert_array_equal(probe_df['gmv'].to_numpy()[rows], expected['gmv'])
+    assert list(indicator) == list(expected['_merge'])
+
+
+def test_process_dataframes_does_not_mutate_inputs():
+    original_df = pd.DataFrame({'global_entity_id': ['TB_AE'], 'vendor_id': ['v1']})
+    df_to_process = pd.DataFrame({'global_entity_id': ['TB_AE', 'TB_AE'], 'vendor_id': ['v1', 'v2'],
+                                  'gmv': [10.0, np.nan]})
+
+    processed = process_dataframes(original_df, {'rule': df_to_process})
+
+    assert list(original_df.columns) == ['global_entity_id', 'vendor_id']
+    assert list(df_to_process.columns) == ['global_entity_id', 'vendor_id', 'gmv']
+    assert np.isnan(df_to_process['gmv'].iloc[1])
+    assert list(processed['original'].columns) == ['entity_id', 'vendor_code']
+    assert list(processed['rule']['_merge']) == ['both', 'left_only']
+    assert list(processed['rule']['gmv']) == [10.0, 0.0]
@@ -0,0 +1,143 @@
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+
+
+def _vocabulary(values: Series) -> pd.Index:
+    """
+    Unique values of a key column as a plain (non-categorical) Index, NaN included.
+    """
+    _, uniques = pd.factorize(values, use_na_sentinel=False)
+    return pd.Index(np.asarray(uniques))
+
+
+def _missing_position(vocabulary: pd.Index) -> int:
+    """
+      position of the vocabulary's missing-value slot (NaN or None), -1 if it has none
+    """
+    missing = np.flatnonzero(vocabulary.isna())
+    return int(missing[0]) if len(missing) else -1
+
+
+def _positions(vocabulary: pd.Index, values: Series) -> np.ndarray:
+    """
+    Position of each value in `vocabulary`, -1 where it is absent. Missing
+    values (NaN or None) all map to the vocabulary's missing slot. Categorical
+    columns are looked up once per category rather than once per row.
+    """
+    missing_position = _missing_position(vocabulary)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        category_positions = vocabulary.get_indexer(values.cat.categories)
+        codes = values.cat.codes.to_numpy()
+        return np.where(codes >= 0, category_positions[codes], missing_position).astype(np.int64)
+    positions = vocabulary.get_indexer(values).astype(np.int64)
+    positions[values.isna().to_numpy()] = missing_position
+    return positions
+
+
+@dataclass(frozen=True)
+class VendorKeyIndex:
+    """
+    Interns (entity, vendor) pairs as int64 keys, with a sorted index of the
+    keys present in a lookup table.
+
+    Entity and vendor values are each encoded once against a vocabulary, and a
+    pair becomes `entity_position * num_vendors + vendor_position`. Membership
+    and left-join lookups then run on integer arrays with `searchsorted`
+    instead of string-keyed merges. NaN keys match each other, as in `pd.merge`.
+
+    Build it with `from_frame`, then call `match_counts` / `contains` on any
+    frame with the same key columns.
+
+    Attributes:
+        entities (pd.Index): Entity vocabulary.
+        vendors (pd.Index): Vendor vocabulary.
+        keys (np.ndarray): Sorted unique int64 pair keys in the lookup table.
+        counts (np.ndarray): Number of lookup rows with each key.
+    """
+    entities: pd.Index
+    vendors: pd.Index
+    keys: np.ndarray
+    counts: np.ndarray
+
+    @classmethod
+    def from_frame(cls,
+                   df: DataFrame,
+                   entity_col: str = 'entity_id',
+                   vendor_col: str = 'vendor_code') -> "VendorKeyIndex":
+        """
+        Builds the index from the (entity, vendor) pairs of a lookup table.
+
+        Raises:
+            ValueError: If a key value cannot be found in its own vocabulary,
+                        which would otherwise corrupt the pair keys.
+        """
+        entities = _vocabulary(df[entity_col])
+        vendors = _vocabulary(df[vendor_col])
+        entity_positions = _positions(entities, df[entity_col])
+        vendor_positions = _positions(vendors, df[vendor_col])
+        if (entity_positions < 0).any() or (vendor_positions < 0).any():
+            raise ValueError(f"Could not encode every '{entity_col}' / '{vendor_col}' value of the lookup table")
+        pair_keys = entity_positions * len(vendors) + vendor_positions
+        keys, counts = np.unique(pair_keys, return_counts=True)
+        return cls(entities=entities, vendors=vendors, keys=keys, counts=counts)
+
+    def encode(self,
+               df: DataFrame,
+               entity_col: str = 'entity_id',
+               vendor_col: str = 'vendor_code') -> np.ndarray:
+        """
+        Returns the int64 pair key of every row, -1 if the entity or vendor is
+        not in the vocabulary (and so cannot be in the lookup table).
+        """
+        entity_positions = _positions(self.entities, df[entity_col])
+        vendor_positions = _positions(self.vendors, df[vendor_col])
+        known = (entity_positions >= 0) & (vendor_positions >= 0)
+        return np.where(known, entity_positions * len(self.vendors) + vendor_positions, -1)
+
+    def match_counts(self,
+                     df: DataFrame,
+                     entity_col: str = 'entity_id',
+                     vendor_col: str = 'vendor_code') -> np.ndarray:
+        """
+        Returns how many lookup rows match each row of `df` (0 for no match).
+        """
+        pair_keys = self.encode(df, entity_col, vendor_col)
+        if len(self.keys) == 0:
+            return np.zeros(len(pair_keys), dtype=np.int64)
+        slots = np.minimum(np.searchsorted(self.keys, pair_keys), len(self.keys) - 1)
+        found = (pair_keys >= 0) & (self.keys[slots] == pair_keys)
+        return np.where(found, self.counts[slots], 0)
+
+    def contains(self,
+                 df: DataFrame,
+                 entity_col: str = 'entity_id',
+                 vendor_col: str = 'vendor_code') -> np.ndarray:
+        """
+        Returns a boolean mask of the rows of `df` present in the lookup table.
+        """
+        return self.match_counts(df, entity_col, vendor_col) > 0
+
+    def left_join_indicator(self,
+                            df: DataFrame,
+                            entity_col: str = 'entity_id',
+                            vendor_col: str = 'vendor_code') -> Tuple[np.ndarray, pd.Categorical]:
+        """
+        Integer equivalent of `pd.merge(df, lookup[[entity_col, vendor_col]],
+        how='left', indicator=True)`.
+
+        Returns:
+            tuple: The row positions of `df` making up the merged frame (rows
+                   repeat when the lookup has duplicate keys) and the '_merge'
+                   indicator for each merged row.
+        """
+        counts = self.match_counts(df, entity_col, vendor_col)
+        rows = np.repeat(np.arange(len(df)), np.maximum(counts, 1))
+        indicator = pd.Categorical.from_codes(
+            np.where(counts[rows] > 0, 2, 0),
+            categories=['left_only', 'right_only', 'both']
+        )
+        return rows, indicator
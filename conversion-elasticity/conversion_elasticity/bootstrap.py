@@ -0,0 +1,290 @@
+# bootstrap the Wald elasticity from per-assignment sufficient statistics
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from .simulation import ASSIGNMENTS, SimulatedExperiments
+
+# (Z1, Z0) pairs compared in power-analysis.ipynb
+CONTRASTS = (('up', 'same'), ('same', 'down'), ('up', 'down'))
+
+_STATISTICS = 3  # users, conversions, sum of log budget
+
+DEFAULT_MEMORY_BUDGET = 256 * 2**20
+# Bytes per (replicate, cell) of a Wald batch: the int64 weights and their
+# float64 copy in the matrix product with `design`
+_BYTES_PER_CELL = 2 * 8
+
+
+@dataclass(frozen=True)
+class AssignmentCells:
+    """
+    The distinct (assignment, conversion, log budget) rows of an experiment,
+    with how often each occurs.
+
+    Resampling users with replacement is the same as drawing multinomial
+    counts over these cells, and every Wald ratio only needs per-assignment
+    sums, so a bootstrap replicate is one row of weights times `design`.
+
+    Attributes:
+        arm (np.ndarray): Position of each cell's assignment in ASSIGNMENTS.
+        conversion (np.ndarray): 0/1 conversion of the cell.
+        log_budget (np.ndarray): Log budget of the cell.
+        count (np.ndarray): Users in the cell.
+    """
+    arm: np.ndarray
+    conversion: np.ndarray
+    log_budget: np.ndarray
+    count: np.ndarray
+
+    @classmethod
+    def from_frame(cls,
+                   df: DataFrame,
+                   assignment_col: str = 'assignment',
+                   conversion_col: str = 'conversion',
+                   budget_col: str = 'budget') -> "AssignmentCells":
+        """
+        Reduces user rows (as from `get_simulation`) to cells.
+
+        Raises:
+            ValueError: If an assignment is not one of 'down', 'same', 'up'.
+        """
+        arm = pd.Categorical(df[assignment_col], categories=ASSIGNMENTS).codes
+        if (arm < 0).any():
+            raise ValueError(f"'{assignment_col}' must only contain {list(ASSIGNMENTS)}")
+
+        cells = DataFrame({
+            'arm': arm,
+            'conversion': df[conversion_col].to_numpy(dtype=float),
+            'log_budget': np.log(df[budget_col].to_numpy(dtype=float))
+        }).value_counts(sort=False).reset_index()
+        return cls(arm=cells['arm'].to_numpy(), conversion=cells['conversion'].to_numpy(),
+                   log_budget=cells['log_budget'].to_numpy(), count=cells['count'].to_numpy())
+
+    @classmethod
+    def from_experiments(cls, experiments: SimulatedExperiments, replicate: int = 0) -> "AssignmentCells":
+        """
+        Cells of one simulated replicate, without expanding it to users.
+        """
+        cells, counts = experiment_cells(experiments)
+        count = counts[replicate]
+        keep = count > 0
+        return cls(arm=cells.arm[keep], conversion=cells.conversion[keep],
+                   log_budget=cells.log_budget[keep], count=count[keep])
+
+    @property
+    def design(self) -> np.ndarray:
+        """
+        (cells, 3 * 3) matrix; weights @ design gives, per assignment, the
+        users, conversions and sum of log budgets.
+        """
+        design = np.zeros((len(self.arm), len(ASSIGNMENTS), _STATISTICS))
+        rows = np.arange(len(self.arm))
+        design[rows, self.arm, 0] = 1.0
+        design[rows, self.arm, 1] = self.conversion
+        design[rows, self.arm, 2] = self.log_budget
+        return design.reshape(len(self.arm), -1)
+
+
+def experiment_cells(experiments: SimulatedExperiments) -> Tuple[AssignmentCells, np.ndarray]:
+    """
+    Every (arm, budget level, conversion) cell of simulated experiments, and
+    the (replicates, cells) users in each. The returned cells carry the
+    counts of the first replicate.
+    """
+    users, conversions = experiments.users, experiments.conversions
+    replicates = users.shape[0]
+    arm = np.repeat(np.arange(len(ASSIGNMENTS)), users.shape[2])
+    counts = np.concatenate([(users - conversions).reshape(replicates, -1),
+                             conversions.reshape(replicates, -1)], axis=1)
+    cells = AssignmentCells(arm=np.tile(arm, 2),
+                            conversion=np.repeat([0.0, 1.0], arm.size),
+                            log_budget=np.tile(np.log(experiments.budget).ravel(), 2),
+                            count=counts[0])
+    return cells, counts
+
+
+def _check_method(method: str) -> None:
+    if method not in ('multinomial', 'poisson'):
+        raise ValueError(f"Unknown bootstrap method '{method}', use 'multinomial' or 'poisson'")
+
+
+def bootstrap_weights(cells: AssignmentCells, size: int, sample_size: Optional[int] = None,
+                      method: str = 'multinomial', rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    (size, cells) bootstrap weights: how often each cell's users are drawn
+    in each replicate.
+
+    'multinomial' resamples exactly `sample_size` users, as
+    `df.sample(n, replace=True)`; 'poisson' gives every user an independent
+    Poisson(sample_size / users) weight.
+
+    Raises:
+        ValueError: If `method` is unknown.
+    """
+    _check_method(method)
+    rng = rng if rng is not None else np.random.default_rng()
+    total = cells.count.sum()
+    sample_size = total if sample_size is None else sample_size
+    probabilities = cells.count / total
+    if method == 'multinomial':
+        return rng.multinomial(sample_size, probabilities, size=size)
+    return rng.poisson(sample_size * probabilities, size=(size, len(probabilities)))
+
+
+def bootstrap_batch_size(num_cells: int, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                         bytes_per_cell: int = _BYTES_PER_CELL) -> int:
+    """
+    Replicates per batch so one (batch, cells) batch stays within
+    `memory_budget` bytes (at least one). With continuous budgets there is
+    about one cell per user, so this is what keeps large experiments in memory.
+    """
+    return max(1, memory_budget // (bytes_per_cell * max(num_cells, 1)))
+
+
+def batch_seeds(n_boot: int, batch_size: int, seed=None) -> List[Tuple[int, np.random.SeedSequence]]:
+    """
+    (replicates, seed) of each batch; every batch gets its own child of `seed`.
+    """
+    seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    sizes = [min(batch_size, n_boot - start) for start in range(0, n_boot, batch_size)]
+    return list(zip(sizes, seed_sequence.spawn(len(sizes))))
+
+
+def _contrast_positions(contrasts: Sequence[Tuple[str, str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+      positions of Z1 and Z0 in ASSIGNMENTS
+    """
+    positions = {name: position for position, name in enumerate(ASSIGNMENTS)}
+    try:
+        z1 = np.array([positions[z1] for z1, _ in contrasts])
+        z0 = np.array([positions[z0] for _, z0 in contrasts])
+    except KeyError as error:
+        raise ValueError(f"Unknown assignment {error} in contrasts") from None
+    return z1, z0
+
+
+def wald_ratios(sums: np.ndarray, contrasts: Sequence[Tuple[str, str]] = CONTRASTS) -> np.ndarray:
+    """
+    Wald elasticities (delta log conversion rate / delta mean log budget) from
+    per-assignment sums, as `get_wald_estimate_simple` in the notebook.
+
+    Args:
+        sums (np.ndarray): (replicates, 3 * 3) output of weights @ design,
+                           or a single row.
+        contrasts (Sequence[Tuple[str, str]], optional): (Z1, Z0) pairs.
+
+    Returns:
+        np.ndarray: (replicates, len(contrasts)); NaN or inf where an
+                    assignment is empty or has no conversions.
+    """
+    z1, z0 = _contrast_positions(contrasts)
+    sums = np.atleast_2d(sums).reshape(-1, len(ASSIGNMENTS), _STATISTICS)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_rate = np.log(sums[:, :, 1] / sums[:, :, 0])
+        mean_log_budget = sums[:, :, 2] / sums[:, :, 0]
+        return (log_rate[:, z1] - log_rate[:, z0]) / (mean_log_budget[:, z1] - mean_log_budget[:, z0])
+
+
+def bootstrap_wald_replicates(
+    cells: AssignmentCells,
+    n_boot: int = 10000,
+    sample_size: Optional[int] = None,
+    method: str = 'multinomial',
+    contrasts: Sequence[Tuple[str, str]] = CONTRASTS,
+    batch_size: Optional[int] = None,
+    seed=None,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET
+) -> np.ndarray:
+    """
+    Bootstrap replicates of every contrast's Wald ratio.
+
+    Weights are drawn `batch_size` replicates at a time as a (batch, cells)
+    matrix and reduced to per-assignment sums with one matrix product.
+
+    Args:
+        cells (AssignmentCells): The experiment.
+        n_boot (int, optional): Number of replicates. Defaults to 10000.
+        sample_size (Optional[int], optional): Users per replicate. Defaults
+                                               to the users in `cells`.
+        method (str, optional): 'multinomial' resamples exactly `sample_size`
+                                users, as `df.sample(n, replace=True)`;
+                                'poisson' gives every user an independent
+                                Poisson(sample_size / users) weight.
+                                Defaults to 'multinomial'.
+        contrasts (Sequence[Tuple[str, str]], optional): Defaults to CONTRASTS.
+        batch_size (Optional[int], optional): Replicates per batch. Defaults to
+                                              `bootstrap_batch_size(len(cells.count), memory_budget)`.
+        seed (optional): Seed or SeedSequence; each batch gets its own child stream.
+        memory_budget (int, optional): Bytes one batch may use when `batch_size`
+                                       is None. Defaults to DEFAULT_MEMORY_BUDGET (256 MB).
+
+    Returns:
+        np.ndarray: (n_boot, len(contrasts)) Wald ratios.
+
+    Raises:
+        ValueError: If `method` is unknown.
+    """
+    _check_method(method)
+    if batch_size is None:
+        batch_size = bootstrap_batch_size(len(cells.count), memory_budget)
+    design = cells.design
+    replicates = []
+    for size, batch_seed in batch_seeds(n_boot, batch_size, seed):
+        weights = bootstrap_weights(cells, size, sample_size, method, np.random.default_rng(batch_seed))
+        replicates.append(wald_ratios(weights @ design, contrasts))
+
+    if not replicates:
+        return np.empty((0, len(contrasts)))
+    return np.concatenate(replicates)
+
+
+def wald_bootstrap(
+    df: DataFrame,
+    n_boot: int = 10000,
+    sample_size: Optional[int] = None,
+    method: str = 'multinomial',
+    contrasts: Sequence[Tuple[str, str]] = CONTRASTS,
+    quantiles: Tuple[float, float] = (0.05, 0.95),
+    batch_size: Optional[int] = None,
+    seed=None,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET
+) -> DataFrame:
+    """
+    Bootstrapped Wald elasticity for each (Z1, Z0) contrast, replacing the
+    notebook's loop of `get_wald_estimate_simple(df.sample(n, replace=True), z1, z0)`.
+
+    Args:
+        df (DataFrame): User rows with 'assignment', 'conversion' and 'budget'.
+        quantiles (Tuple[float, float], optional): Interval bounds. Defaults
+                                                   to (0.05, 0.95) as in the notebook.
+        n_boot, sample_size, method, contrasts, batch_size, seed, memory_budget: As for
+            `bootstrap_wald_replicates`.
+
+    Returns:
+        DataFrame: One row per contrast with 'z1', 'z0', 'estimate' (on the
+                   full data), and over the finite replicates 'mean',
+                   'ci_lower', 'ci_upper' and 'n_valid'.
+    """
+    cells = AssignmentCells.from_frame(df)
+    estimate = wald_ratios(cells.count @ cells.design, contrasts)[0]
+    replicates = bootstrap_wald_replicates(cells, n_boot=n_boot, sample_size=sample_size, method=method,
+                                           contrasts=contrasts, batch_size=batch_size, seed=seed,
+                                           memory_budget=memory_budget)
+    replicates = np.where(np.isfinite(replicates), replicates, np.nan)
+
+    with np.errstate(invalid='ignore'):
+        summary = DataFrame({
+            'z1': [z1 for z1, _ in contrasts],
+            'z0': [z0 for _, z0 in contrasts],
+            'estimate': estimate,
+            'mean': np.nanmean(replicates, axis=0) if n_boot else np.nan,
+            'ci_lower': np.nanquantile(replicates, quantiles[0], axis=0) if n_boot else np.nan,
+            'ci_upper': np.nanquantile(replicates, quantiles[1], axis=0) if n_boot else np.nan,
+            'n_valid': np.isfinite(replicates).sum(axis=0)
+        })
+    return summary
@@ -0,0 +1,252 @@
+# control-function IV logit, fitted for many weightings of the same cells at once
+
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from scipy.special import expit, logit
+from scipy.stats import norm
+
+from .bootstrap import (DEFAULT_MEMORY_BUDGET, AssignmentCells, batch_seeds, bootstrap_batch_size,
+                        bootstrap_weights, experiment_cells, _check_method)
+from .simulation import ASSIGNMENTS, SimulatedExperiments
+
+_PARAMETERS = 3  # const, log_budget, residual
+
+# Bytes per (replicate, cell) of a fit: the (r, k, 3) design and its weighted
+# copy in the Hessian, plus the weights, residual, probabilities and their
+# products (float64 each)
+_FIT_BYTES_PER_CELL = 12 * 8
+
+
+def _inverse(matrices: np.ndarray) -> np.ndarray:
+    """
+      batched inverse; singular matrices give NaN instead of failing the batch
+    """
+    try:
+        return np.linalg.inv(matrices)
+    except np.linalg.LinAlgError:
+        inverses = np.full(matrices.shape, np.nan)
+        for i, matrix in enumerate(matrices):
+            try:
+                inverses[i] = np.linalg.inv(matrix)
+            except np.linalg.LinAlgError:
+                pass
+        return inverses
+
+
+def _hessian(X: np.ndarray, weights: np.ndarray, params: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+      fitted probabilities and (replicates, 3, 3) negative Hessians of the weighted logit
+    """
+    mu = expit(np.einsum('rkj,rj->rk', X, params))
+    return mu, np.einsum('rkj,rkl->rjl', X * (weights * mu * (1 - mu))[..., None], X)
+
+
+def fit_iv_logit(
+    cells: AssignmentCells,
+    weights: np.ndarray,
+    max_iter: int = 50,
+    tol: float = 1e-8
+) -> Dict[str, np.ndarray]:
+    """
+    The notebook's `simple_iv_logit` for every row of `weights`.
+
+    For each weighting of the cells:
+    1. First stage: weighted OLS of log budget on const + up + down dummies.
+       With a dummy per arm, its fitted values are the arm means, so the
+       residual is log budget minus its (weighted) arm mean.
+    2. Second stage: weighted logit of conversion on const + log budget + residual.
+
+    All logits are fitted together by Newton-Raphson on (replicates, cells,
+    3) arrays, with one batched 3x3 inverse per iteration. Weights are
+    frequency weights, so a row of resampling counts gives the same fit as
+    statsmodels on the resampled user rows.
+
+    Args:
+        cells (AssignmentCells): Distinct (assignment, conversion, log budget) cells.
+        weights (np.ndarray): (replicates, cells) weights, e.g. resampling counts.
+        max_iter (int, optional): Newton iterations. Defaults to 50.
+        tol (float, optional): Convergence threshold on the largest step. Defaults to 1e-8.
+
+    Returns:
+        Dict[str, np.ndarray]: One value per replicate for 'elasticity' and
+                               'residual_coef' (the exogeneity test), their
+                               standard errors 'elasticity_se' and
+                               'residual_se', and 'converged'. Replicates whose
+                               fit fails (e.g. no conversions, perfect
+                               separation) get NaN.
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    replicates = len(weights)
+    arms = np.eye(len(ASSIGNMENTS))[cells.arm]
+    y = cells.conversion
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        arm_means = (weights * cells.log_budget) @ arms / (weights @ arms)
+        residual = cells.log_budget[None, :] - arm_means[:, cells.arm]
+        # centring log budget only moves the intercept and keeps the Hessian well conditioned
+        centre = weights @ cells.log_budget / weights.sum(axis=1)
+        X = np.stack([np.ones_like(residual), cells.log_budget[None, :] - centre[:, None], residual], axis=-1)
+
+        params = np.zeros((replicates, _PARAMETERS))
+        params[:, 0] = logit(np.clip(weights @ y / weights.sum(axis=1), 1e-10, 1 - 1e-10))
+        converged = np.zeros(replicates, dtype=bool)
+        for _ in range(max_iter):
+            mu, hessian = _hessian(X, weights, params)
+            gradient = np.einsum('rkj,rk->rj', X, weights * (y - mu))
+            step = np.einsum('rjl,rl->rj', _inverse(hessian), gradient)
+            params = params + step
+            converged = np.abs(step).max(axis=1) < tol
+            if (converged | ~np.isfinite(step).all(axis=1)).all():
+                break
+
+        covariance = _inverse(_hessian(X, weights, params)[1])
+
+    params[~converged] = np.nan
+    covariance[~converged] = np.nan
+    return {
+        'elasticity': params[:, 1],
+        'elasticity_se': np.sqrt(covariance[:, 1, 1]),
+        'residual_coef': params[:, 2],
+        'residual_se': np.sqrt(covariance[:, 2, 2]),
+        'converged': converged
+    }
+
+
+def _summarise_fits(fits: Dict[str, np.ndarray], confidence: float) -> DataFrame:
+    """
+      per-replicate frame with normal CIs and the exogeneity p-value, as statsmodels reports them
+    """
+    z = norm.ppf(0.5 + confidence / 2)
+    fits = DataFrame(fits)
+    fits['ci_lower'] = fits['elasticity'] - z * fits['elasticity_se']
+    fits['ci_upper'] = fits['elasticity'] + z * fits['elasticity_se']
+    fits['residual_p_value'] = 2 * norm.sf(np.abs(fits['residual_coef'] / fits['residual_se']))
+    return fits[['elasticity', 'elasticity_se', 'ci_lower', 'ci_upper',
+                 'residual_coef', 'residual_se', 'residual_p_value', 'converged']]
+
+
+def iv_logit_estimates(
+    experiments: SimulatedExperiments,
+    confidence: float = 0.95
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    IV-logit elasticity and its confidence interval for every simulated
+    replicate; the estimator the notebook's power loop uses. Pass it as the
+    `estimator` of `power_curve`.
+
+    Returns:
+        tuple: (estimates, ci_lower, ci_upper), one value per replicate.
+    """
+    cells, counts = experiment_cells(experiments)
+    fits = _summarise_fits(fit_iv_logit(cells, counts), confidence)
+    return fits['elasticity'].to_numpy(), fits['ci_lower'].to_numpy(), fits['ci_upper'].to_numpy()
+
+
+def _bootstrap_batch(cells: AssignmentCells, size: int, sample_size: Optional[int], method: str,
+                     seed: np.random.SeedSequence, confidence: float, max_iter: int, tol: float) -> DataFrame:
+    """
+      draw and fit one batch of bootstrap replicates
+    """
+    weights = bootstrap_weights(cells, size, sample_size, method, np.random.default_rng(seed))
+    return _summarise_fits(fit_iv_logit(cells, weights, max_iter=max_iter, tol=tol), confidence)
+
+
+def bootstrap_iv_logit(
+    df: DataFrame,
+    n_boot: int = 1000,
+    sample_size: Optional[int] = None,
+    method: str = 'multinomial',
+    confidence: float = 0.95,
+    batch_size: Optional[int] = None,
+    seed=None,
+    max_iter: int = 50,
+    tol: float = 1e-8,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    n_jobs: Optional[int] = None,
+    executor: Optional[Executor] = None
+) -> DataFrame:
+    """
+    Bootstrap replicates of the control-function IV logit, replacing the
+    notebook's `[simple_iv_logit(df.sample(n=10000, replace=True)) for i in range(100)]`.
+
+    The users are reduced to distinct cells once; each batch of replicates
+    draws (batch, cells) resampling weights and fits all of them with
+    `fit_iv_logit`. Batches are seeded from children of `seed`, so results
+    do not depend on `n_jobs`.
+
+    Args:
+        df (DataFrame): User rows with 'assignment', 'conversion' and 'budget'.
+        n_boot (int, optional): Number of replicates. Defaults to 1000.
+        sample_size (Optional[int], optional): Users per replicate. Defaults
+                                               to all users.
+        method (str, optional): 'multinomial' or 'poisson' weights, see
+                                `bootstrap_weights`. Defaults to 'multinomial'.
+        confidence (float, optional): Level of each fit's CI. Defaults to 0.95.
+        batch_size (Optional[int], optional): Replicates fitted together. Defaults
+                                              to as many as fit in `memory_budget`,
+                                              see `bootstrap_batch_size`.
+        seed (optional): Seed or SeedSequence.
+        max_iter, tol: Newton settings, see `fit_iv_logit`.
+        memory_budget (int, optional): Bytes one batch's fit may use when
+                                       `batch_size` is None; each worker fits
+                                       one batch at a time. Defaults to
+                                       DEFAULT_MEMORY_BUDGET (256 MB).
+        n_jobs (Optional[int], optional): Worker processes. None or 1 runs
+                                          serially; -1 uses all CPUs. Ignored
+                                          if `executor` is given.
+        executor (Optional[Executor], optional): An existing executor. It is not shut down.
+
+    Returns:
+        DataFrame: One row per replicate with 'elasticity', 'elasticity_se',
+                   'ci_lower', 'ci_upper', 'residual_coef', 'residual_se',
+                   'residual_p_value' and 'converged'.
+    """
+    _check_method(method)
+    cells = AssignmentCells.from_frame(df)
+    if batch_size is None:
+        batch_size = bootstrap_batch_size(len(cells.count), memory_budget, _FIT_BYTES_PER_CELL)
+    args = [(cells, size, sample_size, method, batch_seed, confidence, max_iter, tol)
+            for size, batch_seed in batch_seeds(n_boot, batch_size, seed)]
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    if executor is None and (n_jobs is None or n_jobs <= 1):
+        batches = [_bootstrap_batch(*batch_args) for batch_args in args]
+    else:
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=min(n_jobs, max(len(args), 1)))
+        try:
+            futures = [executor.submit(_bootstrap_batch, *batch_args) for batch_args in args]
+            batches = [future.result() for future in futures]
+        finally:
+            if own_executor:
+                executor.shutdown(cancel_futures=True)
+
+    if not batches:
+        return _summarise_fits(fit_iv_logit(cells, np.empty((0, len(cells.count)))), confidence)
+    return pd.concat(batches, ignore_index=True)
+
+
+def summarise_iv_bootstrap(replicates: DataFrame, quantiles: Tuple[float, float] = (0.05, 0.95),
+                           significance: float = 0.05) -> Dict[str, float]:
+    """
+    Bootstrap mean and interval of the elasticity over converged replicates,
+    and the share of them in which the exogeneity test does not reject
+    (residual p-value above `significance`), as the notebook's `iv_ests`.
+    """
+    valid = replicates[replicates['converged']]
+    elasticity = valid['elasticity'].to_numpy()
+    return {
+        'elasticity': float(np.mean(elasticity)) if len(valid) else np.nan,
+        'ci_lower': float(np.quantile(elasticity, quantiles[0])) if len(valid) else np.nan,
+        'ci_upper': float(np.quantile(elasticity, quantiles[1])) if len(valid) else np.nan,
+        'share_exogenous': float(np.mean(valid['residual_p_value'] > significance)) if len(valid) else np.nan,
+        'n_valid': len(valid)
+    }
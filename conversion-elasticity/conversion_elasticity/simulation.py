@@ -0,0 +1,371 @@
+# simulate many budget-change experiments at once, as counts per (budget level, arm)
+
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from scipy.special import expit
+from scipy.stats import norm, poisson
+
+ASSIGNMENTS = np.array(['down', 'same', 'up'])
+DOWN, SAME, UP = 0, 1, 2
+
+BASELINE_BUDGET_MEAN = 100
+MONTHLY_USERS = 650000
+
+# (alpha, elasticity) pairs from power-analysis.ipynb
+GT_PARAMS = [
+    (20, -5),
+    (15, -4),
+    (10, -3),
+    (5, -2),
+    (0, -1),
+    (-2, -1/2),
+    (-3, -1/10)
+]
+
+# Poisson baseline budgets further out in the tails than this are dropped
+_TAIL = 1e-15
+
+
+def get_conversion_probability(alpha: float, beta: float, budget: np.ndarray) -> np.ndarray:
+    """
+    Conversion probability, logistic in log budget: 1 / (1 + exp(-(alpha + beta * log(budget)))).
+    Works elementwise on arrays of budgets.
+    """
+    return expit(alpha + beta * np.log(budget))
+
+
+def baseline_budget_levels(mean: float = BASELINE_BUDGET_MEAN) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The support of the Poisson(mean) baseline budget, without tails of
+    probability below 1e-15, and the renormalised probabilities.
+    """
+    levels = np.arange(max(poisson.ppf(_TAIL, mean), 1), poisson.isf(_TAIL, mean) + 1)
+    probabilities = poisson.pmf(levels, mean)
+    return levels, probabilities / probabilities.sum()
+
+
+@dataclass(frozen=True)
+class SimulatedExperiments:
+    """
+    Replicates of the notebook's randomised budget experiment, reduced to
+    counts per (arm, baseline budget level).
+
+    Users are exchangeable, so a replicate is fully described by how many
+    users land in each (arm, level) cell and how many of them convert. Every
+    estimator of the notebook is a function of these counts.
+
+    Attributes:
+        levels (np.ndarray): (levels,) baseline budgets.
+        users (np.ndarray): (replicates, 3, levels) users per arm
+                            (DOWN, SAME, UP) and baseline budget.
+        conversions (np.ndarray): Converted users, same shape as `users`.
+        budget_change (float): The relative change for 'down' / 'up' users.
+        alpha (float): Intercept of the true conversion curve.
+        beta (float): True elasticity (log budget coefficient).
+    """
+    levels: np.ndarray
+    users: np.ndarray
+    conversions: np.ndarray
+    budget_change: float
+    alpha: float
+    beta: float
+
+    @property
+    def replicates(self) -> int:
+        return self.users.shape[0]
+
+    @property
+    def budget(self) -> np.ndarray:
+        """
+        (3, levels) budget shown to the users of each cell.
+        """
+        multiplier = np.array([1 - self.budget_change, 1.0, 1 + self.budget_change])
+        return multiplier[:, None] * self.levels[None, :]
+
+    @property
+    def conv_prob(self) -> np.ndarray:
+        """
+        (3, levels) conversion probability of each cell.
+        """
+        return get_conversion_probability(self.alpha, self.beta, self.budget)
+
+    def to_frame(self, replicate: int = 0) -> DataFrame:
+        """
+        One replicate as user rows, in the layout of the notebook's
+        `get_simulation` (users ordered by cell, converters first).
+        """
+        users = self.users[replicate].ravel()
+        conversions = self.conversions[replicate].ravel()
+        cells = np.repeat(np.arange(users.size), users)
+        rank_in_cell = np.arange(cells.size) - np.repeat(np.cumsum(users) - users, users)
+        arms = cells // len(self.levels)
+        return DataFrame({
+            "user_id": np.arange(cells.size),
+            "assignment": ASSIGNMENTS[arms],
+            "budget": self.budget.ravel()[cells],
+            "conv_prob": self.conv_prob.ravel()[cells],
+            "conversion": (rank_in_cell < conversions[cells]).astype(np.int64),
+            "base_budget": np.tile(self.levels, 3)[cells]
+        })
+
+
+def simulate_experiments(
+    n_users: int,
+    budget_change: float,
+    alpha: float,
+    beta: float,
+    replicates: int = 1,
+    rng: Optional[np.random.Generator] = None
+) -> SimulatedExperiments:
+    """
+    Vectorised `get_simulation` for `replicates` experiments of `n_users` users.
+
+    As in the notebook, each user gets a Poisson(100) baseline budget and is
+    assigned uniformly to 'down', 'same' or 'up', which scales the budget by
+    (1 - budget_change), 1 or (1 + budget_change); conversion is Bernoulli with
+    `get_conversion_probability(alpha, beta, budget)`. Instead of one draw per
+    user, each replicate draws its cell counts from one multinomial and its
+    conversions per cell from a binomial, which has the same distribution.
+    The cost does not depend on `n_users`.
+
+    Raises:
+        ValueError: If `budget_change` is not strictly between 0 and 1.
+    """
+    if not 0 < budget_change < 1:
+        raise ValueError("budget_change needs to be between zero and one")
+    rng = rng if rng is not None else np.random.default_rng()
+
+    levels, level_probabilities = baseline_budget_levels()
+    cell_probabilities = np.tile(level_probabilities / 3, 3)
+    users = rng.multinomial(n_users, cell_probabilities, size=replicates).reshape(replicates, 3, len(levels))
+
+    multiplier = np.array([1 - budget_change, 1.0, 1 + budget_change])
+    conv_prob = get_conversion_probability(alpha, beta, multiplier[:, None] * levels[None, :])
+    conversions = rng.binomial(users, conv_prob[None, :, :])
+    return SimulatedExperiments(levels=levels, users=users, conversions=conversions,
+                                budget_change=budget_change, alpha=alpha, beta=beta)
+
+
+def wald_estimates(
+    experiments: SimulatedExperiments,
+    z1: int = UP,
+    z0: int = DOWN,
+    confidence: float = 0.95
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The notebook's `get_wald_estimate_simple` (delta log conversion rate /
+    delta mean log budget between arms `z1` and `z0`) for every replicate,
+    with a delta-method confidence interval.
+
+    Returns:
+        tuple: (estimates, ci_lower, ci_upper), one value per replicate.
+    """
+    log_budget = np.log(experiments.budget)
+    users, conversions = experiments.users, experiments.conversions
+
+    def arm_moments(arm: int) -> Tuple[np.ndarray, ...]:
+        n = users[:, arm].sum(axis=1)
+        rate = conversions[:, arm].sum(axis=1) / n
+        mean = users[:, arm] @ log_budget[arm] / n
+        variance = users[:, arm] @ log_budget[arm]**2 / n - mean**2
+        return n, rate, mean, variance / (n - 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n1, p1, b1, var_b1 = arm_moments(z1)
+        n0, p0, b0, var_b0 = arm_moments(z0)
+        denominator = b1 - b0
+        estimates = (np.log(p1) - np.log(p0)) / denominator
+        var_numerator = (1 - p1) / (n1 * p1) + (1 - p0) / (n0 * p0)
+        standard_error = np.sqrt(var_numerator + estimates**2 * (var_b1 + var_b0)) / np.abs(denominator)
+
+    z = norm.ppf(0.5 + confidence / 2)
+    return estimates, estimates - z * standard_error, estimates + z * standard_error
+
+
+def expected_revenue_uplift(experiments: SimulatedExperiments,
+                            sim_change: np.ndarray,
+                            uplift_under: str = 'true',
+                            estimated_elasticity: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The notebook's `simulate_outcomes`: expected revenue sum(p(b) * b) of each
+    replicate's users at their baseline budgets, and after scaling those by
+    (1 + sim_change[replicate]).
+
+    With `uplift_under='true'` both are evaluated on the true curve
+    (`experiments.alpha`, `experiments.beta`), so the uplift shows whether
+    the decision was right. 'estimated' reproduces the notebook, which uses
+    each replicate's estimated elasticity (with the true alpha) for both; that
+    uplift only reflects what the estimate predicts.
+
+    Args:
+        experiments (SimulatedExperiments): The replicates.
+        sim_change (np.ndarray): Budget change applied to each replicate.
+        uplift_under (str, optional): 'true' or 'estimated'. Defaults to 'true'.
+        estimated_elasticity (Optional[np.ndarray], optional): One estimate per
+                                                               replicate; required
+                                                               for 'estimated'.
+
+    Returns:
+        tuple: (original, simulated), one value per replicate.
+
+    Raises:
+        ValueError: If `uplift_under` is unknown, or 'estimated' is given
+                    without `estimated_elasticity`.
+    """
+    if uplift_under == 'true':
+        beta = experiments.beta
+    elif uplift_under == 'estimated':
+        if estimated_elasticity is None:
+            raise ValueError("uplift_under='estimated' needs estimated_elasticity")
+        beta = np.asarray(estimated_elasticity, dtype=float)[:, None]
+    else:
+        raise ValueError(f"Unknown uplift_under '{uplift_under}', use 'true' or 'estimated'")
+
+    alpha, levels = experiments.alpha, experiments.levels
+    users_per_level = experiments.users.sum(axis=1)
+    sim_budget = levels[None, :] * (1 + np.asarray(sim_change, dtype=float))[:, None]
+    original = (users_per_level * get_conversion_probability(alpha, beta, levels[None, :]) * levels).sum(axis=1)
+    simulated = (users_per_level * get_conversion_probability(alpha, beta, sim_budget) * sim_budget).sum(axis=1)
+    return original, simulated
+
+
+Estimator = Callable[[SimulatedExperiments], Tuple[np.ndarray, np.ndarray, np.ndarray]]
+
+
+def simulate_grid_point(
+    alpha: float,
+    elasticity: float,
+    n_users: int,
+    budget_change: float,
+    n_sims: int,
+    sim_change: float,
+    seed: np.random.SeedSequence,
+    chunk_size: Optional[int] = None,
+    estimator: Estimator = wald_estimates,
+    uplift_under: str = 'true'
+) -> Dict[str, float]:
+    """
+    Runs `n_sims` experiments for one (alpha, elasticity) pair and applies the
+    notebook's decision rule to each: lower budgets by `sim_change` if the CI
+    is entirely below -1 (elastic), raise them if it is entirely above -1,
+    otherwise leave them.
+
+    Experiments are simulated `chunk_size` at a time (default: 10000). The
+    uplift is evaluated as `expected_revenue_uplift(..., uplift_under)`;
+    replicates without a finite estimate are left out of its mean under
+    'estimated'.
+    """
+    rng = np.random.default_rng(seed)
+    chunk_size = chunk_size or 10000
+
+    estimates, decisions, uplifts, conversion_rates = [], [], [], []
+    for start in range(0, n_sims, chunk_size):
+        experiments = simulate_experiments(n_users, budget_change, alpha, elasticity,
+                                           replicates=min(chunk_size, n_sims - start), rng=rng)
+        estimate, ci_lower, ci_upper = estimator(experiments)
+        decision = np.where(ci_upper < -1, -1, np.where(ci_lower > -1, 1, 0))
+        original, simulated = expected_revenue_uplift(experiments, decision * sim_change,
+                                                      uplift_under, estimate)
+
+        estimates.append(estimate)
+        decisions.append(decision)
+        uplifts.append(simulated - original)
+        conversion_rates.append(experiments.conversions.sum(axis=(1, 2)) / n_users)
+
+    estimates = np.concatenate(estimates)
+    decisions = np.concatenate(decisions)
+    return {
+        'alpha': alpha,
+        'elasticity': elasticity,
+        'n_sims': n_sims,
+        'conversion_rate': float(np.mean(np.concatenate(conversion_rates))),
+        'mean_estimate': float(np.nanmean(estimates)),
+        'estimate_q05': float(np.nanquantile(estimates, 0.05)),
+        'estimate_q95': float(np.nanquantile(estimates, 0.95)),
+        'share_lower': float(np.mean(decisions == -1)),
+        'share_raise': float(np.mean(decisions == 1)),
+        'share_inconclusive': float(np.mean(decisions == 0)),
+        'mean_uplift': float(np.nanmean(np.concatenate(uplifts)))
+    }
+
+
+def power_curve(
+    grid: Sequence[Tuple[float, float]] = GT_PARAMS,
+    n_users: int = MONTHLY_USERS,
+    budget_change: float = 0.2,
+    n_sims: int = 100,
+    sim_change: float = 0.1,
+    seed: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    estimator: Estimator = wald_estimates,
+    uplift_under: str = 'true',
+    n_jobs: Optional[int] = None,
+    executor: Optional[Executor] = None
+) -> DataFrame:
+    """
+    Share of simulated experiments that lead to lowering / raising budgets, and
+    the expected revenue uplift of acting on them, for each (alpha, elasticity)
+    grid point.
+
+    Every grid point draws from its own child of `SeedSequence(seed)`, so the
+    results for a seed do not depend on `n_jobs`.
+
+    Args:
+        grid (Sequence[Tuple[float, float]], optional): (alpha, elasticity) pairs.
+                                                        Defaults to GT_PARAMS.
+        n_users (int, optional): Users per experiment. Defaults to MONTHLY_USERS.
+        budget_change (float, optional): Relative budget change of the
+                                         'down' / 'up' arms. Defaults to 0.2.
+        n_sims (int, optional): Experiments per grid point. Defaults to 100.
+        sim_change (float, optional): Budget change applied after a
+                                      conclusive experiment. Defaults to 0.1.
+        seed (Optional[int], optional): Defaults to None.
+        chunk_size (Optional[int], optional): Experiments simulated at once.
+        estimator (Estimator, optional): Maps SimulatedExperiments to
+                                         per-replicate (estimate, ci_lower,
+                                         ci_upper). Must be picklable to run
+                                         in processes. Defaults to `wald_estimates`.
+        uplift_under (str, optional): Curve the uplift is evaluated on, 'true' or
+                                      'estimated' (as the notebook); see
+                                      `expected_revenue_uplift`. Defaults to 'true'.
+        n_jobs (Optional[int], optional): Worker processes. None or 1 runs
+                                          serially; -1 uses all CPUs. Ignored
+                                          if `executor` is given.
+        executor (Optional[Executor], optional): An existing executor. It is not shut down.
+
+    Returns:
+        DataFrame: One row per grid point, in grid order.
+
+    Raises:
+        ValueError: If `uplift_under` is unknown.
+    """
+    if uplift_under not in ('true', 'estimated'):
+        raise ValueError(f"Unknown uplift_under '{uplift_under}', use 'true' or 'estimated'")
+    seeds = np.random.SeedSequence(seed).spawn(len(grid))
+    args = [(alpha, elasticity, n_users, budget_change, n_sims, sim_change, point_seed, chunk_size, estimator,
+             uplift_under)
+            for (alpha, elasticity), point_seed in zip(grid, seeds)]
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    if executor is None and (n_jobs is None or n_jobs <= 1):
+        results: List[Dict[str, float]] = [simulate_grid_point(*point_args) for point_args in args]
+    else:
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=min(n_jobs, max(len(args), 1)))
+        try:
+            futures = [executor.submit(simulate_grid_point, *point_args) for point_args in args]
+            results = [future.result() for future in futures]
+        finally:
+            if own_executor:
+                executor.shutdown(cancel_futures=True)
+
+    return pd.DataFrame(results)
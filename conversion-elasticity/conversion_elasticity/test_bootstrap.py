@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from .bootstrap import (CONTRASTS, AssignmentCells, bootstrap_batch_size, bootstrap_wald_replicates,
+                        wald_bootstrap, wald_ratios)
+from .simulation import simulate_experiments
+from .test_simulation import notebook_wald_estimate
+
+
+@pytest.fixture
+def experiment_df():
+    experiments = simulate_experiments(6000, 0.2, 3, -1, rng=np.random.default_rng(0))
+    df = experiments.to_frame(0)
+    # shuffle so that cells are not contiguous
+    return df.sample(frac=1, random_state=1).reset_index(drop=True)
+
+
+def test_full_sample_ratios_match_notebook_function(experiment_df):
+    cells = AssignmentCells.from_frame(experiment_df)
+    ratios = wald_ratios(cells.count @ cells.design)[0]
+
+    assert cells.count.sum() == len(experiment_df)
+    for ratio, (z1, z0) in zip(ratios, CONTRASTS):
+        assert ratio == pytest.approx(notebook_wald_estimate(experiment_df, z1, z0))
+
+
+def test_resample_weights_match_resampled_frame(experiment_df):
+    rng = np.random.default_rng(2)
+    rows = rng.integers(0, len(experiment_df), size=len(experiment_df))
+    resampled = experiment_df.iloc[rows]
+
+    full_cells = AssignmentCells.from_frame(experiment_df)
+    resampled_cells = AssignmentCells.from_frame(resampled)
+    # weights of the resample on the full data's cells
+    keys = pd.MultiIndex.from_arrays([full_cells.arm, full_cells.conversion, full_cells.log_budget])
+    positions = keys.get_indexer(pd.MultiIndex.from_arrays(
+        [resampled_cells.arm, resampled_cells.conversion, resampled_cells.log_budget]))
+    weights = np.zeros(len(keys))
+    weights[positions] = resampled_cells.count
+
+    ratios = wald_ratios((weights @ full_cells.design)[None, :])[0]
+    for ratio, (z1, z0) in zip(ratios, CONTRASTS):
+        assert ratio == pytest.approx(notebook_wald_estimate(resampled, z1, z0))
+
+
+def test_cells_from_experiments_match_frame():
+    experiments = simulate_experiments(3000, 0.2, 5, -2, replicates=2, rng=np.random.default_rng(3))
+    from_experiments = AssignmentCells.from_experiments(experiments, replicate=1)
+    from_frame = AssignmentCells.from_frame(experiments.to_frame(1))
+
+    np.testing.assert_allclose(from_experiments.count @ from_experiments.design,
+                               from_frame.count @ from_frame.design)
+
+
+def test_bootstrap_spread_matches_reference_loop(experiment_df):
+    replicates = bootstrap_wald_replicates(AssignmentCells.from_frame(experiment_df), n_boot=4000,
+                                           sample_size=3000, seed=4)
+    assert replicates.shape == (4000, len(CONTRASTS))
+
+    rng = np.random.RandomState(5)
+    reference = np.array([
+        [notebook_wald_estimate(experiment_df.sample(n=3000, replace=True, random_state=rng), z1, z0)
+         for z1, z0 in CONTRASTS]
+        for _ in range(300)
+    ])
+    np.testing.assert_allclose(np.std(replicates, axis=0), np.std(reference, axis=0), rtol=0.15)
+    np.testing.assert_allclose(np.mean(replicates, axis=0), np.mean(reference, axis=0),
+                               atol=0.25 * np.std(reference, axis=0).max())
+
+
+def test_poisson_weights_agree_with_multinomial(experiment_df):
+    cells = AssignmentCells.from_frame(experiment_df)
+    multinomial = bootstrap_wald_replicates(cells, n_boot=3000, seed=6)
+    poisson = bootstrap_wald_replicates(cells, n_boot=3000, method='poisson', seed=6)
+    np.testing.assert_allclose(np.std(poisson, axis=0), np.std(multinomial, axis=0), rtol=0.1)
+
+
+def test_wald_bootstrap_summary(experiment_df):
+    summary = wald_bootstrap(experiment_df, n_boot=1000, seed=7)
+
+    assert list(summary['z1']) == ['up', 'same', 'up']
+    assert list(summary['z0']) == ['same', 'down', 'down']
+    assert (summary['ci_lower'] < summary['estimate']).all()
+    assert (summary['estimate'] < summary['ci_upper']).all()
+    assert (summary['n_valid'] == 1000).all()
+    pd.testing.assert_frame_equal(summary, wald_bootstrap(experiment_df, n_boot=1000, seed=7))
+
+
+def test_batch_size_follows_cells_and_memory_budget(experiment_df):
+    # continuous budgets: about one cell per user
+    assert bootstrap_batch_size(650_000) == 25
+    assert bootstrap_batch_size(650_000, memory_budget=2**20) == 1
+    assert bootstrap_batch_size(0) == 256 * 2**20 // 16
+
+    cells = AssignmentCells.from_frame(experiment_df)
+    budget = 16 * len(cells.count) * 7
+    np.testing.assert_array_equal(
+        bootstrap_wald_replicates(cells, n_boot=50, seed=8, memory_budget=budget),
+        bootstrap_wald_replicates(cells, n_boot=50, seed=8, batch_size=7)
+    )
+
+
+def test_invalid_inputs(experiment_df):
+    cells = AssignmentCells.from_frame(experiment_df)
+    with pytest.raises(ValueError):
+        bootstrap_wald_replicates(cells, n_boot=10, method='jackknife')
+    with pytest.raises(ValueError):
+        wald_ratios(cells.count @ cells.design, [('up', 'sideways')])
+    with pytest.raises(ValueError):
+        AssignmentCells.from_frame(experiment_df.assign(assignment='control'))
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+from statsmodels.discrete.discrete_model import Logit
+
+from .bootstrap import AssignmentCells, experiment_cells
+from .iv_logit import (bootstrap_iv_logit, fit_iv_logit, iv_logit_estimates,
+                       summarise_iv_bootstrap)
+from .simulation import power_curve, simulate_experiments
+
+
+def simple_iv_logit(df):
+    # power-analysis.ipynb
+    df = df.copy()
+    df['log_budget'] = np.log(df['budget'])
+    df['up_dummy'] = (df['assignment'] == 'up').astype(int)
+    df['down_dummy'] = (df['assignment'] == 'down').astype(int)
+    X_first = sm.add_constant(df[['up_dummy', 'down_dummy']])
+    first_stage = sm.OLS(df['log_budget'], X_first).fit()
+    df['residual_v1'] = first_stage.resid
+    X_second = sm.add_constant(df[['log_budget', 'residual_v1']])
+    return Logit(df['conversion'], X_second).fit(disp=False)
+
+
+@pytest.fixture
+def experiment_df():
+    experiments = simulate_experiments(5000, 0.2, 3, -1, rng=np.random.default_rng(0))
+    return experiments.to_frame(0)
+
+
+def test_fit_matches_statsmodels_on_resampled_rows(experiment_df):
+    cells = AssignmentCells.from_frame(experiment_df)
+    keys = pd.MultiIndex.from_arrays([cells.arm, cells.conversion, cells.log_budget])
+    rng = np.random.default_rng(1)
+
+    samples, weights = [], []
+    for _ in range(3):
+        sample = experiment_df.iloc[rng.integers(0, len(experiment_df), size=len(experiment_df))]
+        sample_cells = AssignmentCells.from_frame(sample)
+        positions = keys.get_indexer(pd.MultiIndex.from_arrays(
+            [sample_cells.arm, sample_cells.conversion, sample_cells.log_budget]))
+        row = np.zeros(len(keys))
+        row[positions] = sample_cells.count
+        samples.append(sample)
+        weights.append(row)
+
+    fits = fit_iv_logit(cells, np.array(weights))
+    assert fits['converged'].all()
+    for i, sample in enumerate(samples):
+        model = simple_iv_logit(sample)
+        assert fits['elasticity'][i] == pytest.approx(model.params['log_budget'], rel=1e-6)
+        assert fits['elasticity_se'][i] == pytest.approx(model.bse['log_budget'], rel=1e-6)
+        assert fits['residual_coef'][i] == pytest.approx(model.params['residual_v1'], rel=1e-6)
+        assert fits['residual_se'][i] == pytest.approx(model.bse['residual_v1'], rel=1e-6)
+
+
+def test_estimator_matches_statsmodels_per_replicate():
+    experiments = simulate_experiments(4000, 0.2, 5, -2, replicates=3, rng=np.random.default_rng(2))
+    estimates, ci_lower, ci_upper = iv_logit_estimates(experiments)
+
+    for replicate in range(3):
+        model = simple_iv_logit(experiments.to_frame(replicate))
+        assert estimates[replicate] == pytest.approx(model.params['log_budget'], rel=1e-6)
+        lower, upper = model.conf_int(alpha=0.05).loc['log_budget']
+        assert ci_lower[replicate] == pytest.approx(lower, rel=1e-6)
+        assert ci_upper[replicate] == pytest.approx(upper, rel=1e-6)
+
+
+def test_failed_fits_are_nan():
+    experiments = simulate_experiments(1000, 0.2, 3, -1, rng=np.random.default_rng(3))
+    cells, counts = experiment_cells(experiments)
+    no_conversions = np.where(cells.conversion == 1, 0, counts[0])
+    fits = fit_iv_logit(cells, np.vstack([counts[0], no_conversions]))
+
+    assert list(fits['converged']) == [True, False]
+    assert np.isfinite(fits['elasticity'][0])
+    assert np.isnan(fits['elasticity'][1]) and np.isnan(fits['elasticity_se'][1])
+
+
+def test_bootstrap_is_reproducible_and_centred(experiment_df):
+    replicates = bootstrap_iv_logit(experiment_df, n_boot=300, batch_size=128, seed=4)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pooled = bootstrap_iv_logit(experiment_df, n_boot=300, batch_size=128, seed=4, executor=executor)
+    pd.testing.assert_frame_equal(replicates, pooled)
+
+    assert len(replicates) == 300 and replicates['converged'].all()
+    full_fit = simple_iv_logit(experiment_df)
+    # the bootstrap spread estimates the sampling error the model reports
+    assert replicates['elasticity'].std() == pytest.approx(full_fit.bse['log_budget'], rel=0.2)
+    assert replicates['elasticity'].mean() == pytest.approx(full_fit.params['log_budget'],
+                                                           abs=0.3 * full_fit.bse['log_budget'])
+
+    summary = summarise_iv_bootstrap(replicates)
+    assert summary['ci_lower'] < summary['elasticity'] < summary['ci_upper']
+    assert summary['n_valid'] == 300
+    # the budget is randomised, so the exogeneity test rejects only at about its size
+    assert summary['share_exogenous'] > 0.5
+
+
+def test_power_curve_with_iv_logit():
+    result = power_curve([(20, -5), (-3, -1 / 10)], n_users=10000, n_sims=10, seed=5,
+                         estimator=iv_logit_estimates)
+    assert list(result['share_lower']) == [1.0, 0.0]
+    assert result.loc[1, 'share_raise'] > 0.5
+    assert result['mean_estimate'].to_numpy() == pytest.approx([-5, -0.1], abs=0.5)
+
+
+def test_bootstrap_batches_follow_memory_budget(experiment_df):
+    cells = AssignmentCells.from_frame(experiment_df)
+    by_budget = bootstrap_iv_logit(experiment_df, n_boot=40, seed=5,
+                                   memory_budget=12 * 8 * len(cells.count) * 16)
+    pd.testing.assert_frame_equal(by_budget, bootstrap_iv_logit(experiment_df, n_boot=40, batch_size=16, seed=5))
+    # a budget below one replicate still fits one at a time
+    assert len(bootstrap_iv_logit(experiment_df, n_boot=3, seed=5, memory_budget=1)) == 3
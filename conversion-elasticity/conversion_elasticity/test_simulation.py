@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from .simulation import (UP, DOWN, expected_revenue_uplift, get_conversion_probability,
+                         power_curve, simulate_experiments, wald_estimates)
+
+
+def notebook_wald_estimate(df, z1, z0):
+    p1 = df.loc[df['assignment'] == z1]['conversion'].mean()
+    p0 = df.loc[df['assignment'] == z0]['conversion'].mean()
+    delta_ln_budget = (np.mean(np.log(df.loc[df.assignment == z1].budget))
+                       - np.mean(np.log(df.loc[df.assignment == z0].budget)))
+    return (np.log(p1) - np.log(p0)) / delta_ln_budget
+
+
+def test_simulated_frame_matches_notebook_layout():
+    experiments = simulate_experiments(3000, 0.2, 0, -1, replicates=4, rng=np.random.default_rng(0))
+    df = experiments.to_frame(2)
+
+    assert list(df.columns) == ['user_id', 'assignment', 'budget', 'conv_prob', 'conversion', 'base_budget']
+    assert len(df) == 3000
+    assert set(df['assignment']) == {'down', 'same', 'up'}
+    ratio = df['budget'] / df['base_budget']
+    np.testing.assert_allclose(ratio, df['assignment'].map({'down': 0.8, 'same': 1.0, 'up': 1.2}))
+    expected_prob = [1 / (1 + np.exp(-(0 - np.log(b)))) for b in df['budget']]
+    np.testing.assert_allclose(df['conv_prob'], expected_prob)
+    assert df['conversion'].sum() == experiments.conversions[2].sum()
+
+
+def test_budget_change_is_validated():
+    with pytest.raises(ValueError):
+        simulate_experiments(10, 1.0, 0, -1)
+
+
+def test_cells_follow_the_notebook_distribution():
+    n_users = 200_000
+    experiments = simulate_experiments(n_users, 0.2, 5, -2, replicates=3, rng=np.random.default_rng(1))
+    df = experiments.to_frame(0)
+
+    assert df['base_budget'].mean() == pytest.approx(100, abs=0.1)
+    assert df['base_budget'].var() == pytest.approx(100, rel=0.02)
+    np.testing.assert_allclose(df['assignment'].value_counts(normalize=True).sort_index(), 1 / 3, atol=5e-3)
+    expected_rate = (experiments.users * experiments.conv_prob).sum(axis=(1, 2)) / n_users
+    np.testing.assert_allclose(experiments.conversions.sum(axis=(1, 2)) / n_users, expected_rate, atol=2e-3)
+
+
+def test_wald_estimates_match_notebook_function():
+    experiments = simulate_experiments(5000, 0.2, 0, -1, replicates=3, rng=np.random.default_rng(2))
+    estimates, ci_lower, ci_upper = wald_estimates(experiments, z1=UP, z0=DOWN)
+
+    for replicate in range(3):
+        df = experiments.to_frame(replicate)
+        assert estimates[replicate] == pytest.approx(notebook_wald_estimate(df, 'up', 'down'))
+    assert np.all(ci_lower < estimates) and np.all(estimates < ci_upper)
+
+
+def test_wald_interval_coverage():
+    # the log conversion-rate elasticity of a logit curve is beta * (1 - p)
+    alpha, beta = 0, -1
+    experiments = simulate_experiments(20_000, 0.2, alpha, beta, replicates=400, rng=np.random.default_rng(3))
+    _, ci_lower, ci_upper = wald_estimates(experiments)
+    truth = beta * (1 - get_conversion_probability(alpha, beta, 100.0))
+    coverage = np.mean((ci_lower < truth) & (truth < ci_upper))
+    assert 0.9 < coverage < 0.99
+
+
+def test_uplift_uses_true_curve():
+    experiments = simulate_experiments(1000, 0.2, 0, -1, replicates=2, rng=np.random.default_rng(4))
+    original, simulated = expected_revenue_uplift(experiments, np.array([0.1, 0.0]))
+
+    base_budget = experiments.to_frame(0)['base_budget'].to_numpy()
+    assert original[0] == pytest.approx(np.sum(get_conversion_probability(0, -1, base_budget) * base_budget))
+    sim_budget = base_budget * 1.1
+    assert simulated[0] == pytest.approx(np.sum(get_conversion_probability(0, -1, sim_budget) * sim_budget))
+    assert simulated[1] == pytest.approx(original[1])
+
+
+def test_uplift_under_estimated_elasticity_matches_notebook():
+    experiments = simulate_experiments(1000, 0.2, 0, -1, replicates=2, rng=np.random.default_rng(4))
+    estimates = np.array([-2.0, -0.5])
+    original, simulated = expected_revenue_uplift(experiments, np.array([0.1, -0.1]), 'estimated', estimates)
+
+    # simulate_outcomes(df, alpha, elasticity, estimated_elasticity, sim_change)
+    for replicate, (estimate, change) in enumerate(zip(estimates, [0.1, -0.1])):
+        base_budget = experiments.to_frame(replicate)['base_budget'].to_numpy()
+        sim_budget = base_budget * (1 + change)
+        assert original[replicate] == pytest.approx(
+            np.sum(get_conversion_probability(0, estimate, base_budget) * base_budget))
+        assert simulated[replicate] == pytest.approx(
+            np.sum(get_conversion_probability(0, estimate, sim_budget) * sim_budget))
+
+    with pytest.raises(ValueError):
+        expected_revenue_uplift(experiments, np.zeros(2), 'estimated')
+    with pytest.raises(ValueError):
+        expected_revenue_uplift(experiments, np.zeros(2), 'fitted', estimates)
+
+
+def test_power_curve_uplift_under_true_and_estimated():
+    grid = [(20, -5), (-3, -1 / 10)]
+
+    def oracle(experiments):
+        # the notebook's sanity check: iv_est = elasticity
+        beta = np.full(experiments.replicates, float(experiments.beta))
+        return beta, beta, beta
+
+    true = power_curve(grid, n_users=5000, n_sims=10, seed=9, estimator=oracle)
+    estimated = power_curve(grid, n_users=5000, n_sims=10, seed=9, estimator=oracle, uplift_under='estimated')
+    pd.testing.assert_frame_equal(true, estimated)
+
+    wald_true = power_curve(grid, n_users=5000, n_sims=10, seed=9)
+    wald_estimated = power_curve(grid, n_users=5000, n_sims=10, seed=9, uplift_under='estimated')
+    pd.testing.assert_frame_equal(wald_true.drop(columns='mean_uplift'), wald_estimated.drop(columns='mean_uplift'))
+    assert not np.allclose(wald_true['mean_uplift'], wald_estimated['mean_uplift'])
+    with pytest.raises(ValueError):
+        power_curve(grid, n_sims=1, uplift_under='fitted')
+
+
+def test_power_curve_decisions():
+    grid = [(20, -5), (-3, -1 / 10)]
+    result = power_curve(grid, n_users=10000, n_sims=20, seed=5)
+
+    assert list(result['elasticity']) == [-5, -1 / 10]
+    shares = result[['share_lower', 'share_raise', 'share_inconclusive']].sum(axis=1)
+    np.testing.assert_allclose(shares, 1.0)
+    # strongly elastic demand: lower budgets, which raises revenue
+    assert result.loc[0, 'share_lower'] == 1.0
+    assert result.loc[0, 'mean_uplift'] > 0
+    # inelastic demand: raise budgets
+    assert result.loc[1, 'share_raise'] > 0.5
+    assert result.loc[1, 'mean_uplift'] > 0
+
+
+def test_power_curve_is_reproducible_across_executors():
+    grid = [(0, -1), (5, -2), (-2, -1 / 2)]
+    serial = power_curve(grid, n_users=2000, n_sims=12, seed=6)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        pooled = power_curve(grid, n_users=2000, n_sims=12, seed=6, executor=executor)
+    pd.testing.assert_frame_equal(serial, pooled)
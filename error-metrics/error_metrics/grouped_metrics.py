@@ -0,0 +1,194 @@
+# forecast error metrics for many groups at once, from precomputed residual columns
+
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+# Same names and order as calculate_metrics in comparing_queries.ipynb
+METRIC_NAMES = [
+    'MAE', 'weighted MAE', 'MSE', 'weighted MSE', 'MAPE', 'weighted MAPE', 'RMSE',
+    'weighted RMSE', 'std_norm RMSE', 'max_min_norm RMSE', 'ME', 'weighted ME'
+]
+
+DEFAULT_BINS = [-np.inf, 100, np.inf]
+DEFAULT_LABELS = ['<100', '>=100']
+
+_SUM_COLUMNS = ['n', 'w', 'e', 'abs_e', 'sq_e', 'ape', 'w_e', 'w_abs_e', 'w_sq_e', 'w_ape', 'y']
+
+
+def residual_columns(df: DataFrame, actual_column: str, prediction_column: str,
+                     weight_column: str) -> DataFrame:
+    """
+    Per-row terms whose group sums give every metric in METRIC_NAMES.
+
+    The absolute percentage error uses sklearn's convention: |e| / max(|actual|, eps).
+    """
+    actual = df[actual_column].to_numpy(dtype=float)
+    error = actual - df[prediction_column].to_numpy(dtype=float)
+    weight = df[weight_column].to_numpy(dtype=float)
+    abs_error = np.abs(error)
+    ape = abs_error / np.maximum(np.abs(actual), np.finfo(np.float64).eps)
+    return DataFrame({
+        'n': 1.0, 'w': weight, 'e': error, 'abs_e': abs_error, 'sq_e': error**2, 'ape': ape,
+        'w_e': weight * error, 'w_abs_e': weight * abs_error, 'w_sq_e': weight * error**2,
+        'w_ape': weight * ape, 'y': actual
+    }, index=df.index)
+
+
+def _rollup(cells: DataFrame, keys: List[str]) -> DataFrame:
+    """
+      merge cell sums into groups by `keys`; the spread of actuals (m2) is merged with Chan's update
+    """
+    grouped = cells.groupby(keys, sort=True, observed=True)
+    rolled = grouped[_SUM_COLUMNS].sum()
+    rolled['y_max'] = grouped['y_max'].max()
+    rolled['y_min'] = grouped['y_min'].min()
+    cell_mean = cells['y'] / cells['n']
+    group_mean = grouped['y'].transform('sum') / grouped['n'].transform('sum')
+    rolled['m2'] = (cells['m2'] + cells['n'] * (cell_mean - group_mean)**2).groupby(
+        [cells[key] for key in keys], sort=True, observed=True).sum()
+    return rolled
+
+
+def _metrics(sums: DataFrame) -> np.ndarray:
+    """
+      (groups, len(METRIC_NAMES)) metric values from group sums
+    """
+    n, w = sums['n'].to_numpy(), sums['w'].to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mse = sums['sq_e'].to_numpy() / n
+        weighted_mse = sums['w_sq_e'].to_numpy() / w
+        rmse = np.sqrt(mse)
+        return np.column_stack([
+            sums['abs_e'].to_numpy() / n,
+            sums['w_abs_e'].to_numpy() / w,
+            mse,
+            weighted_mse,
+            sums['ape'].to_numpy() / n * 100,
+            sums['w_ape'].to_numpy() / w * 100,
+            rmse,
+            np.sqrt(weighted_mse),
+            rmse / np.sqrt(sums['m2'].to_numpy() / n),
+            rmse / (sums['y_max'].to_numpy() - sums['y_min'].to_numpy()),
+            sums['e'].to_numpy() / n,
+            sums['w_e'].to_numpy() / w
+        ])
+
+
+def grouped_error_metrics(
+    df: DataFrame,
+    prediction_column: str,
+    cutting_column: str = 'cpc_clicks',
+    actual_column: str = 'cpc_clicks',
+    weight_column: str = 'cpc_revenue',
+    group_columns: Sequence[str] = ('reco_source', 'booking_source'),
+    bins: Sequence[float] = DEFAULT_BINS,
+    labels: Sequence[str] = DEFAULT_LABELS
+) -> DataFrame:
+    """
+    Calculates tiered and overall error metrics for a prediction column, for
+    every group and data subset in one pass.
+
+    The rows are reduced once with a groupby to cells of (group, non-zero
+    actual, tier), holding sums of the terms from `residual_columns`, the
+    min/max of the actuals and their sum of squared deviations. The
+    'all_clicks' / 'nonzero_clicks' subsets and the 'Overall' / per-tier
+    splits are rollups of those cells, so no metric function is called per group.
+
+    Args:
+        df (DataFrame): The input DataFrame.
+        prediction_column (str): The column with predicted values.
+        cutting_column (str, optional): The column cut into tiers. Defaults to 'cpc_clicks'.
+        actual_column (str, optional): The column with actual values. Defaults to 'cpc_clicks'.
+        weight_column (str, optional): The weights of the weighted variants.
+                                       Defaults to 'cpc_revenue'.
+        group_columns (Sequence[str], optional): Defaults to ('reco_source', 'booking_source').
+        bins (Sequence[float], optional): Tier edges for `pd.cut` (left-closed).
+                                          Defaults to DEFAULT_BINS.
+        labels (Sequence[str], optional): Tier labels. Defaults to DEFAULT_LABELS.
+
+    Returns:
+        DataFrame: Long format with 'predictor', the group columns, 'data_subset',
+                   'tier', 'metric' and 'value' (rounded to 2 decimals), as
+                   `generate_metrics_df` in comparing_queries.ipynb.
+    """
+    group_columns = list(group_columns)
+    tier_codes = pd.cut(df[cutting_column], bins=bins, labels=labels, right=False).cat.codes.to_numpy()
+
+    terms = residual_columns(df, actual_column, prediction_column, weight_column)
+    keys = group_columns + ['_nonzero', '_tier']
+    terms = terms.assign(_nonzero=df[actual_column].to_numpy() > 0, _tier=tier_codes,
+                         **{col: df[col] for col in group_columns})
+
+    grouped = terms.groupby(keys, sort=True, observed=True)
+    cells = grouped[_SUM_COLUMNS].sum()
+    cells['y_max'] = grouped['y'].max()
+    cells['y_min'] = grouped['y'].min()
+    cells['m2'] = ((terms['y'] - grouped['y'].transform('mean'))**2).groupby(
+        [terms[key] for key in keys], sort=True, observed=True).sum()
+    cells = cells.reset_index()
+
+    parts = []
+    for subset_order, (subset_name, subset_cells) in enumerate([
+        ('all_clicks', cells),
+        ('nonzero_clicks', cells[cells['_nonzero']])
+    ]):
+        if subset_cells.empty:
+            continue
+        overall = _rollup(subset_cells, group_columns).reset_index()
+        overall['tier'] = 'Overall'
+        overall['_tier_order'] = -1
+        tiered = _rollup(subset_cells[subset_cells['_tier'] >= 0], group_columns + ['_tier']).reset_index()
+        tiered['tier'] = np.asarray(labels, dtype=object)[tiered['_tier'].to_numpy()]
+        tiered['_tier_order'] = tiered['_tier']
+        for part in (overall, tiered):
+            part['data_subset'] = subset_name
+            part['_subset_order'] = subset_order
+            parts.append(part)
+
+    output_columns = ['predictor'] + group_columns + ['data_subset', 'tier', 'metric', 'value']
+    if not parts:
+        return DataFrame(columns=output_columns)
+
+    sums = pd.concat(parts, ignore_index=True).sort_values(
+        group_columns + ['_subset_order', '_tier_order'], kind='stable', ignore_index=True
+    )
+    values = _metrics(sums)
+
+    metrics_df = sums[group_columns + ['data_subset', 'tier']].loc[
+        np.repeat(sums.index.to_numpy(), len(METRIC_NAMES))
+    ].reset_index(drop=True)
+    metrics_df.insert(0, 'predictor', prediction_column)
+    metrics_df['metric'] = np.tile(METRIC_NAMES, len(sums))
+    metrics_df['value'] = values.ravel()
+    return metrics_df[output_columns].round(2)
+
+
+def generate_metrics_df(df: DataFrame, prediction_column: str,
+                        cutting_column: str = 'cpc_clicks') -> DataFrame:
+    """
+    Calculates tiered and overall metrics for a given prediction column.
+
+    Drop-in replacement for the notebook function of the same name; see
+    `grouped_error_metrics`.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame.
+        prediction_column (str): The name of the column with predicted values.
+        cutting_column (str): The name of the column with values to be cut
+
+    Returns:
+        pd.DataFrame: A long-format DataFrame with metrics.
+    """
+    return grouped_error_metrics(df, prediction_column, cutting_column)
+
+
+def compare_predictors(df: DataFrame, prediction_columns: Dict[str, str]) -> DataFrame:
+    """
+    Stacks `generate_metrics_df` for several predictors, given as
+    {prediction_column: cutting_column}.
+    """
+    return pd.concat([generate_metrics_df(df, prediction_column, cutting_column)
+                      for prediction_column, cutting_column in prediction_columns.items()])
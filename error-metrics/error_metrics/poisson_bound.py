@@ -0,0 +1,224 @@
+# the forecast error a perfect forecast still makes when clicks are Poisson
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from scipy.stats import poisson
+
+# (lower, upper) exclusive bounds on the actual clicks, as in poisson_lower_bound.ipynb
+DEFAULT_SEGMENTS: Dict[str, Tuple[Optional[float], Optional[float]]] = {
+    'Overall': (None, None),
+    'Under 10': (None, 10),
+    'Under 100': (None, 100),
+    'Over 100': (100, None),
+}
+
+TOTAL = 'All'
+
+_EPS = np.finfo(np.float64).eps
+
+# Memory a chunk of simulated replicates may use
+DEFAULT_MEMORY_BUDGET = 80 * 2**20
+# (chunk, membership rows) arrays alive at once: the gathered draws, the
+# absolute errors, one squared / percentage term and the flat codes
+_LIVE_TEMPORARIES = 4
+
+
+def _memberships(
+    df: DataFrame,
+    actual: np.ndarray,
+    group_column: Optional[str],
+    segments: Dict[str, Tuple[Optional[float], Optional[float]]],
+    include_total: bool
+) -> Tuple[np.ndarray, np.ndarray, DataFrame]:
+    """
+      stack the (row, group x segment) memberships; segments may overlap.
+      returns member rows, their output codes and the output keys
+    """
+    if group_column is None:
+        group_codes, groups = np.zeros(len(df), dtype=np.int64), pd.Index([TOTAL])
+        include_total = False
+    else:
+        group_codes, groups = pd.factorize(df[group_column], sort=True)
+        groups = pd.Index(groups)
+    num_groups = len(groups) + include_total
+
+    rows, codes = [], []
+    for segment_position, (lower, upper) in enumerate(segments.values()):
+        in_segment = np.ones(len(actual), dtype=bool)
+        if lower is not None:
+            in_segment &= actual > lower
+        if upper is not None:
+            in_segment &= actual < upper
+        in_segment &= group_codes >= 0
+        segment_rows = np.flatnonzero(in_segment)
+        rows.append(segment_rows)
+        codes.append(segment_position * num_groups + group_codes[segment_rows])
+        if include_total:
+            rows.append(segment_rows)
+            codes.append(np.full(len(segment_rows), segment_position * num_groups + len(groups)))
+
+    group_labels = list(groups) + ([TOTAL] if include_total else [])
+    keys = DataFrame({
+        group_column or 'group': np.tile(np.asarray(group_labels, dtype=object), len(segments)),
+        'segment': np.repeat(list(segments), num_groups)
+    })
+    return np.concatenate(rows), np.concatenate(codes), keys
+
+
+def expected_poisson_errors(actual: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Per-row expected errors of the forecast `actual` against a realisation
+    Y ~ Poisson(actual).
+
+    - Absolute error: E|Y - lambda| = 2 * lambda * P(Y = floor(lambda)), the
+      closed-form Poisson mean absolute deviation.
+    - Squared error: E(Y - lambda)^2 = lambda.
+    - Absolute percentage error: E|Y - lambda| / max(lambda, eps), 0 when lambda is 0.
+
+    Returns:
+        Dict[str, np.ndarray]: 'abs_error', 'sq_error' and 'ape', one value per row.
+    """
+    actual = np.asarray(actual, dtype=float)
+    abs_error = 2 * actual * poisson.pmf(np.floor(actual), actual)
+    abs_error = np.where(actual > 0, abs_error, 0.0)
+    return {
+        'abs_error': abs_error,
+        'sq_error': actual,
+        'ape': abs_error / np.maximum(np.abs(actual), _EPS)
+    }
+
+
+def poisson_error_floor(
+    df: DataFrame,
+    actual_column: str = 'cpc_clicks',
+    group_column: Optional[str] = 'global_entity_id',
+    segments: Dict[str, Tuple[Optional[float], Optional[float]]] = DEFAULT_SEGMENTS,
+    include_total: bool = True
+) -> DataFrame:
+    """
+    Expected MAE, RMSE and MAPE of a perfect forecast when the realised clicks
+    are Poisson around it, per group and click segment.
+
+    MAE and MAPE are exact expectations (averages of `expected_poisson_errors`).
+    RMSE is the square root of the expected MSE, i.e. sqrt(mean(lambda)); by
+    Jensen's inequality it is an upper bound on E[RMSE] that is tight for
+    segments of more than a handful of rows.
+
+    Args:
+        df (DataFrame): One row per vendor (campaign) with the actual clicks.
+        actual_column (str, optional): Defaults to 'cpc_clicks'.
+        group_column (Optional[str], optional): Groups to report separately,
+                                                e.g. entities. None reports
+                                                only the total. Defaults to
+                                                'global_entity_id'.
+        segments (Dict, optional): Segment name to exclusive (lower, upper)
+                                   bounds on the actual clicks; None is
+                                   unbounded. Defaults to DEFAULT_SEGMENTS.
+        include_total (bool, optional): Add rows for all groups together
+                                        (group 'All'). Defaults to True.
+
+    Returns:
+        DataFrame: One row per non-empty (group, segment) with 'n', 'MAE',
+                   'RMSE' and 'MAPE' (in percent).
+    """
+    actual = df[actual_column].to_numpy(dtype=float)
+    rows, codes, keys = _memberships(df, actual, group_column, segments, include_total)
+    expected = expected_poisson_errors(actual)
+
+    num_outputs = len(keys)
+    n = np.bincount(codes, minlength=num_outputs)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sums = {name: np.bincount(codes, weights=values[rows], minlength=num_outputs) / n
+                for name, values in expected.items()}
+
+    floor = keys.assign(n=n, MAE=sums['abs_error'], RMSE=np.sqrt(sums['sq_error']), MAPE=sums['ape'] * 100)
+    return floor[floor['n'] > 0].reset_index(drop=True)
+
+
+def simulation_chunk_size(num_actual: int, num_rows: int,
+                          memory_budget: int = DEFAULT_MEMORY_BUDGET) -> int:
+    """
+    Replicates per chunk of `simulate_poisson_error_floor` that fit in
+    `memory_budget` bytes (at least one). Each replicate holds one draw per
+    vendor (`num_actual`) and _LIVE_TEMPORARIES 8-byte arrays over the
+    membership rows (`num_rows`, one per vendor and matching segment, again
+    for the total).
+    """
+    bytes_per_replicate = 8 * (num_actual + _LIVE_TEMPORARIES * num_rows)
+    return max(1, memory_budget // max(bytes_per_replicate, 1))
+
+
+def simulate_poisson_error_floor(
+    df: DataFrame,
+    actual_column: str = 'cpc_clicks',
+    group_column: Optional[str] = 'global_entity_id',
+    segments: Dict[str, Tuple[Optional[float], Optional[float]]] = DEFAULT_SEGMENTS,
+    include_total: bool = True,
+    replicates: int = 1000,
+    confidence: float = 0.95,
+    chunk_size: Optional[int] = None,
+    seed: Optional[int] = None,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET
+) -> DataFrame:
+    """
+    Monte-Carlo version of `poisson_error_floor`, with confidence bands.
+
+    Draws `replicates` Poisson realisations of every row, `chunk_size`
+    replicates at a time as a (chunk, rows) matrix. Each chunk's metrics for
+    all groups and segments come from one bincount per error term.
+
+    Args:
+        df, actual_column, group_column, segments, include_total: As for
+            `poisson_error_floor`.
+        replicates (int, optional): Number of realisations. Defaults to 1000.
+        confidence (float, optional): Width of the band between the reported
+                                      quantiles of the replicates. Defaults to 0.95.
+        chunk_size (Optional[int], optional): Replicates per chunk. Defaults to
+                                              `simulation_chunk_size` under
+                                              `memory_budget`.
+        seed (Optional[int], optional): Seed for the draws. Defaults to None.
+        memory_budget (int, optional): Bytes per chunk when `chunk_size` is
+                                       None. Defaults to DEFAULT_MEMORY_BUDGET (80 MB).
+
+    Returns:
+        DataFrame: One row per non-empty (group, segment) with 'n' and, for each
+                   of MAE, RMSE and MAPE, the mean over replicates and the band
+                   (e.g. 'MAE', 'MAE_lower', 'MAE_upper').
+    """
+    actual = df[actual_column].to_numpy(dtype=float)
+    rows, codes, keys = _memberships(df, actual, group_column, segments, include_total)
+    num_outputs = len(keys)
+    n = np.bincount(codes, minlength=num_outputs)
+
+    if chunk_size is None:
+        chunk_size = simulation_chunk_size(len(actual), len(rows), memory_budget)
+    rng = np.random.default_rng(seed)
+    denominator = np.maximum(np.abs(actual[rows]), _EPS)
+
+    metrics: Dict[str, List[np.ndarray]] = {'MAE': [], 'RMSE': [], 'MAPE': []}
+    for start in range(0, replicates, chunk_size):
+        size = min(chunk_size, replicates - start)
+        realised = rng.poisson(actual, size=(size, len(actual)))[:, rows]
+        abs_error = np.abs(actual[rows] - realised)
+        flat_codes = (codes[None, :] + num_outputs * np.arange(size)[:, None]).ravel()
+
+        def per_output(weights: np.ndarray) -> np.ndarray:
+            return np.bincount(flat_codes, weights=weights.ravel(),
+                               minlength=size * num_outputs).reshape(size, num_outputs)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            metrics['MAE'].append(per_output(abs_error) / n)
+            metrics['RMSE'].append(np.sqrt(per_output(abs_error**2) / n))
+            metrics['MAPE'].append(per_output(abs_error / denominator) / n * 100)
+
+    tail = (1 - confidence) / 2
+    summary = keys.assign(n=n)
+    for name, chunks in metrics.items():
+        values = np.concatenate(chunks)
+        summary[name] = values.mean(axis=0)
+        summary[f"{name}_lower"] = np.quantile(values, tail, axis=0)
+        summary[f"{name}_upper"] = np.quantile(values, 1 - tail, axis=0)
+    return summary[summary['n'] > 0].reset_index(drop=True)
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.metrics import mean_absolute_error, mean_absolute_percentage_error, mean_squared_error
+
+from .grouped_metrics import METRIC_NAMES, compare_predictors, generate_metrics_df, grouped_error_metrics
+
+
+def _calculate_metrics(actual, predicted, weights):
+    """calculate_metrics from comparing_queries.ipynb."""
+    with np.errstate(divide='ignore'):
+        return _sklearn_metrics(actual, predicted, weights)
+
+
+def _sklearn_metrics(actual, predicted, weights):
+    return {
+        'MAE': mean_absolute_error(actual, predicted),
+        'weighted MAE': mean_absolute_error(actual, predicted, sample_weight=weights),
+        'MSE': mean_squared_error(actual, predicted),
+        'weighted MSE': mean_squared_error(actual, predicted, sample_weight=weights),
+        'MAPE': mean_absolute_percentage_error(actual, predicted) * 100,
+        'weighted MAPE': mean_absolute_percentage_error(actual, predicted, sample_weight=weights) * 100,
+        'RMSE': np.sqrt(mean_squared_error(actual, predicted)),
+        'weighted RMSE': np.sqrt(mean_squared_error(actual, predicted, sample_weight=weights)),
+        'std_norm RMSE': np.sqrt(mean_squared_error(actual, predicted)) / np.std(actual),
+        'max_min_norm RMSE': np.sqrt(mean_squared_error(actual, predicted)) / (max(actual) - min(actual)),
+        'ME': np.mean(actual - predicted),
+        'weighted ME': np.average(actual - predicted, weights=weights)
+    }
+
+
+def _generate_metrics_df(df, prediction_column, cutting_column='cpc_clicks'):
+    """The per-group loop from comparing_queries.ipynb."""
+    results_list = []
+    for (reco_source, booking_source), group_df in df.groupby(['reco_source', 'booking_source']):
+        for subset_name, data_subset in [('all_clicks', group_df),
+                                         ('nonzero_clicks', group_df[group_df['cpc_clicks'] > 0])]:
+            if data_subset.empty:
+                continue
+            data_subset = data_subset.copy()
+            data_subset['tier'] = pd.cut(data_subset[cutting_column], bins=[-np.inf, 100, np.inf],
+                                         labels=['<100', '>=100'], right=False)
+            tiers = [('Overall', data_subset)] + list(data_subset.groupby('tier', observed=True))
+            for tier_name, tier_df in tiers:
+                metrics = _calculate_metrics(tier_df['cpc_clicks'].values, tier_df[prediction_column].values,
+                                             tier_df['cpc_revenue'].values)
+                for metric_name, value in metrics.items():
+                    results_list.append({
+                        'predictor': prediction_column, 'reco_source': reco_source,
+                        'booking_source': booking_source, 'data_subset': subset_name,
+                        'tier': tier_name, 'metric': metric_name, 'value': value
+                    })
+    return pd.DataFrame(results_list).round(2)
+
+
+@pytest.fixture
+def forecasts():
+    rng = np.random.default_rng(17)
+    n = 3000
+    clicks = rng.poisson(rng.lognormal(3.5, 1.2, n)).astype(float)
+    clicks[rng.random(n) < 0.15] = 0
+    return pd.DataFrame({
+        'reco_source': rng.choice(['CEB', 'ML'], n),
+        'booking_source': rng.choice(['agent', 'vendor', 'self'], n),
+        'cpc_clicks': clicks,
+        'cpc_revenue': rng.gamma(2.0, 20.0, n),
+        'adj_e_clicks': clicks * rng.lognormal(0, 0.3, n),
+        'poisson_clicks': rng.poisson(clicks + 1).astype(float),
+    })
+
+
+@pytest.mark.parametrize('prediction_column, cutting_column', [
+    ('adj_e_clicks', 'adj_e_clicks'), ('poisson_clicks', 'cpc_clicks')
+])
+def test_matches_per_group_sklearn_loop(forecasts, prediction_column, cutting_column):
+    expected = _generate_metrics_df(forecasts, prediction_column, cutting_column)
+    result = generate_metrics_df(forecasts, prediction_column, cutting_column)
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_missing_groups_and_tiers_are_skipped(forecasts):
+    small = forecasts[forecasts['cpc_clicks'] < 100].copy()
+    small.loc[small['reco_source'] == 'ML', 'cpc_clicks'] = 0
+
+    result = grouped_error_metrics(small, 'poisson_clicks')
+
+    assert set(result['tier']) == {'Overall', '<100'}
+    ml = result[result['reco_source'] == 'ML']
+    assert set(ml['data_subset']) == {'all_clicks'}
+    pd.testing.assert_frame_equal(result, _generate_metrics_df(small, 'poisson_clicks'), check_dtype=False)
+
+
+def test_compare_predictors_stacks_long_tables(forecasts):
+    result = compare_predictors(forecasts, {'adj_e_clicks': 'adj_e_clicks', 'poisson_clicks': 'poisson_clicks'})
+
+    assert set(result['predictor']) == {'adj_e_clicks', 'poisson_clicks'}
+    assert result.groupby(['predictor', 'reco_source', 'booking_source', 'data_subset', 'tier']).size().eq(
+        len(METRIC_NAMES)).all()
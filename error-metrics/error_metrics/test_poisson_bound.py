@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import poisson
+from sklearn.metrics import mean_absolute_error, mean_absolute_percentage_error, root_mean_squared_error
+
+from .poisson_bound import (DEFAULT_SEGMENTS, _memberships, expected_poisson_errors, poisson_error_floor,
+                            simulate_poisson_error_floor, simulation_chunk_size)
+
+
+@pytest.fixture
+def clicks_df():
+    rng = np.random.default_rng(18)
+    n = 1500
+    clicks = np.round(rng.lognormal(2.5, 1.5, n))
+    clicks[rng.random(n) < 0.05] = 0
+    return pd.DataFrame({'global_entity_id': rng.choice(['TB_AE', 'TB_KW', 'PY_AR'], n), 'cpc_clicks': clicks})
+
+
+@pytest.mark.parametrize('lam', [0.0, 0.3, 1.0, 4.5, 37.0, 402.0])
+def test_expected_errors_match_numerical_sums(lam):
+    support = np.arange(0, int(lam + 50 * np.sqrt(lam + 1)) + 50)
+    pmf = poisson.pmf(support, lam)
+    expected = expected_poisson_errors(np.array([lam]))
+
+    assert expected['abs_error'][0] == pytest.approx(np.sum(pmf * np.abs(support - lam)), rel=1e-10, abs=1e-12)
+    assert expected['sq_error'][0] == pytest.approx(np.sum(pmf * (support - lam)**2), abs=1e-9)
+
+
+def test_floor_is_close_to_simulation(clicks_df):
+    floor = poisson_error_floor(clicks_df)
+    simulated = simulate_poisson_error_floor(clicks_df, replicates=400, seed=0)
+
+    pd.testing.assert_frame_equal(floor[['global_entity_id', 'segment', 'n']],
+                                  simulated[['global_entity_id', 'segment', 'n']])
+    for metric in ['MAE', 'RMSE', 'MAPE']:
+        assert (floor[metric] >= simulated[f"{metric}_lower"] * 0.98).all()
+        assert (floor[metric] <= simulated[f"{metric}_upper"] * 1.02).all()
+        np.testing.assert_allclose(floor[metric], simulated[metric], rtol=0.02)
+
+
+def test_simulation_matches_sklearn_on_same_draws(clicks_df):
+    replicates = 5
+    simulated = simulate_poisson_error_floor(clicks_df, group_column=None, replicates=replicates,
+                                             chunk_size=replicates, seed=3, confidence=1.0)
+
+    actual = clicks_df['cpc_clicks'].to_numpy()
+    draws = np.random.default_rng(3).poisson(actual, size=(replicates, len(actual)))
+    overall = simulated.set_index('segment').loc['Overall']
+    mapes = [mean_absolute_percentage_error(actual, draw) * 100 for draw in draws]
+    assert overall['MAPE'] == pytest.approx(np.mean(mapes))
+    assert overall['MAPE_lower'] == pytest.approx(min(mapes))
+    assert overall['MAE'] == pytest.approx(np.mean([mean_absolute_error(actual, draw) for draw in draws]))
+    assert overall['RMSE'] == pytest.approx(np.mean([root_mean_squared_error(actual, draw) for draw in draws]))
+
+    under_10 = actual < 10
+    mae_under_10 = np.mean([mean_absolute_error(actual[under_10], draw[under_10]) for draw in draws])
+    assert simulated.set_index('segment').loc['Under 10', 'MAE'] == pytest.approx(mae_under_10)
+
+
+def test_groups_segments_and_total(clicks_df):
+    floor = poisson_error_floor(clicks_df)
+
+    assert set(floor['global_entity_id']) == {'PY_AR', 'TB_AE', 'TB_KW', 'All'}
+    totals = floor[floor['global_entity_id'] == 'All'].set_index('segment')['n']
+    assert totals['Overall'] == len(clicks_df)
+    assert totals['Over 100'] == (clicks_df['cpc_clicks'] > 100).sum()
+    per_entity = floor[floor['global_entity_id'] != 'All'].groupby('segment')['n'].sum()
+    pd.testing.assert_series_equal(per_entity.sort_index(), totals.sort_index(), check_names=False)
+
+
+def test_chunk_size_counts_membership_rows(clicks_df):
+    actual = clicks_df['cpc_clicks'].to_numpy(dtype=float)
+    rows, _, _ = _memberships(clicks_df, actual, 'global_entity_id', DEFAULT_SEGMENTS, True)
+    # every row is in 'Overall' and one or two click segments, per entity and again in the total
+    assert len(rows) > 4 * len(actual)
+
+    # 8 bytes x (1 draw per vendor + 4 temporaries per membership row)
+    assert simulation_chunk_size(1_000, 5_000) == 80 * 2**20 // (8 * 21_000)
+    assert simulation_chunk_size(1_000, 5_000, memory_budget=8 * 21_000 * 3) == 3
+    assert simulation_chunk_size(10**8, 5 * 10**8) == 1
+
+    budget = 8 * (len(actual) + 4 * len(rows)) * 7
+    sized = simulate_poisson_error_floor(clicks_df, replicates=20, seed=1, memory_budget=budget)
+    explicit = simulate_poisson_error_floor(clicks_df, replicates=20, seed=1, chunk_size=7)
+    pd.testing.assert_frame_equal(sized, explicit)
@@ -1,44 +1,44 @@
 # coding: utf-8
-import pandas_gbq
-import pandas as pd
+from typing import Callable, Optional, Sequence
 
+from pandas import DataFrame
 
-def main():
+from reco_ladder import (MARKETS, compare_reco_nums, ladder_steps, load_reco_tables,
+                         summarise_ladders, summarise_steps)
+
+
+def main(markets: Sequence[str] = MARKETS, reader: Optional[Callable[..., DataFrame]] = None):
     """
-    Gets PEYA recommendations from July
+    Gets the budget recommendations of each market
 
-    Take top two budget recommendations
+    Take top two budget recommendations, for each market
         - looks to see if there is ever not an increasing net revenue with budget
           increase (which suffests we're moving beyond profit optimal)
 
-    """
-    query = """
-        SELECT * 
-        FROM dhh-ncr-stg.performance_estimation.PEYA_cpc_budget_recos
-    """
+    Then checks every step of every ladder (all reco_num levels, all reco dates)
+    the same way
 
-    df = pandas_gbq.read_gbq(query)
-    df['net_revenue'] = df['e_cpc_gmv'] - df['reco_budget_lc']
-
-    cols = ['global_entity_id', 'vendor_id', 'e_cpc_gmv', 'reco_budget_lc',
-            'e_roas', 'net_revenue', 'reco_date']
-    df_1 = df.loc[df.reco_num == 2]
-    df_2 = df.loc[df.reco_num == 3]
-    tmp = pd.merge(df_1[cols], df_2[cols], how='inner', on=['global_entity_id', 'vendor_id', 'reco_date'], suffixes=['_1', '_2'])
-    
-    tmp['lower_nr_1'] = tmp.net_revenue_1 < tmp.net_revenue_2
-    tmp['lower_gmv_1'] = tmp.e_cpc_gmv_1 < tmp.e_cpc_gmv_2
-    tmp['lower_budget_1'] = tmp.reco_budget_lc_1 < tmp.reco_budget_lc_2
-    tmp['lower_roas_1'] = tmp.e_roas_1 < tmp.e_roas_2
-
-    print(f"""The share of vendors that have a lower budget for reco 1:
-          {tmp.lower_budget_1.mean():.2f}""")
-    print(f"""The share of vendors that have a lower NR for reco 1:
-          {tmp.lower_nr_1.mean():.2f}""")
-    print(f"""The share of vendors that have a lower GMV for reco 1:
-          {tmp.lower_gmv_1.mean():.2f}""")
-    print(f"""The share of vendors that have a lower ROAS for reco 1:
-          {tmp.lower_roas_1.mean():.2f}""")
+    `reader` is passed to `load_reco_tables` (defaults to BigQuery)
+    """
+    df = load_reco_tables(markets, reader=reader)
+
+    for market in markets:
+        shares = compare_reco_nums(df[df.market == market], low=2, high=3)
+        print(f"{market} ({shares['n_ladders']} ladders with both reco_nums):")
+        print(f"""The share of vendors that have a lower budget for reco 1:
+          {shares['lower_budget']:.2f}""")
+        print(f"""The share of vendors that have a lower NR for reco 1:
+          {shares['lower_nr']:.2f}""")
+        print(f"""The share of vendors that have a lower GMV for reco 1:
+          {shares['lower_gmv']:.2f}""")
+        print(f"""The share of vendors that have a lower ROAS for reco 1:
+          {shares['lower_roas']:.2f}""")
+
+    steps = ladder_steps(df, ladder_keys=['market', 'global_entity_id', 'vendor_id', 'reco_date'])
+    print("Share of ladder steps with each flag, by market and rung:")
+    print(summarise_steps(steps))
+    print("Share of ladders with at least one flagged step, by market:")
+    print(summarise_ladders(steps))
 
 
 if __name__=="__main__":
@@ -0,0 +1,214 @@
+# coding: utf-8
+# step-by-step checks of every budget recommendation ladder, from one sort
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+BQ_PROJECT_ID = "dhh-ncr-stg"
+RECO_TABLE_TEMPLATE = "dhh-ncr-stg.performance_estimation.{market}_cpc_budget_recos"
+MARKETS = ['PEYA']
+
+LADDER_KEYS = ['global_entity_id', 'vendor_id', 'reco_date']
+VALUE_COLUMNS = ['reco_budget_lc', 'e_cpc_gmv', 'e_roas']
+
+# Only the columns the ladder analysis needs are read
+RECO_QUERY = """
+    SELECT {columns}
+    FROM `{table}`
+"""
+
+STEP_FLAGS = ['net_revenue_decreasing', 'gmv_decreasing', 'roas_increasing', 'non_concave', 'flat_budget']
+
+
+def load_reco_tables(
+    markets: Sequence[str] = MARKETS,
+    project_id: str = BQ_PROJECT_ID,
+    reader: Optional[Callable[..., DataFrame]] = None,
+    max_workers: int = 4
+) -> DataFrame:
+    """
+    Reads the ladder columns of every market's reco table and stacks them
+    with a 'market' column.
+
+    Args:
+        markets (Sequence[str], optional): Table prefixes, e.g. 'PEYA'. Defaults to MARKETS.
+        project_id (str, optional): Defaults to BQ_PROJECT_ID.
+        reader (Optional[Callable[..., DataFrame]], optional): Called as
+                    `reader(sql_query, project_id=project_id)`. Defaults to
+                    `pandas_gbq.read_gbq`; pass a local stand-in to run without BigQuery.
+        max_workers (int, optional): Tables read at once. Defaults to 4.
+    """
+    if reader is None:
+        import pandas_gbq
+        reader = pandas_gbq.read_gbq
+    columns = ", ".join(LADDER_KEYS + ['reco_num'] + VALUE_COLUMNS)
+
+    def read(market: str) -> DataFrame:
+        query = RECO_QUERY.format(columns=columns, table=RECO_TABLE_TEMPLATE.format(market=market))
+        return reader(query, project_id=project_id).assign(market=market)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        tables = list(executor.map(read, markets))
+    return pd.concat(tables, ignore_index=True)
+
+
+def _sorted_ladders(df: DataFrame, ladder_keys: Sequence[str]) -> DataFrame:
+    """
+      rows ordered by ladder, then budget (ties by reco_num), with 'ladder_key' and 'rung'
+    """
+    ladder_key = df.groupby(list(ladder_keys), sort=False, observed=True).ngroup().to_numpy()
+    budget = df['reco_budget_lc'].to_numpy(dtype=float)
+    order = np.lexsort((df['reco_num'].to_numpy(), budget, ladder_key))
+    ladders = df.iloc[order].reset_index(drop=True)
+    ladders['ladder_key'] = ladder_key[order]
+    starts = np.r_[True, ladders['ladder_key'].to_numpy()[1:] != ladders['ladder_key'].to_numpy()[:-1]]
+    start_positions = np.flatnonzero(starts)
+    ladders['rung'] = np.arange(len(ladders)) - np.repeat(start_positions, np.diff(np.r_[start_positions, len(ladders)]))
+    return ladders
+
+
+def ladder_steps(df: DataFrame, ladder_keys: Sequence[str] = LADDER_KEYS) -> DataFrame:
+    """
+    Every step up every recommendation ladder, i.e. between budget-adjacent
+    recommendations of the same (entity, vendor, reco date).
+
+    Rows are sorted once by ladder and budget, and each step is the difference
+    of a row and the one before it, so all rungs of all ladders (and markets)
+    are compared without merging reco_num pairs. Flags per step:
+
+    - 'net_revenue_decreasing': the extra budget loses net revenue
+      (e_cpc_gmv - reco_budget_lc), i.e. the step is past the profit optimum.
+    - 'gmv_decreasing': more budget, less expected GMV.
+    - 'roas_increasing': ROAS rises with budget, against diminishing returns.
+    - 'non_concave': the marginal GMV per unit of budget is higher than on
+      the step below (from the second step on).
+    - 'flat_budget': the two recommendations have the same budget.
+
+    Args:
+        df (DataFrame): Reco rows with the ladder keys, 'reco_num',
+                        'reco_budget_lc', 'e_cpc_gmv' and 'e_roas' (e.g.
+                        from `load_reco_tables`, with 'market').
+        ladder_keys (Sequence[str], optional): Columns identifying a ladder.
+                                               Defaults to LADDER_KEYS; add
+                                               'market' when stacking markets
+                                               whose keys may overlap.
+
+    Returns:
+        DataFrame: One row per step with the ladder keys (and 'market' if
+                   present), 'ladder_key', 'rung' (of the upper
+                   recommendation, 1 = second lowest budget), 'reco_num_from',
+                   'reco_num_to', 'budget_from', 'budget_to', the differences
+                   'd_budget', 'd_gmv', 'd_net_revenue', 'd_roas',
+                   'marginal_gmv' and the flags.
+    """
+    ladders = _sorted_ladders(df, ladder_keys)
+    budget = ladders['reco_budget_lc'].to_numpy(dtype=float)
+    gmv = ladders['e_cpc_gmv'].to_numpy(dtype=float)
+    roas = ladders['e_roas'].to_numpy(dtype=float)
+    net_revenue = gmv - budget
+    reco_num = ladders['reco_num'].to_numpy()
+
+    # positions of the upper rung of every step, and of the rung below it
+    upper = np.flatnonzero(ladders['rung'].to_numpy() > 0)
+    lower = upper - 1
+
+    d_budget = budget[upper] - budget[lower]
+    d_gmv = gmv[upper] - gmv[lower]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        marginal_gmv = np.where(d_budget > 0, d_gmv / d_budget, np.nan)
+
+    # the step below is the previous step when both belong to the same ladder
+    rung = ladders['rung'].to_numpy()[upper]
+    previous_marginal = np.r_[np.nan, marginal_gmv[:-1]]
+    previous_marginal[rung == 1] = np.nan
+
+    key_columns = [col for col in list(ladder_keys) + ['market'] if col in ladders.columns]
+    key_columns = list(dict.fromkeys(key_columns))
+    steps = ladders.loc[upper, key_columns + ['ladder_key', 'rung']].reset_index(drop=True)
+    steps['reco_num_from'] = reco_num[lower]
+    steps['reco_num_to'] = reco_num[upper]
+    steps['budget_from'] = budget[lower]
+    steps['budget_to'] = budget[upper]
+    steps['d_budget'] = d_budget
+    steps['d_gmv'] = d_gmv
+    steps['d_net_revenue'] = net_revenue[upper] - net_revenue[lower]
+    steps['d_roas'] = roas[upper] - roas[lower]
+    steps['marginal_gmv'] = marginal_gmv
+    steps['net_revenue_decreasing'] = steps['d_net_revenue'].to_numpy() < 0
+    steps['gmv_decreasing'] = d_gmv < 0
+    steps['roas_increasing'] = steps['d_roas'].to_numpy() > 0
+    steps['non_concave'] = marginal_gmv > previous_marginal
+    steps['flat_budget'] = d_budget == 0
+    return steps
+
+
+def summarise_steps(steps: DataFrame, by: Sequence[str] = ('market', 'rung')) -> DataFrame:
+    """
+    Share of steps with each flag, and number of steps, by `by` (columns of
+    `steps` that are missing are ignored).
+    """
+    by = [col for col in by if col in steps.columns]
+    if not by:
+        return steps[STEP_FLAGS].mean().to_frame().T.assign(n_steps=len(steps))
+    summary = steps.groupby(by, sort=True, observed=True)[STEP_FLAGS].mean()
+    summary['n_steps'] = steps.groupby(by, sort=True, observed=True).size()
+    return summary.reset_index()
+
+
+def summarise_ladders(steps: DataFrame, by: Sequence[str] = ('market',)) -> DataFrame:
+    """
+    Share of ladders with at least one flagged step, and number of ladders, by `by`.
+    """
+    by = [col for col in by if col in steps.columns]
+    per_ladder = steps.groupby('ladder_key', sort=False)[STEP_FLAGS].any()
+    if by:
+        per_ladder = per_ladder.join(steps.groupby('ladder_key', sort=False)[by].first())
+        summary = per_ladder.groupby(by, sort=True, observed=True)[STEP_FLAGS].mean()
+        summary['n_ladders'] = per_ladder.groupby(by, sort=True, observed=True).size()
+        return summary.reset_index()
+    return per_ladder[STEP_FLAGS].mean().to_frame().T.assign(n_ladders=len(per_ladder))
+
+
+def compare_reco_nums(df: DataFrame, low: int = 2, high: int = 3,
+                      ladder_keys: Sequence[str] = LADDER_KEYS) -> Dict[str, float]:
+    """
+    The comparison of higher_budget_lower_revenue.py for any two reco_num
+    values: over ladders with both, the share where the `low` recommendation
+    has a lower budget, net revenue, GMV and ROAS than the `high` one.
+
+    Each ladder's values are scattered into arrays indexed by ladder, so no
+    merge is needed. If a ladder has a reco_num more than once, its last row is used.
+    """
+    ladder_key = df.groupby(list(ladder_keys), sort=False, observed=True).ngroup().to_numpy()
+    num_ladders = ladder_key.max() + 1 if len(ladder_key) else 0
+    reco_num = df['reco_num'].to_numpy()
+    values = {
+        'budget': df['reco_budget_lc'].to_numpy(dtype=float),
+        'nr': df['e_cpc_gmv'].to_numpy(dtype=float) - df['reco_budget_lc'].to_numpy(dtype=float),
+        'gmv': df['e_cpc_gmv'].to_numpy(dtype=float),
+        'roas': df['e_roas'].to_numpy(dtype=float),
+    }
+
+    def by_ladder(num: int, column: np.ndarray) -> np.ndarray:
+        scattered = np.full(num_ladders, np.nan)
+        rows = reco_num == num
+        scattered[ladder_key[rows]] = column[rows]
+        return scattered
+
+    has_both = np.zeros(num_ladders, dtype=bool)
+    has_both[ladder_key[reco_num == low]] = True
+    has_high = np.zeros(num_ladders, dtype=bool)
+    has_high[ladder_key[reco_num == high]] = True
+    has_both &= has_high
+
+    shares = {}
+    for name, column in values.items():
+        lower_values = by_ladder(low, column)[has_both]
+        higher_values = by_ladder(high, column)[has_both]
+        shares[f'lower_{name}'] = float(np.mean(lower_values < higher_values)) if has_both.any() else np.nan
+    shares['n_ladders'] = int(has_both.sum())
+    return shares
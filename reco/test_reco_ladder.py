@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from higher_budget_lower_revenue import main
+from reco_ladder import (compare_reco_nums, ladder_steps, load_reco_tables, summarise_ladders,
+                         summarise_steps)
+
+
+def reco_rows(n_vendors=300, n_dates=3, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for vendor in range(n_vendors):
+        for date in pd.date_range('2025-07-01', periods=n_dates):
+            budgets = np.sort(rng.choice(np.arange(10, 200, 5), size=rng.integers(2, 6), replace=False))
+            gmv = 400 * budgets**2 / (60**2 + budgets**2) + rng.normal(0, 5, size=len(budgets))
+            for reco_num, i in enumerate(rng.permutation(len(budgets)), start=1):
+                rows.append({'global_entity_id': 'PY_AR', 'vendor_id': f'v{vendor}', 'reco_date': date,
+                             'reco_num': reco_num, 'reco_budget_lc': budgets[i], 'e_cpc_gmv': gmv[i],
+                             'e_roas': gmv[i] / budgets[i]})
+    return pd.DataFrame(rows).sample(frac=1, random_state=1).reset_index(drop=True)
+
+
+def original_script_shares(df):
+    # higher_budget_lower_revenue.py before the ladder analysis
+    df = df.copy()
+    df['net_revenue'] = df['e_cpc_gmv'] - df['reco_budget_lc']
+    df['ladder_key'] = df.groupby(['global_entity_id', 'vendor_id', 'reco_date'], sort=False, observed=True).ngroup()
+    cols = ['ladder_key', 'e_cpc_gmv', 'reco_budget_lc', 'e_roas', 'net_revenue']
+    tmp = pd.merge(df.loc[df.reco_num == 2, cols], df.loc[df.reco_num == 3, cols],
+                   how='inner', on='ladder_key', suffixes=['_1', '_2'])
+    return {
+        'lower_budget': (tmp.reco_budget_lc_1 < tmp.reco_budget_lc_2).mean(),
+        'lower_nr': (tmp.net_revenue_1 < tmp.net_revenue_2).mean(),
+        'lower_gmv': (tmp.e_cpc_gmv_1 < tmp.e_cpc_gmv_2).mean(),
+        'lower_roas': (tmp.e_roas_1 < tmp.e_roas_2).mean(),
+        'n_ladders': len(tmp),
+    }
+
+
+def reference_steps(df):
+    steps = []
+    for _, ladder in df.groupby(['global_entity_id', 'vendor_id', 'reco_date']):
+        ladder = ladder.sort_values(['reco_budget_lc', 'reco_num'])
+        nr = (ladder['e_cpc_gmv'] - ladder['reco_budget_lc']).to_numpy()
+        budget, gmv, roas = (ladder[col].to_numpy() for col in ['reco_budget_lc', 'e_cpc_gmv', 'e_roas'])
+        previous_marginal = np.nan
+        for i in range(1, len(ladder)):
+            marginal = (gmv[i] - gmv[i - 1]) / (budget[i] - budget[i - 1]) if budget[i] > budget[i - 1] else np.nan
+            steps.append({'vendor_id': ladder['vendor_id'].iloc[0], 'reco_date': ladder['reco_date'].iloc[0],
+                          'rung': i, 'd_net_revenue': nr[i] - nr[i - 1], 'd_roas': roas[i] - roas[i - 1],
+                          'non_concave': marginal > previous_marginal})
+            previous_marginal = marginal
+    return pd.DataFrame(steps)
+
+
+def test_compare_reco_nums_matches_merge():
+    df = reco_rows()
+    shares = compare_reco_nums(df)
+    expected = original_script_shares(df)
+    for name, value in expected.items():
+        assert shares[name] == pytest.approx(value), name
+
+
+def test_steps_match_per_ladder_loop():
+    df = reco_rows(n_vendors=60)
+    steps = ladder_steps(df)
+    expected = reference_steps(df)
+
+    assert len(steps) == len(df) - df.groupby(['vendor_id', 'reco_date']).ngroups
+    merged = steps.merge(expected, on=['vendor_id', 'reco_date', 'rung'], suffixes=('', '_expected'))
+    assert len(merged) == len(steps)
+    np.testing.assert_allclose(merged['d_net_revenue'], merged['d_net_revenue_expected'])
+    np.testing.assert_allclose(merged['d_roas'], merged['d_roas_expected'])
+    np.testing.assert_array_equal(merged['non_concave'], merged['non_concave_expected'])
+    assert (steps['d_budget'] >= 0).all()
+
+
+def test_flags_on_a_known_ladder():
+    df = pd.DataFrame({
+        'global_entity_id': 'PY_AR', 'vendor_id': 'v1', 'reco_date': pd.Timestamp('2025-07-01'),
+        'reco_num': [3, 1, 2, 4],
+        'reco_budget_lc': [10.0, 20.0, 30.0, 30.0],
+        'e_cpc_gmv': [50.0, 70.0, 95.0, 90.0],
+        'e_roas': [5.0, 3.5, 95 / 30, 3.0],
+    })
+    steps = ladder_steps(df)
+
+    assert list(steps['reco_num_from']) == [3, 1, 2]
+    assert list(steps['reco_num_to']) == [1, 2, 4]
+    # net revenue 40 -> 50 -> 65 -> 60
+    assert list(steps['net_revenue_decreasing']) == [False, False, True]
+    assert list(steps['gmv_decreasing']) == [False, False, True]
+    # marginal gmv 2.0 -> 2.5 (rising) -> undefined
+    assert list(steps['non_concave']) == [False, True, False]
+    assert list(steps['flat_budget']) == [False, False, True]
+
+
+def test_markets_are_stacked_and_summarised():
+    queries = []
+
+    def reader(sql_query, project_id):
+        queries.append(sql_query)
+        return reco_rows(n_vendors=20, seed=len(queries))
+
+    df = load_reco_tables(['PEYA', 'TALABAT'], reader=reader, max_workers=2)
+    assert sorted(df['market'].unique()) == ['PEYA', 'TALABAT']
+    assert all('SELECT *' not in query and 'reco_budget_lc' in query for query in queries)
+    assert any('PEYA_cpc_budget_recos' in query for query in queries)
+
+    steps = ladder_steps(df, ladder_keys=['market', 'global_entity_id', 'vendor_id', 'reco_date'])
+    by_rung = summarise_steps(steps)
+    assert set(by_rung['market']) == {'PEYA', 'TALABAT'}
+    assert by_rung['n_steps'].sum() == len(steps)
+
+    by_market = summarise_ladders(steps)
+    assert list(by_market['market']) == ['PEYA', 'TALABAT']
+    assert by_market['n_ladders'].sum() == steps['ladder_key'].nunique()
+    assert ((by_market['net_revenue_decreasing'] >= 0) & (by_market['net_revenue_decreasing'] <= 1)).all()
+
+
+def test_main_reports_reco_nums_for_every_market(capsys):
+    tables = {'PEYA': reco_rows(n_vendors=20, seed=1), 'TALABAT': reco_rows(n_vendors=30, seed=2)}
+
+    def reader(sql_query, project_id):
+        return next(df for market, df in tables.items() if f'{market}_cpc_budget_recos' in sql_query)
+
+    main(['PEYA', 'TALABAT'], reader=reader)
+    out = capsys.readouterr().out
+
+    for market, df in tables.items():
+        assert f"{market} ({compare_reco_nums(df)['n_ladders']} ladders" in out
+    assert out.count("lower budget for reco 1") == 2